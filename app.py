@@ -9,15 +9,27 @@ import datetime
 import uuid
 import json
 import threading
+import collections
 from threading import Thread
-from keras.models import load_model
-from keras.models import model_from_json
 import numpy as np
 
+import dataset
+import recognizers
+import segmentation
+import capture
+import metadata
+import calibration
+import plot
+import monitor
+import decoder
+import embedding
+import ensemble
+
 
 # class that listens to Myo Armband events
 class Listener(myo.DeviceListener):
 
+    device = None
     device_name = None
     battery = None
 
@@ -25,7 +37,9 @@ class Listener(myo.DeviceListener):
         super().__init__()
         self.manager = m
         self.emg = []
-        self.data = {}
+        # emg and imu events, written as float32 rows without allocating objects
+        self.emg_stream = capture.EmgStream()
+        self.imu_stream = capture.ImuStream()
 
 
     # connection event
@@ -34,26 +48,33 @@ class Listener(myo.DeviceListener):
         self.manager.connected = True
         event.device.stream_emg(True)
         event.device.request_battery_level()
+        self.device = event.device
         self.device_name = event.device_name
 
 
     # disconnection event
     def on_disconnected(self, event:Event):
         self.manager.connected = False
+        self.device = None
+
+
+    # asks the device for its battery level, which comes with a battery level event
+    # it is called periodically by the monitor, so the level follows the discharge of the battery
+    def requestBattery(self):
+        device = self.device
+        if device is not None and self.manager.connected:
+            device.request_battery_level()
 
 
     # emg signal event
     def on_emg(self, event:Event):
         self.emg = event.emg
+        self.emg_stream.write(event)
 
 
     # imu signal event
     def on_orientation(self, event:Event):
-        self.data = {
-            "gyroscope": [event.gyroscope.x, event.gyroscope.y, event.gyroscope.z], 
-            "acceleration": [event.acceleration.x, event.acceleration.y, event.acceleration.z], 
-            "orientation": [event.orientation.x, event.orientation.y, event.orientation.z, event.orientation.w]
-        }
+        self.imu_stream.write(event)
 
 
     # battery level event
@@ -74,12 +95,37 @@ class MainFrame(wx.Frame):
     connected = False
     connecting = False
     stop = False
+    profile = None # calibration profile of the current user, applied in the Prediction panel
 
     def __init__(self):
         wx.Frame.__init__(self, parent=None)
         
         self.create_working_directory()
 
+        # buffers of the acquisitions, recycled by the Acquisition and Prediction panels
+        # in auto mode a recording can be up to twice the window, which is then centred on the gesture
+        self.capture_pool = capture.CapturePool(rows=2 * int(Acquisition.duration_ms / 1000 * Acquisition.freq_emg))
+
+        # metadata (gesture, date, device) of the saved samples
+        self.metadata_index = metadata.MetadataIndex(dataset_path=os.getcwd() + '\\Dataset')
+
+        # drift and data-quality statistics of the windows classified in the Prediction panel, logged in monitor.log
+        # the monitor asks the device for its battery level every minute while windows are classified
+        self.monitor = monitor.DriftMonitor(store_path=os.getcwd() + '\\Store', log_path=os.getcwd() + '\\monitor.log',
+                                            battery_request=lambda: self.listener.requestBattery(), battery_interval_s=60)
+
+        # decoder of the spelled words, if there is a lexicon in the NeuralNetwork directory
+        self.decoder = self.loadDecoder()
+
+        # embedding index of the samples, if built with embedding.py: every saved sample is inserted in it
+        self.gesture_index_path = os.getcwd() + '\\NeuralNetwork\\index.npz'
+        self.gesture_index = embedding.loadIndex(self.gesture_index_path) if os.path.exists(self.gesture_index_path) else None
+        self.gesture_index_changed = False
+
+        # ensemble selected in the Testing panel: its members are loaded once and kept for the following tests
+        self.ensemble = None
+        self.ensemble_path = None
+
         # tries to connect to the device
         self.connection(self)
 
@@ -91,6 +137,7 @@ class MainFrame(wx.Frame):
 
         self.SetSize((360, 480))
         self.SetTitle('Sign Language')
+        self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
         self.Centre()
 
 
@@ -114,6 +161,19 @@ class MainFrame(wx.Frame):
 
     
     
+    # loads the lexicon of the word decoder, preferring the npz built by decoder.py to the word list
+    def loadDecoder(self):
+        path = os.getcwd() + '\\NeuralNetwork\\lexicon'
+        for extension in ('.npz', '.txt'):
+            if os.path.exists(path + extension):
+                try:
+                    return decoder.WordDecoder(decoder.loadLexicon(path + extension))
+                except (OSError, ValueError):
+                    wx.MessageBox("Error loading the lexicon %s" % (path + extension), "Info", wx.OK|wx.ICON_INFORMATION)
+        return None
+
+
+
     # if myo is not yet initialized, initialize it, i.e. connect it to the device SDK
     # The bin folder of the myo64.dll SDK must be in the system PATH
     # otherwise pass the path of the bin folder as an argument to myo.init ()
@@ -214,10 +274,37 @@ class MainFrame(wx.Frame):
             wx.MessageBox("First connect the device", "Info", wx.OK|wx.ICON_INFORMATION)
 
 
+    # it starts when "Calibration" is pressed
+    def onCalibration(self, e, parent):
+        if self.connected == True:
+            parent.Destroy()
+
+            self.calibration = Calibration(self)
+            self.sizer.Add(self.calibration, 1, wx.EXPAND)
+            self.SetSizer(self.sizer)
+
+            self.Layout()
+        else:
+            wx.MessageBox("First connect the device", "Info", wx.OK|wx.ICON_INFORMATION)
+
+
     # it starts when "Close" is pressed
     def onClose(self, e):
-        self.stop = True # close run_loop
         self.Close(True)
+
+
+    # it starts when the window is closed, with "Close" or with the button of the title bar
+    # the shared memory of the capture buffers is freed here, otherwise its blocks would stay in /dev/shm
+    def onCloseWindow(self, e):
+        self.stop = True # close run_loop
+        self.capture_pool.close()
+        self.metadata_index.close()
+        self.monitor.close(timeout=1)
+        if self.gesture_index_changed:
+            self.gesture_index.save(self.gesture_index_path)
+        if self.ensemble is not None:
+            self.ensemble.close()
+        self.Destroy()
     
 
     # it starts when "Gestures List" is pressed
@@ -285,6 +372,10 @@ class MainFrame(wx.Frame):
     def onPredict(self, e, parent, model, weight):
         parent.Destroy()
 
+        # an ensemble uploaded again in the Testing panel starts with all its members
+        if self.ensemble is not None and self.ensemble_path == model:
+            self.ensemble.reset()
+
         self.predict = Prediction(self, model, weight)   
         self.sizer.Add(self.predict, 1, wx.EXPAND)
         self.SetSizer(self.sizer)
@@ -390,6 +481,9 @@ class MainMenu(wx.Panel):
         test_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: parent.onTest(event, self))
         test_button.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
 
+        calibration_button = wx.Button(self, label='Calibration', pos=(20,410))
+        calibration_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: parent.onCalibration(event, self))
+
         close_button = wx.Button(self, label='Close', pos=(250,410))
         close_button.Bind(wx.EVT_BUTTON, parent.onClose)
 
@@ -514,6 +608,10 @@ class GestureList(wx.Panel):
             path = os.getcwd() + '\\Dataset\\'
             try:
                 os.rename(path + text, path + renamed)
+                self.GetParent().metadata_index.renameGesture(text, renamed)
+                if self.GetParent().gesture_index is not None:
+                    self.GetParent().gesture_index.renameGesture(text, renamed)
+                    self.GetParent().gesture_index_changed = True
                 self.list_box.Delete(sel)
                 item_id = self.list_box.Insert(renamed, sel)
                 self.list_box.SetSelection(item_id)
@@ -531,6 +629,10 @@ class GestureList(wx.Panel):
         path = os.getcwd() + '\\Dataset\\' + text
         try:
             shutil.rmtree(path)
+            self.GetParent().metadata_index.deleteGesture(text)
+            if self.GetParent().gesture_index is not None:
+                self.GetParent().gesture_index.deleteGesture(text)
+                self.GetParent().gesture_index_changed = True
             self.list_box.Delete(sel)
         except OSError:
             wx.MessageBox("Error during gesture cancellation", "Info", wx.OK|wx.ICON_INFORMATION)
@@ -621,6 +723,9 @@ class Testing(wx.Panel):
         text1 = wx.StaticText(self, label='Choose the weight file', pos=(90,260))        
         self.choose_file1 = wx.FilePickerCtrl(self, message="Choose the weight file:", pos=(20,280), size=(300,40))
 
+        text2 = wx.StaticText(self, label='(no weight file for .npz, .tflite and .ensemble.json models)', pos=(30,320))
+        text2.SetFont(wx.Font(7, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+
         self.upload_file = wx.Button(self, label='Upload', pos=(135,340))
         self.upload_file.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onUpload(event, parent))
         self.upload_file.Disable()
@@ -638,9 +743,11 @@ class Testing(wx.Panel):
 
     # thread that controls whether the architecture and weight files have been loaded
     # in case they are both loaded, enable the button to upload the files in the directory
+    # classical (.npz) and tensorflow lite (.tflite) models do not need the weight file
     def checkInsert(self):
         while True:
-            if self.choose_file.GetPath() != '' and self.choose_file1.GetPath() != '':
+            model = self.choose_file.GetPath()
+            if model != '' and (self.choose_file1.GetPath() != '' or recognizers.isStandalone(model)):
                 self.upload_file.Enable()
                 break
         
@@ -653,6 +760,10 @@ class Testing(wx.Panel):
         path1 = os.getcwd() + '\\NeuralNetwork\\' + os.path.basename(self.choose_file.GetPath())
         if not os.path.exists(path1):
             shutil.copyfile(self.choose_file.GetPath(), path1)
+        # classical and tensorflow lite models are a single file
+        if recognizers.isStandalone(path1):
+            parent.onPredict(e=e, parent=self, model=path1, weight=None)
+            return
         path2 = os.getcwd() + '\\NeuralNetwork\\' + os.path.basename(self.choose_file1.GetPath())
         if not os.path.exists(path2):
             shutil.copyfile(self.choose_file1.GetPath(), path2)
@@ -660,8 +771,86 @@ class Testing(wx.Panel):
 
 
 
+# auto mode of the Acquisition and Prediction panels: the acquisition starts by itself when the gesture begins,
+# and ends when the window of the panel centred on the gesture is complete (see segmentation.LiveSegmenter);
+# the capture buffer is then cropped to the window and onGesture of the panel is called
+class AutoAcquisition():
+
+    # a timer feeds the detector with the stream of the device
+    # the last half window of signal is kept, so that the window can be centred on a short gesture
+    # (for the imu, the sequence numbers of the events in the stream of the listener)
+    def armAcquisition(self, parent):
+        length = int(self.duration_ms / 1000 * self.freq_emg)
+        self.segmenter = segmentation.LiveSegmenter(self.freq_emg, length, length // 2, self.buffer.rows)
+        self.pre_emg = collections.deque(maxlen=self.segmenter.history)
+        self.pre_imu = collections.deque(maxlen=self.segmenter.history)
+
+        self.watch_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, lambda event, parent=parent: self.watchOnset(event, parent), self.watch_timer)
+        self.watch_timer.Start(1000 / self.freq_emg)
+
+
+    # starts the recording when the detector signals the onset of the gesture
+    def watchOnset(self, e, parent):
+        emg = parent.listener.emg
+        sequence = parent.listener.imu_stream.last()
+        self.pre_emg.append(emg)
+        self.pre_imu.append(sequence)
+
+        row, timestamp = parent.listener.imu_stream.get(sequence)
+        if self.segmenter.update(emg, row[:3]) == segmentation.ONSET:
+            self.watch_timer.Stop()
+            self.recordGesture(parent)
+
+
+    # the recording starts from the rows kept before the onset, with their imu events
+    # a single timer acquires emg and imu rows and feeds the detector, so that its rows are the rows of the buffer
+    def recordGesture(self, parent):
+        stream = parent.listener.imu_stream
+        self.buffer.reset()
+        for row in self.pre_emg:
+            self.buffer.appendEmg(row)
+        for sequence in self.pre_imu:
+            row, timestamp = stream.get(sequence)
+            self.buffer.appendImu(row, timestamp)
+        self.imu_read = stream.count
+        if len(self.pre_imu) > 0:
+            events, timestamps = stream.events(max(self.pre_imu[0], 0), self.pre_imu[-1] + 1)
+            self.buffer.appendImuEvents(events, timestamps)
+            self.imu_read = self.pre_imu[-1] + 1
+
+        self.record_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, lambda event, parent=parent: self.acquireGesture(event, parent), self.record_timer)
+        self.record_timer.Start(1000 / self.freq_emg)
+
+
+    # acquires a row; when the window is complete, the buffer is cropped to it
+    def acquireGesture(self, e, parent):
+        emg = parent.listener.emg
+        self.buffer.appendEmg(emg)
+        self.imu_read = self.buffer.appendImuStream(parent.listener.imu_stream, self.imu_read)
+        self.segmenter.update(emg, parent.listener.imu_stream.latest()[0][:3])
+        self.progress_bar.SetValue(min(100, int(self.buffer.emg_count * 100 / self.segmenter.length)))
+
+        if self.segmenter.complete():
+            self.record_timer.Stop()
+            first, last, start, end = self.segmenter.window()
+            self.buffer.crop(first, last)
+            self.active_rows = {"start": start, "end": end}
+            self.progress_bar.SetValue(100)
+            self.onGesture(parent)
+
+
+    # stops the timers of the auto mode, e.g. when the panel is destroyed while waiting for the gesture
+    def disarm(self):
+        for timer in (getattr(self, 'watch_timer', None), getattr(self, 'record_timer', None)):
+            if timer is not None:
+                timer.Stop()
+
+
+
 # panel that is activated when you want to make an acquisition in "Testing Model"
-class Prediction(wx.Panel):
+class Prediction(wx.Panel, AutoAcquisition):
 
     count_emg = 0 # counter used to check if acquisitions of emg have ended
     count_imu = 0 # counter used to check if acquisitions of imu have ended
@@ -673,18 +862,35 @@ class Prediction(wx.Panel):
     def __init__(self, parent, model, weight):
         wx.Panel.__init__(self, parent=parent)
 
-        self.emg = []
-        self.imu = []
+        # the acquisition is written in a capture buffer, given back to the pool when the panel is destroyed
+        self.buffer = parent.capture_pool.acquire()
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onDestroy)
 
         self.InitUI(parent, model, weight)
-        
-        with open(model,'r') as f:
-            modell = json.load(f)
-        
-        modell1 = json.dumps(modell)
 
-        self.classificator = model_from_json(modell1) # upload architecture model
-        self.classificator.load_weights(weight) # upload weights
+        # keras architecture and weights, or a classical model
+        # the embedding index of the app is used as it is, with the samples saved since it was loaded
+        if parent.gesture_index is not None and os.path.abspath(model) == os.path.abspath(parent.gesture_index_path):
+            self.classificator = parent.gesture_index
+            current = None if parent.profile is None else parent.profile.fingerprint()
+            if parent.gesture_index.profile != current:
+                wx.MessageBox("The embedding index was built with another calibration profile than the current one, build it again with the current profile", "Info", wx.OK|wx.ICON_INFORMATION)
+        elif ensemble.isEnsemble(model):
+            if parent.ensemble_path != model:
+                if parent.ensemble is not None:
+                    parent.ensemble.close()
+                parent.ensemble = recognizers.loadRecognizer(model)
+                parent.ensemble_path = model
+            self.classificator = parent.ensemble
+            self.showLatency()
+        else:
+            self.classificator = recognizers.loadRecognizer(model, weight)
+
+        # the calibration profile of the user, if any, is applied to every acquisition
+        self.profile = parent.profile
+
+        self.listener = parent.listener
+        self.monitor = parent.monitor
 
 
     def InitUI(self, parent, model, weight):
@@ -710,6 +916,9 @@ class Prediction(wx.Panel):
         self.start_button = wx.Button(self, label='Start', pos=(135,260))
         self.start_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent, model=model, weight=weight: self.onStart(event, parent, model, weight))
 
+        # in auto mode the acquisition starts by itself when the gesture begins
+        self.auto_check = wx.CheckBox(self, label='Auto', pos=(240,265))
+
         self.progress_bar = wx.Gauge(self, range=100, pos=(45,300), size=(250,25), style=wx.GA_HORIZONTAL) 
 
         back_button= wx.Button(self, label='Back', pos=(20,410))
@@ -719,9 +928,35 @@ class Prediction(wx.Panel):
         close_button.Bind(wx.EVT_BUTTON, parent.onClose)
 
 
+    # gives the capture buffer back to the pool
+    def onDestroy(self, e):
+        if e.GetEventObject() is self:
+            self.disarm()
+            self.buffer.release()
+        e.Skip()
+
+
+    # latency of the members of the ensemble in the previous tests; members dropped to keep to the latency budget are marked
+    def showLatency(self):
+        lines = []
+        for name, latency, last_latency, active in self.classificator.report():
+            line = name + ': ' + ('-' if latency is None else '%.1f ms' % latency)
+            lines.append(line if active else line + ' (dropped)')
+        latency_text = wx.StaticText(self, label='\n'.join(lines), pos=(20,335), size=(300,70))
+        latency_text.SetFont(wx.Font(7, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+
+
     # it starts when "Start" is pressed
     def onStart(self, e, parent, model, weight):
         self.start_button.Disable()
+        self.auto_check.Disable()
+
+        # in auto mode, the window centred on the gesture is classified
+        if self.auto_check.IsChecked():
+            self.model = model
+            self.weight = weight
+            self.armAcquisition(parent)
+            return
 
         # start acquisition
         self.startAcquisition(parent)
@@ -741,15 +976,28 @@ class Prediction(wx.Panel):
     def checkAcquisition(self, e, parent, model, weight):
         # if all emg and imu acquisition have been made
         # the number of acquisition is calculated as acquisitions' duration by acquisitions' frequency
-        if (len(self.emg) == ( (self.duration_ms / 1000) * self.freq_emg) ) and (len(self.imu) == ( (self.duration_ms / 1000) * self.freq_imu) ):
-            self.endAcquisition(e=e, parent=parent, model=model, weight=weight)
+        if (self.buffer.emg_count == ( (self.duration_ms / 1000) * self.freq_emg) ) and (self.buffer.imu_count == ( (self.duration_ms / 1000) * self.freq_imu) ):
             self.check_timer.Stop()
+            self.endAcquisition(e=e, parent=parent, model=model, weight=weight)
     
 
+    # auto mode: the window centred on the gesture has been acquired
+    def onGesture(self, parent):
+        self.endAcquisition(e=None, parent=parent, model=self.model, weight=self.weight)
+
+
     # it starts one the established acquisitions are reached
     # activate the predict and then call the function to activate the panel showing the predicted gesture
     def endAcquisition(self, e, parent, model, weight):
-        prediction = self.predictGesture()
+        # e.g. an embedding index whose gestures have all been deleted
+        try:
+            prediction = self.predictGesture()
+        except ValueError as error:
+            wx.MessageBox("Prediction failed: " + str(error), "Info", wx.OK|wx.ICON_INFORMATION)
+            return
+        # the probabilities of every letter are passed to the word decoder
+        if parent.decoder is not None:
+            parent.decoder.step(self.probabilities, self.labels)
         parent.onResult(e=e, parent=self, prediction=prediction, model=model, weight=weight)
 
 
@@ -757,48 +1005,28 @@ class Prediction(wx.Panel):
     # create the data to predict first, taking the acquisition made first
     # then permorm the predict and return the predicted gesture
     def predictGesture(self):
-        data = self.createArray()
+        raw = self.createArray()
+        data = raw
+        if self.profile is not None:
+            data = self.profile.apply(data)
 
         # pass the correct dimension to the neural network
         data = np.reshape(data, (1, data.shape[0], data.shape[1]))
         prediction = self.classificator.predict(data)
+        # the monitor only queues a copy of the window, its statistics are updated in background
+        # it receives the raw window, as its reference statistics are computed on the raw dataset
+        self.monitor.submit(raw, prediction[0], self.listener.battery)
+        self.probabilities = prediction[0]
+        self.labels = getattr(self.classificator, 'labels', dataset.LABELS)
         predicted_class = np.argmax(prediction)
-        label = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]
-        predicted_label = label[predicted_class]
+        predicted_label = self.labels[predicted_class]
         return predicted_label
 
 
-    # creates the data to be passed to the predict, taking the values ​​from the self.emg and self.imu which contain the acquisition just made
+    # creates the data to be passed to the predict, taking the values from the capture buffer which contains the acquisition just made
+    # the result is a view on the buffer, so no data is copied
     def createArray(self):
-        x1 = []
-        gyr = []
-        acc = []
-        ori = []
-        emg = []
-
-
-        nr_samples = int(self.duration_ms / 1000 * int(self.freq_emg))
-        for k in range(0, nr_samples):
-            emg.append(self.emg[k])
-            
-        imu = self.imu
-        for m in imu:
-            gyr.append(m["gyroscope"])
-            acc.append(m["acceleration"])
-            ori.append(m["orientation"])
-
-        for i in range(0, len(emg)):
-            x = [emg[i], gyr[i], acc[i], ori[i]]
-
-            flat = []
-            for sublist in x:
-                for item in sublist:
-                    flat.append(item)
-
-            x1.append(flat)
-
-        x2 = np.array(x1)
-        return x2
+        return self.buffer.toArray()
     
 
     # decreases the emg counter in which there is the number of acquisitions still to be made
@@ -816,9 +1044,10 @@ class Prediction(wx.Panel):
 
 
     # activates 2 timers, which periodically perform acquisitions for emg and imu
+    # the imu events are read from the stream of the listener from the next one
     def startAcquisition(self, parent):
-        self.emg.clear()
-        self.imu.clear()
+        self.buffer.reset()
+        self.imu_read = parent.listener.imu_stream.count
 
         self.emg_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, lambda event, parent=parent: self.acquireEmg(event, parent), self.emg_timer)
@@ -831,18 +1060,19 @@ class Prediction(wx.Panel):
     
     # acquires emg signals by fetching them through the listener
     def acquireEmg(self, e, parent):
-        self.emg.append(parent.listener.emg)
+        self.buffer.appendEmg(parent.listener.emg)
 
         # modify the progress bar
-        perc = int(len(self.emg) * 100 / ((self.duration_ms / 1000) * self.freq_emg))
+        perc = int(self.buffer.emg_count * 100 / ((self.duration_ms / 1000) * self.freq_emg))
         self.progress_bar.SetValue(perc)
 
         self.decreaseEmgCount()
 
 
     # acquires imu signals by fetching them through the listener
+    # every event received since the previous call is copied with its timestamp, and the last one is written as the imu row
     def acquireImu(self, e, parent):
-        self.imu.append(parent.listener.data)
+        self.imu_read = self.buffer.appendImuStream(parent.listener.imu_stream, self.imu_read)
         self.decreaseImuCount()
 
 
@@ -877,9 +1107,29 @@ class Result(wx.Panel):
         t = wx.StaticText(self, label='Did I guess?', pos=(120,170))
         t.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
 
-        im1 = wx.Image('Images/' + str(prediction) + '.jpg', wx.BITMAP_TYPE_ANY)
-        im1.Rescale(160,160)
-        image1 = wx.StaticBitmap(self, -1, wx.BitmapFromImage(im1), pos=(90,200))
+        # hypotheses of the word spelled so far, and a button to start a new word
+        if parent.decoder is not None:
+            self.word_text = wx.StaticText(self, label='', pos=(20,185), size=(300,15), style=wx.ST_ELLIPSIZE_END)
+            self.showWord(parent)
+            newword_button = wx.Button(self, label='New word', pos=(250,380))
+            newword_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onNewWord(event, parent))
+
+        # gestures added with the embedding index have no image, their name is shown instead
+        if os.path.exists('Images/' + str(prediction) + '.jpg'):
+            im1 = wx.Image('Images/' + str(prediction) + '.jpg', wx.BITMAP_TYPE_ANY)
+            im1.Rescale(160,160)
+            image1 = wx.StaticBitmap(self, -1, wx.BitmapFromImage(im1), pos=(90,200))
+        else:
+            gesture_text = wx.StaticText(self, label=str(prediction), pos=(20,260), size=(300,40), style=wx.ALIGN_CENTRE_HORIZONTAL)
+            gesture_text.SetFont(wx.Font(20, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+
+        # alerts of the drift monitor, e.g. the armband has moved or the battery is low
+        alerts = parent.monitor.activeAlerts()
+        if len(alerts) > 0:
+            label = alerts[0] if len(alerts) == 1 else '(' + str(len(alerts)) + ' alerts) ' + alerts[0]
+            alert_text = wx.StaticText(self, label=label, pos=(20,362), size=(300,15), style=wx.ST_ELLIPSIZE_END)
+            alert_text.SetToolTip('\n'.join(alerts))
+            alert_text.SetForegroundColour(wx.Colour(200, 30, 30))
 
         tryagain_button = wx.Button(self, label='Try again', pos=(135,380))
         tryagain_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent, model=model, weight=weight: parent.onRestart(event, self, model, weight))
@@ -891,11 +1141,177 @@ class Result(wx.Panel):
         close_button.Bind(wx.EVT_BUTTON, parent.onClose)
 
 
+    # shows the best word hypotheses of the decoder
+    def showWord(self, parent):
+        hypotheses = parent.decoder.hypotheses(3)
+        if len(hypotheses) == 0:
+            self.word_text.SetLabel('Word: -')
+        else:
+            self.word_text.SetLabel('Word: ' + ', '.join(word if complete else word + '...' for word, score, complete in hypotheses))
+
+
+    # it starts when "New word" is pressed: the current word is closed and the decoder starts a new one
+    def onNewWord(self, e, parent):
+        word = parent.decoder.endWord()
+        if word is not None:
+            wx.MessageBox("Spelled word: " + word, "Info", wx.OK|wx.ICON_INFORMATION)
+        self.showWord(parent)
+
+
+
+
+
+# panel that is activated if you choose "Calibration" from the Main Menu
+# records the arm at rest and at maximum voluntary contraction and computes the calibration profile of the user
+class Calibration(wx.Panel):
+
+    phase_ms = 2000 # duration of each phase of the routine in milliseconds
+    pause_ms = 1000 # pause between two phases in milliseconds
+    freq = 200 # acquisition frequency
+    phases = [("rest", "Relax your arm"), ("mvc", "Make a fist as hard as you can")]
+
+
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent=parent)
+
+        # each phase is written in a capture buffer, given back to the pool when the panel is destroyed
+        self.buffer = parent.capture_pool.acquire()
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onDestroy)
+        self.recordings = {}
+        self.phase_timer = None
+        self.pause = None # the call that starts the next phase after the pause
+
+        self.InitUI(parent)
+
+
+    def InitUI(self, parent):
+        self.text_name = wx.StaticText(self, label='Device: \n\n', pos=(20,20))
+        self.text_name.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+        
+        self.battery_level = wx.StaticText(self, label='Battery: \n\n', pos=(260,20))
+        self.battery_level.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+
+        name, battery = parent.listener.get()
+        self.text_name.SetLabel(self.text_name.GetLabel() + name)
+        self.battery_level.SetLabel(self.battery_level.GetLabel() + str(battery) + "%")
+
+        im = wx.Image('Images/myo.png', wx.BITMAP_TYPE_ANY)
+        im.Rescale(120,120)
+        image = wx.StaticBitmap(self, -1, wx.BitmapFromImage(im), pos=(115,10))
+
+        st = wx.StaticLine(self, wx.ID_ANY, pos=(20,150), size=(300,2), style=wx.LI_HORIZONTAL)
+
+        user_text = wx.StaticText(self, label='User', pos=(20,168))
+        self.user = wx.TextCtrl(self, pos=(80,165), size=(240,25))
+
+        self.status = wx.StaticText(self, label='Press "Start" and follow the instructions', pos=(40,205))
+        self.status.SetFont(wx.Font(10, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+
+        self.start_button = wx.Button(self, label='Start', pos=(135,240))
+        self.start_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onStart(event, parent))
+
+        self.progress_bar = wx.Gauge(self, range=100, pos=(45,280), size=(250,25), style=wx.GA_HORIZONTAL)
+
+        # saved profiles, the first choice disables the calibration
+        profile_text = wx.StaticText(self, label='Profile', pos=(20,343))
+        self.profile_choice = wx.Choice(self, pos=(80,340), size=(150,25), choices=['(none)'] + calibration.listProfiles())
+        if parent.profile is not None and parent.profile.user in calibration.listProfiles():
+            self.profile_choice.SetStringSelection(parent.profile.user)
+        else:
+            self.profile_choice.SetSelection(0)
+        use_button = wx.Button(self, label='Use', pos=(245,340))
+        use_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onUse(event, parent))
+
+        back_button = wx.Button(self, label='Back', pos=(20,410))
+        back_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: parent.onBack(event, self))
+
+        close_button = wx.Button(self, label='Close', pos=(250,410))
+        close_button.Bind(wx.EVT_BUTTON, parent.onClose)
+
+
+    # gives the capture buffer back to the pool
+    # the timers of the routine are stopped first, so that they do not touch the panel or the buffer afterwards
+    def onDestroy(self, e):
+        if e.GetEventObject() is self:
+            if self.phase_timer is not None:
+                self.phase_timer.Stop()
+            if self.pause is not None:
+                self.pause.Stop()
+            self.buffer.release()
+        e.Skip()
+
+
+    # it starts when "Start" is pressed
+    def onStart(self, e, parent):
+        if self.user.GetValue().strip() == '':
+            wx.MessageBox("First insert the user name", "Info", wx.OK|wx.ICON_INFORMATION)
+            return
+        self.start_button.Disable()
+        self.recordings.clear()
+        self.startPhase(parent, 0)
+
+
+    # shows the instruction of a phase and starts a timer that acquires the signals
+    def startPhase(self, parent, phase):
+        self.status.SetLabel(self.phases[phase][1])
+        self.progress_bar.SetValue(0)
+        self.buffer.reset()
+        self.imu_read = parent.listener.imu_stream.count
+        self.count = int(self.phase_ms / 1000 * self.freq)
+
+        self.phase_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, lambda event, parent=parent, phase=phase: self.acquire(event, parent, phase), self.phase_timer)
+        self.phase_timer.Start(1000 / self.freq)
+
+
+    # acquires emg and imu signals by fetching them through the listener
+    # at the end of a phase starts the next one after a pause, or computes the profile
+    def acquire(self, e, parent, phase):
+        self.buffer.appendEmg(parent.listener.emg)
+        self.imu_read = self.buffer.appendImuStream(parent.listener.imu_stream, self.imu_read)
+        self.progress_bar.SetValue(int(self.buffer.emg_count * 100 / self.count))
+
+        if self.buffer.emg_count >= self.count:
+            self.phase_timer.Stop()
+            self.recordings[self.phases[phase][0]] = np.array(self.buffer.toArray())
+            if phase + 1 < len(self.phases):
+                self.status.SetLabel('Well done, get ready...')
+                self.pause = wx.CallLater(self.pause_ms, self.startPhase, parent, phase + 1)
+            else:
+                self.endCalibration(parent)
+
+
+    # computes and saves the profile of the user, which becomes the current one
+    def endCalibration(self, parent):
+        user = self.user.GetValue().strip()
+        try:
+            reference = calibration.loadReference(store_path=os.getcwd() + '\\Store')
+            profile = calibration.computeProfile(user, self.recordings["rest"], self.recordings["mvc"], reference)
+            profile.save()
+            parent.profile = profile
+            self.profile_choice.SetItems(['(none)'] + calibration.listProfiles())
+            self.profile_choice.SetStringSelection(user)
+            self.status.SetLabel('Calibration completed')
+        except (OSError, ValueError):
+            wx.MessageBox("Error during calibration, please try again", "Info", wx.OK|wx.ICON_INFORMATION)
+            self.status.SetLabel('Press "Start" and follow the instructions')
+        self.start_button.Enable()
+
+
+    # it starts when "Use" is pressed: the selected profile becomes the current one
+    def onUse(self, e, parent):
+        user = self.profile_choice.GetStringSelection()
+        if self.profile_choice.GetSelection() <= 0:
+            parent.profile = None
+        else:
+            parent.profile = calibration.loadProfile(calibration.profilePath(user))
+        wx.MessageBox("Profile selected: " + user, "Info", wx.OK|wx.ICON_INFORMATION)
+
 
 
 
 # panello to make acquisitions
-class Acquisition(wx.Panel):
+class Acquisition(wx.Panel, AutoAcquisition):
 
     count_emg = 0 # counter used to check if acquisitions of emg have ended
     count_imu = 0 # counter used to check if acquisitions of imu have ended
@@ -907,8 +1323,10 @@ class Acquisition(wx.Panel):
     def __init__(self, parent, gesture_name):
         wx.Panel.__init__(self, parent=parent)
 
-        self.emg = []
-        self.imu = []
+        # the acquisition is written in a capture buffer, given back to the pool when the panel is destroyed
+        self.buffer = parent.capture_pool.acquire()
+        self.active_rows = None # in auto mode, rows of the gesture in the saved window
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onDestroy)
 
         count = self.getAcquisitionNumber(gesture_name)
 
@@ -941,6 +1359,14 @@ class Acquisition(wx.Panel):
         self.start_button = wx.Button(self, label='Start', pos=(135,260))
         self.start_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onStart(event, parent))
 
+        # in auto mode the acquisition starts by itself when the gesture begins
+        self.auto_check = wx.CheckBox(self, label='Auto', pos=(240,265))
+
+        # live plot of the signals, to check that all the channels are active
+        self.signal_window = None
+        signals_button = wx.Button(self, label='Signals', pos=(20,260))
+        signals_button.Bind(wx.EVT_BUTTON, lambda event, parent=parent: self.onSignals(event, parent))
+
         self.progress_bar = wx.Gauge(self, range=100, pos=(45,300), size=(250,25), style=wx.GA_HORIZONTAL) 
         
         self.conf_button = wx.Button(self, label='Save', pos=(20,340))
@@ -963,6 +1389,25 @@ class Acquisition(wx.Panel):
 
 
 
+    # gives the capture buffer back to the pool and closes the plot of the signals
+    def onDestroy(self, e):
+        if e.GetEventObject() is self:
+            self.disarm()
+            self.buffer.release()
+            if self.signal_window:
+                self.signal_window.Destroy()
+        e.Skip()
+
+
+    # it starts when "Signals" is pressed
+    def onSignals(self, e, parent):
+        if self.signal_window:
+            self.signal_window.Raise()
+        else:
+            self.signal_window = plot.SignalWindow(parent, parent.listener)
+            self.signal_window.Show()
+
+
     # returns the number of acquisitons made for a specific gesture
     # consist on make a listdir on the gesture directory
     def getAcquisitionNumber(self, gesture):
@@ -971,11 +1416,20 @@ class Acquisition(wx.Panel):
 
     
     # it starts when "Start" is pressed
-    # inizialize emg and imu acquisitions
-    # it also activates a timer that periodically checks whether the acquisitions for emg and imu have ended
+    # inizialize emg and imu acquisitions, immediately or, in auto mode, when the gesture begins
     def onStart(self, e, parent):
         self.start_button.Disable()
+        self.auto_check.Disable()
+
+        if self.auto_check.IsChecked():
+            self.armAcquisition(parent)
+        else:
+            self.beginAcquisition(parent)
 
+
+    # starts the acquisitions
+    # it also activates a timer that periodically checks whether the acquisitions for emg and imu have ended
+    def beginAcquisition(self, parent):
         # start acquisitions
         self.startAcquisition(parent)
 
@@ -986,7 +1440,12 @@ class Acquisition(wx.Panel):
         self.check_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self.checkAcquisition, self.check_timer)
         self.check_timer.Start(100)
-        
+
+
+    # auto mode: the window centred on the gesture has been acquired
+    def onGesture(self, parent):
+        self.endAcquisition()
+
 
     # check the termination of the acquisition throught the use of a timer that every 100 ms
     # go to check if the current lenght of the acquisition is equal to the necessary one
@@ -994,7 +1453,7 @@ class Acquisition(wx.Panel):
     def checkAcquisition(self, e):
         # if all emg and imu acquisition have been made
         # the number of acquisition is calculated as acquisitions' duration by acquisitions' frequency
-        if (len(self.emg) == ( (self.duration_ms / 1000) * self.freq_emg) ) and (len(self.imu) == ( (self.duration_ms / 1000) * self.freq_imu) ):
+        if (self.buffer.emg_count == ( (self.duration_ms / 1000) * self.freq_emg) ) and (self.buffer.imu_count == ( (self.duration_ms / 1000) * self.freq_imu) ):
             self.endAcquisition()
             self.check_timer.Stop()
 
@@ -1020,9 +1479,10 @@ class Acquisition(wx.Panel):
 
 
     # activates 2 timers, which periodically perform acquisitions for emg and imu
+    # the imu events are read from the stream of the listener from the next one
     def startAcquisition(self, parent):
-        self.emg.clear()
-        self.imu.clear()
+        self.buffer.reset()
+        self.imu_read = parent.listener.imu_stream.count
 
         self.emg_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, lambda event, parent=parent: self.acquireEmg(event, parent), self.emg_timer)
@@ -1035,18 +1495,19 @@ class Acquisition(wx.Panel):
     
     # acquires emg signals by fetching them through the listener
     def acquireEmg(self, e, parent):
-        self.emg.append(parent.listener.emg)
+        self.buffer.appendEmg(parent.listener.emg)
 
         # modify the progress bar
-        perc = int(len(self.emg) * 100 / ((self.duration_ms / 1000) * self.freq_emg))
+        perc = int(self.buffer.emg_count * 100 / ((self.duration_ms / 1000) * self.freq_emg))
         self.progress_bar.SetValue(perc)
 
         self.decreaseEmgCount()
 
 
     # acquires imu signals by fetching them through the listener
+    # every event received since the previous call is copied with its timestamp, and the last one is written as the imu row
     def acquireImu(self, e, parent):
-        self.imu.append(parent.listener.data)
+        self.imu_read = self.buffer.appendImuStream(parent.listener.imu_stream, self.imu_read)
         self.decreaseImuCount()
 
 
@@ -1054,25 +1515,42 @@ class Acquisition(wx.Panel):
     # the the file is saved in json format
     # at the end the panel is reload, giving the possibility to make a new acquisition
     def onConf(self, e, gesture_name, parent):
+        name, battery = parent.listener.get()
+
         # composition of output file
+        # timestamp and device are written first, so that they can be read without decoding the whole file
         data = {
             "timestamp": datetime.datetime.now().strftime("%d/%m/%y/%H:%M:%S"),
+            "device": name,
             "duration": self.duration_ms,
             "emg": {
                 "frequency": self.freq_emg,
-                "data": self.emg
+                "data": self.buffer.emgList()
             },
             "imu": {
                 "frequency": self.freq_imu,
-                "data": self.imu
+                "data": self.buffer.imuList(),
+                "timestamps": self.buffer.imuTimestamps(),
+                "events": self.buffer.imuEvents()
             }
         }
+        # in auto mode, the rows of the gesture detected in the window
+        if self.active_rows is not None:
+            data["active"] = self.active_rows
 
         file_name = str(uuid.uuid4()) # create random uuid
         path_file = os.getcwd() + '\\Dataset\\' + gesture_name + '\\' + file_name + '.json'
         try:
             with open(path_file, 'w') as f:
                 json.dump(data, f)
+            parent.metadata_index.addSample(gesture_name + '/' + file_name + '.json', gesture_name, data["timestamp"], name)
+            # the index is queried with calibrated windows in the Prediction panel, so the same representation is inserted
+            if parent.gesture_index is not None:
+                window = self.buffer.toArray()
+                if parent.profile is not None:
+                    window = parent.profile.apply(window)
+                parent.gesture_index.insert(window[np.newaxis], gesture_name, [gesture_name + '/' + file_name + '.json'])
+                parent.gesture_index_changed = True
             wx.MessageBox("Acquisition saved successfully!", "Info", wx.OK|wx.ICON_INFORMATION)
         except OSError:
             wx.MessageBox("Error during acquisition saving, please try again with another acquisition", "Info", wx.OK|wx.ICON_INFORMATION)
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+import dataset
+
+
+# per-user calibration profiles
+# a short routine records the arm at rest and at maximum voluntary contraction (MVC); from the two recordings a profile computes:
+#  - the rotation of the armband, i.e. the circular shift of the 8 emg channels that best matches the channel pattern of the dataset
+#  - per-channel scale and offset, that bring the emg amplitude of the user to the one of the dataset and remove the gyroscope bias
+# the profile is applied as a single precomputed affine transform (column permutation, scale, offset),
+# both in the live prediction path and in the offline loaders (dataset.openStore with a profile, the --profile option of the tools),
+# so that a recognizer used with a profile is trained on the same representation
+
+
+PROFILE_DIRECTORY = os.path.join(os.getcwd(), 'Profiles')
+REFERENCE_PATH = os.path.join(PROFILE_DIRECTORY, 'reference.json')
+
+NR_EMG = 8
+LEVEL_PERCENTILE = 95 # percentile of the rectified emg taken as the contraction level of a channel
+
+
+class Profile():
+
+    def __init__(self, user, rotation=0, scale=None, offset=None):
+        self.user = user
+        self.rotation = int(rotation)
+        self.scale = np.ones(dataset.NR_CHANNELS, dtype=np.float32) if scale is None else np.asarray(scale, dtype=np.float32)
+        self.offset = np.zeros(dataset.NR_CHANNELS, dtype=np.float32) if offset is None else np.asarray(offset, dtype=np.float32)
+        # column k of the calibrated data is column permutation[k] of the raw data
+        self.permutation = np.concatenate(((np.arange(NR_EMG) + self.rotation) % NR_EMG, np.arange(NR_EMG, dataset.NR_CHANNELS)))
+
+
+    # applies the profile to a (rows x 18) array or to a batch (samples x rows x 18)
+    def apply(self, array):
+        return np.asarray(array, dtype=np.float32)[..., self.permutation] * self.scale + self.offset
+
+
+    # identifies the transform of the profile, e.g. in the name of a calibrated copy of the tensor store
+    def fingerprint(self):
+        digest = hashlib.md5(self.permutation.astype(np.int64).tobytes() + self.scale.tobytes() + self.offset.tobytes()).hexdigest()
+        return self.user + '_' + digest[:8]
+
+
+    def save(self, path=None):
+        if path is None:
+            path = profilePath(self.user)
+        directory = os.path.dirname(path)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump({"user": self.user, "rotation": self.rotation, "scale": self.scale.tolist(), "offset": self.offset.tolist()}, f)
+
+
+
+def profilePath(user):
+    return os.path.join(PROFILE_DIRECTORY, user + '.json')
+
+
+def loadProfile(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return Profile(data["user"], data["rotation"], data["scale"], data["offset"])
+
+
+# profile of a user, or None if user is None (e.g. the --profile option of the tools is not given)
+def userProfile(user):
+    return None if user is None else loadProfile(profilePath(user))
+
+
+# names of the users with a saved profile
+def listProfiles(path=PROFILE_DIRECTORY):
+    if not os.path.exists(path):
+        return []
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(path) if f.endswith('.json') and f != os.path.basename(REFERENCE_PATH))
+
+
+# contraction level of each emg channel of a batch of samples
+def emgLevels(array):
+    emg = np.abs(np.asarray(array, dtype=np.float32)[..., :NR_EMG]).reshape(-1, NR_EMG)
+    return np.percentile(emg, LEVEL_PERCENTILE, axis=0)
+
+
+# reference statistics of the dataset: contraction level of each emg channel
+def computeReference(store):
+    return {"levels": emgLevels(store.samples).tolist()}
+
+
+# loads the reference statistics, computing them from the tensor store the first time
+def loadReference(path=REFERENCE_PATH, store_path=dataset.STORE_DIRECTORY):
+    if not os.path.exists(path):
+        reference = computeReference(dataset.openStore(store_path))
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            json.dump(reference, f)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# computes the profile of a user from the rest and mvc recordings (rows x 18 each)
+def computeProfile(user, rest, mvc, reference):
+    rest = np.asarray(rest, dtype=np.float32)
+    mvc = np.asarray(mvc, dtype=np.float32)
+    reference_levels = np.asarray(reference["levels"], dtype=np.float32)
+
+    # rotation: the shift whose channel pattern is the most correlated with the pattern of the dataset
+    levels = emgLevels(mvc)
+    shifts = np.stack([np.roll(levels, -k) for k in range(NR_EMG)]) # row k: channel c is raw channel c + k
+    centered = shifts - shifts.mean(axis=1, keepdims=True)
+    reference_centered = reference_levels - reference_levels.mean()
+    correlation = centered @ reference_centered / (np.linalg.norm(centered, axis=1) * np.linalg.norm(reference_centered) + 1e-9)
+    rotation = int(np.argmax(correlation))
+
+    profile = Profile(user, rotation)
+    rest = rest[:, profile.permutation]
+    mvc = mvc[:, profile.permutation]
+
+    scale = np.ones(dataset.NR_CHANNELS, dtype=np.float32)
+    offset = np.zeros(dataset.NR_CHANNELS, dtype=np.float32)
+    # emg: the rest mean is removed and the contraction level is matched to the dataset
+    rest_mean = rest[:, :NR_EMG].mean(axis=0)
+    scale[:NR_EMG] = reference_levels / np.maximum(emgLevels(mvc[:, :NR_EMG] - rest_mean), 1.0)
+    offset[:NR_EMG] = -rest_mean * scale[:NR_EMG]
+    # gyroscope: the angular velocity at rest is the bias of the sensor
+    offset[8:11] = -rest[:, 8:11].mean(axis=0)
+
+    profile.scale = scale
+    profile.offset = offset
+    return profile
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibration profiles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reference_parser = subparsers.add_parser('reference', help="computes the reference statistics from the dataset")
+    reference_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+
+    apply_parser = subparsers.add_parser('apply', help="writes a copy of a tensor store calibrated with a profile")
+    apply_parser.add_argument('user', help="user of the profile")
+    apply_parser.add_argument('output', help="output file (.npy)")
+    apply_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == 'reference':
+        if os.path.exists(REFERENCE_PATH):
+            os.remove(REFERENCE_PATH)
+        print(loadReference(store_path=args.store))
+    else:
+        profile = loadProfile(profilePath(args.user))
+        store = dataset.openStore(args.store)
+        output = np.lib.format.open_memmap(args.output, mode='w+', dtype=np.float32, shape=store.samples.shape)
+        for i in range(len(store)):
+            output[i] = profile.apply(store.samples[i])
+        output.flush()
@@ -0,0 +1,460 @@
+import gc
+import time
+import argparse
+import threading
+import tracemalloc
+import multiprocessing
+from types import SimpleNamespace
+from multiprocessing import shared_memory
+import numpy as np
+
+import dataset
+
+
+# capture buffers: the rows of an acquisition (rows x 18, emg then gyroscope, acceleration and orientation)
+# are written into a single float32 block in shared memory, instead of lists of lists and lists of dicts;
+# the writer, the inference and any monitoring process read the same block without copying it
+# (another process attaches to it with CaptureBuffer.attach and the handle of the buffer, passed when the process is started).
+# the counts of the rows and the number of references are kept in a header at the beginning of the block, so every process sees the same
+# state; the references are updated under a multiprocessing lock, which is part of the handle.
+# buffers are reference counted and recycled by a CapturePool, so that no block is allocated at every acquisition.
+# the emg and imu events of the device are written by the Listener into an EmgStream and an ImuStream, preallocated rings of float32 rows
+# (emg; gyroscope, acceleration, orientation) with the timestamp of each event, so that no python object is allocated per event.
+# an acquisition copies every imu event of the stream (about 50 Hz) with its timestamp into the buffer, and also writes the last event
+# at every row of the acquisition, so that the rows keep the layout (emg and imu at 200 Hz) of the dataset
+
+
+NR_EMG = 8
+NR_IMU = 10 # 3 gyroscope + 3 acceleration + 4 orientation
+
+# fields of the header of a buffer
+EMG_COUNT = 0
+IMU_COUNT = 1
+EVENT_COUNT = 2
+REFERENCES = 3
+HEADER_SIZE = 4
+
+
+class CaptureBuffer():
+
+    def __init__(self, rows, pool=None, name=None, lock=None):
+        self.rows = rows
+        self.pool = pool
+        size = HEADER_SIZE * np.dtype(np.int64).itemsize
+        size = size + rows * dataset.NR_CHANNELS * np.dtype(np.float32).itemsize
+        # the timestamps of the imu rows, then the imu events and their timestamps follow the rows in the same block
+        size = size + rows * np.dtype(np.float64).itemsize
+        size = size + rows * NR_IMU * np.dtype(np.float32).itemsize + rows * np.dtype(np.float64).itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+        offset = self.header.nbytes
+        self.array = np.ndarray((rows, dataset.NR_CHANNELS), dtype=np.float32, buffer=self.shm.buf, offset=offset)
+        offset = offset + self.array.nbytes
+        self.timestamps = np.ndarray((rows,), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset = offset + self.timestamps.nbytes
+        self.events = np.ndarray((rows, NR_IMU), dtype=np.float32, buffer=self.shm.buf, offset=offset)
+        self.event_timestamps = np.ndarray((rows,), dtype=np.float64, buffer=self.shm.buf, offset=offset + self.events.nbytes)
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.closed = False
+        if self.owner:
+            self.header[:] = 0
+
+
+    # handle to pass to another process (e.g. in the arguments of a multiprocessing.Process), where attach maps the buffer
+    def handle(self):
+        return (self.shm.name, self.rows, self.lock)
+
+
+    # maps, in another process, a buffer created by a CapturePool, with its rows and counts as written by the producer
+    @classmethod
+    def attach(cls, handle):
+        name, rows, lock = handle
+        return cls(rows, name=name, lock=lock)
+
+
+    @property
+    def name(self):
+        return self.shm.name
+
+
+    # the counts are read from the header, so they are the ones of the producer in any process
+    @property
+    def emg_count(self):
+        return int(self.header[EMG_COUNT])
+
+
+    @emg_count.setter
+    def emg_count(self, value):
+        self.header[EMG_COUNT] = value
+
+
+    @property
+    def imu_count(self):
+        return int(self.header[IMU_COUNT])
+
+
+    @imu_count.setter
+    def imu_count(self, value):
+        self.header[IMU_COUNT] = value
+
+
+    @property
+    def event_count(self):
+        return int(self.header[EVENT_COUNT])
+
+
+    @event_count.setter
+    def event_count(self, value):
+        self.header[EVENT_COUNT] = value
+
+
+    @property
+    def references(self):
+        return int(self.header[REFERENCES])
+
+
+    def reset(self):
+        self.emg_count = 0
+        self.imu_count = 0
+        self.event_count = 0
+
+
+    # adds a reference to the buffer, e.g. before passing it to another consumer
+    def retain(self):
+        with self.lock:
+            self.header[REFERENCES] += 1
+        return self
+
+
+    # removes a reference; when there are no more references the buffer goes back to its pool
+    # (a buffer released in another process is taken back by the pool at its next acquire)
+    # releasing a buffer already closed, e.g. by its pool when the app is closed, does nothing
+    def release(self):
+        if self.closed:
+            return
+        with self.lock:
+            if self.header[REFERENCES] <= 0:
+                raise ValueError("capture buffer %s released more times than retained" % self.name)
+            self.header[REFERENCES] -= 1
+            free = self.header[REFERENCES] == 0
+        if free and self.pool is not None:
+            self.pool.recycle(self)
+
+
+    # writes the next emg row, returns False if the buffer is full
+    # an empty row (no emg event received yet) is written as zeros
+    def appendEmg(self, emg):
+        if self.emg_count >= self.rows:
+            return False
+        self.array[self.emg_count, :NR_EMG] = emg if len(emg) > 0 else 0
+        self.emg_count = self.emg_count + 1
+        return True
+
+
+    # writes the next imu row (gyroscope, acceleration, orientation) with the timestamp of its event,
+    # e.g. a row of an ImuStream; the row is copied into the buffer
+    def appendImu(self, imu, timestamp=0):
+        if self.imu_count >= self.rows:
+            return False
+        self.array[self.imu_count, NR_EMG:] = imu
+        self.timestamps[self.imu_count] = timestamp
+        self.imu_count = self.imu_count + 1
+        return True
+
+
+    # copies imu events (events x 10) with their timestamps, as received from the device
+    # the events that do not fit in the buffer are dropped
+    def appendImuEvents(self, events, timestamps):
+        count = min(len(events), self.rows - self.event_count)
+        self.events[self.event_count:self.event_count + count] = events[:count]
+        self.event_timestamps[self.event_count:self.event_count + count] = timestamps[:count]
+        self.event_count = self.event_count + count
+
+
+    # reads an ImuStream from the event number "read": copies the events received since then,
+    # and writes the last event as the next imu row; returns the number of the next event to read
+    def appendImuStream(self, stream, read):
+        stop = stream.count
+        events, timestamps = stream.events(read, stop)
+        self.appendImuEvents(events, timestamps)
+        row, timestamp = stream.get(stop - 1)
+        self.appendImu(row, timestamp)
+        return stop
+
+
+    # keeps only the rows from first to last (excluded), e.g. the window of a gesture,
+    # and the imu events received from the first to the last of these rows
+    def crop(self, first, last):
+        last = min(last, self.emg_count, self.imu_count)
+        if last <= first:
+            self.reset()
+            return
+        keep = (self.event_timestamps[:self.event_count] >= self.timestamps[first]) & (self.event_timestamps[:self.event_count] <= self.timestamps[last - 1])
+        events = self.events[:self.event_count][keep]
+        event_timestamps = self.event_timestamps[:self.event_count][keep]
+        self.events[:len(events)] = events
+        self.event_timestamps[:len(events)] = event_timestamps
+        self.event_count = len(events)
+
+        self.array[:last - first] = self.array[first:last].copy()
+        self.timestamps[:last - first] = self.timestamps[first:last].copy()
+        self.emg_count = last - first
+        self.imu_count = last - first
+
+
+    # the rows acquired for both emg and imu, as a view on the shared block
+    def toArray(self):
+        return self.array[:min(self.emg_count, self.imu_count)]
+
+
+    # emg rows in the json layout of the dataset (lists of integers)
+    def emgList(self):
+        return self.array[:self.emg_count, :NR_EMG].astype(np.int32).tolist()
+
+
+    # imu rows in the json layout of the dataset (list of dicts)
+    # every value is written with the shortest decimal of its float32 (0.1 and not 0.10000000149011612), which reads back to the same float32
+    def imuList(self):
+        rows = self.array[:self.imu_count].astype(str).astype(float).tolist()
+        return [{"gyroscope": r[8:11], "acceleration": r[11:14], "orientation": r[14:18]} for r in rows]
+
+
+    # timestamps of the imu rows, in microseconds as given by the device
+    def imuTimestamps(self):
+        return self.timestamps[:self.imu_count].tolist()
+
+
+    # imu events in the json layout of the dataset, with their timestamps
+    def imuEvents(self):
+        rows = self.events[:self.event_count].astype(str).astype(float).tolist()
+        return {
+            "data": [{"gyroscope": r[0:3], "acceleration": r[3:6], "orientation": r[6:10]} for r in rows],
+            "timestamps": self.event_timestamps[:self.event_count].tolist()
+        }
+
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        del self.header
+        del self.array
+        del self.timestamps
+        del self.events
+        del self.event_timestamps
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # a view on the block is still alive, the memory is freed with it
+        if self.owner:
+            self.shm.unlink()
+
+
+
+# pool of capture buffers with the same number of rows
+class CapturePool():
+
+    def __init__(self, rows, size=2):
+        self.rows = rows
+        self.lock = threading.Lock()
+        self.buffers = [CaptureBuffer(rows, self) for _ in range(size)] # every buffer created by the pool
+        self.free = list(self.buffers)
+        self.closed = False
+
+
+    # returns an empty buffer with one reference
+    # a new buffer is created only when all the buffers of the pool are in use; the buffers whose last reference
+    # was released in another process, which cannot recycle them, are taken back here
+    def acquire(self):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("the capture pool is closed")
+            if len(self.free) == 0:
+                self.free = [buffer for buffer in self.buffers if buffer.references == 0]
+            if len(self.free) > 0:
+                buffer = self.free.pop()
+            else:
+                buffer = CaptureBuffer(self.rows, self)
+                self.buffers.append(buffer)
+            buffer.reset()
+            return buffer.retain()
+
+
+    # called by CaptureBuffer.release; the buffers released after the pool is closed have already been freed
+    def recycle(self, buffer):
+        with self.lock:
+            if self.closed or buffer in self.free:
+                return
+            self.free.append(buffer)
+
+
+    # frees the shared memory of all the buffers
+    def close(self):
+        with self.lock:
+            for buffer in self.buffers:
+                buffer.close()
+            self.buffers = []
+            self.free = []
+            self.closed = True
+
+
+
+# ring of the events received from the device, written by the Listener thread and read by the panels
+# each event is a float32 row with its timestamp; the count is increased only after the row is written,
+# so the readers never see a partial row
+class SignalStream():
+
+    def __init__(self, width, capacity=1024):
+        self.capacity = capacity
+        self.rows = np.zeros((capacity, width), dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.empty = np.zeros(width, dtype=np.float32)
+        self.count = 0 # number of events written since the creation
+
+
+    # returns (row, timestamp) of the event number "sequence"; the row is a view, valid until capacity more events are written
+    # before the first event a row of zeros is returned
+    def get(self, sequence):
+        if sequence < 0:
+            return self.empty, 0
+        i = sequence % self.capacity
+        return self.rows[i], self.timestamps[i]
+
+
+    # sequence number of the last event, -1 before the first one
+    def last(self):
+        return self.count - 1
+
+
+    # (row, timestamp) of the last event
+    def latest(self):
+        return self.get(self.count - 1)
+
+
+    # copy of the rows of the events from start to stop (excluded), e.g. the events received since the last read
+    # the events already overwritten are skipped
+    def slice(self, start, stop):
+        start = max(start, stop - self.capacity, 0)
+        return self.rows[np.arange(start, stop) % self.capacity]
+
+
+    # copies of the rows and of the timestamps of the events from start to stop (excluded)
+    def events(self, start, stop):
+        start = max(start, stop - self.capacity, 0)
+        indices = np.arange(start, stop) % self.capacity
+        return self.rows[indices], self.timestamps[indices]
+
+
+
+# emg events: the 8 emg channels
+class EmgStream(SignalStream):
+
+    def __init__(self, capacity=1024):
+        super().__init__(NR_EMG, capacity)
+
+
+    # writes an emg event of myo-python
+    def write(self, event):
+        i = self.count % self.capacity
+        self.rows[i] = event.emg
+        self.timestamps[i] = event.timestamp
+        self.count = self.count + 1
+
+
+
+# imu events: gyroscope x y z, acceleration x y z, orientation x y z w
+class ImuStream(SignalStream):
+
+    def __init__(self, capacity=1024):
+        super().__init__(NR_IMU, capacity)
+
+
+    # writes an orientation event of myo-python
+    def write(self, event):
+        i = self.count % self.capacity
+        row = self.rows[i]
+        gyroscope = event.gyroscope
+        acceleration = event.acceleration
+        orientation = event.orientation
+        row[0] = gyroscope.x
+        row[1] = gyroscope.y
+        row[2] = gyroscope.z
+        row[3] = acceleration.x
+        row[4] = acceleration.y
+        row[5] = acceleration.z
+        row[6] = orientation.x
+        row[7] = orientation.y
+        row[8] = orientation.z
+        row[9] = orientation.w
+        self.timestamps[i] = event.timestamp
+        self.count = self.count + 1
+
+
+
+# compares the memory and the garbage collections of the dict-per-event capture and of the ImuStream,
+# on synthetic orientation events written and sampled as in the Acquisition panel
+def benchmark(nr_events=200000):
+    vector = lambda *values: SimpleNamespace(**dict(zip("xyzw", values)))
+    events = [SimpleNamespace(gyroscope=vector(0.1, 0.2, 0.3), acceleration=vector(0.0, 0.0, 1.0), orientation=vector(0.0, 0.0, 0.0, 1.0), timestamp=float(t)) for t in range(1000)]
+    buffer = CaptureBuffer(400)
+
+    def dicts():
+        current = {}
+        imu = []
+        for n in range(nr_events):
+            event = events[n % len(events)]
+            current = {
+                "gyroscope": [event.gyroscope.x, event.gyroscope.y, event.gyroscope.z],
+                "acceleration": [event.acceleration.x, event.acceleration.y, event.acceleration.z],
+                "orientation": [event.orientation.x, event.orientation.y, event.orientation.z, event.orientation.w]
+            }
+            imu.append(current)
+            if len(imu) == 400:
+                imu = []
+
+    def stream():
+        imu = ImuStream()
+        for n in range(nr_events):
+            imu.write(events[n % len(events)])
+            row, timestamp = imu.latest()
+            buffer.appendImu(row, timestamp)
+            if buffer.imu_count == 400:
+                buffer.reset()
+
+    pauses = []
+    def onCollect(phase, info):
+        if phase == "start":
+            pauses.append(time.perf_counter())
+        else:
+            pauses[-1] = time.perf_counter() - pauses[-1]
+
+    print("%-10s %12s %12s %14s %10s" % ("capture", "time (s)", "peak (KB)", "collections", "gc (ms)"))
+    gc.callbacks.append(onCollect)
+    try:
+        for name, run in (("dict", dicts), ("stream", stream)):
+            gc.collect()
+            del pauses[:]
+            tracemalloc.start()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("%-10s %12.3f %12.1f %14d %10.2f" % (name, elapsed, peak / 1024, len(pauses), sum(pauses) * 1000))
+    finally:
+        gc.callbacks.remove(onCollect)
+        buffer.close()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture buffers")
+    parser.add_argument('--events', type=int, default=200000, help="number of synthetic imu events of the benchmark")
+    args = parser.parse_args()
+
+    benchmark(args.events)
@@ -0,0 +1,240 @@
+import os
+import time
+import argparse
+import numpy as np
+
+import dataset
+import resolution
+import calibration
+
+
+# classical gesture recognizers (LDA, k-NN) on time-domain features of the EMG and IMU signals
+# they only need numpy, so they run on machines where tensorflow is not installed,
+# and are saved as small .npz files that can be selected in the Testing panel in place of a keras model
+
+
+NR_EMG = 8 # the first 8 columns of a sample are the emg channels
+
+ZC_THRESHOLD = 1.0 # minimum amplitude of a zero crossing or slope sign change, to ignore noise around 0
+
+
+# time-domain features of a batch of windows (windows x rows x 18), or of a single window (rows x 18)
+# each window is split into nr_segments segments of equal length; for each segment:
+#  - emg channels: mean absolute value, root mean square, waveform length, zero crossings, slope sign changes
+#  - imu channels: mean and standard deviation
+def extractFeatures(windows, nr_segments=4):
+    windows = np.asarray(windows, dtype=np.float32)
+    if windows.ndim == 2:
+        windows = windows[np.newaxis]
+    nr_windows, rows, _ = windows.shape
+    length = rows // nr_segments
+    segments = windows[:, :length * nr_segments].reshape(nr_windows, nr_segments, length, windows.shape[2])
+
+    emg = segments[..., :NR_EMG]
+    imu = segments[..., NR_EMG:]
+    diff = np.diff(emg, axis=2)
+
+    mav = np.abs(emg).mean(axis=2)
+    rms = np.sqrt((emg * emg).mean(axis=2))
+    wl = np.abs(diff).sum(axis=2) / length
+    zc = ((emg[:, :, :-1] * emg[:, :, 1:] < 0) & (np.abs(diff) >= ZC_THRESHOLD)).mean(axis=2)
+    ssc = ((-diff[:, :, :-1] * diff[:, :, 1:]) >= ZC_THRESHOLD).mean(axis=2)
+    mean = imu.mean(axis=2)
+    std = imu.std(axis=2)
+
+    return np.concatenate((mav, rms, wl, zc, ssc, mean, std), axis=2).reshape(nr_windows, -1)
+
+
+# classical recognizer with the same predict interface of a keras model:
+# predict takes a batch of windows (windows x rows x 18) and returns one probability vector per window
+# with a resolution level (see resolution.py) the 200 Hz windows are first converted to that level
+class ClassicalRecognizer():
+
+    def __init__(self, kind="lda", labels=None, nr_segments=4, shrinkage=0.1, k=5, resolution=None):
+        self.kind = kind
+        self.labels = list(labels) if labels is not None else list(dataset.LABELS)
+        self.nr_segments = nr_segments
+        self.shrinkage = shrinkage
+        self.k = k
+        self.resolution = resolution
+
+
+    def extract(self, windows):
+        if self.resolution is not None:
+            windows = resolution.transform(windows, self.resolution)
+        return extractFeatures(windows, self.nr_segments)
+
+
+    # trains the recognizer on a batch of windows and the index of their label
+    def fit(self, windows, y):
+        features = self.extract(windows)
+        y = np.asarray(y)
+
+        # features are standardized, so that the distances and the covariance are not dominated by the emg amplitude
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0) + 1e-6
+        features = (features - self.mean) / self.std
+
+        nr_classes = len(self.labels)
+        if self.kind == "lda":
+            # linear discriminant analysis with a shrunk pooled covariance
+            means = np.zeros((nr_classes, features.shape[1]))
+            priors = np.full(nr_classes, 1e-12)
+            centered = np.empty_like(features, dtype=np.float64)
+            for c in range(nr_classes):
+                members = features[y == c]
+                if len(members) > 0:
+                    means[c] = members.mean(axis=0)
+                    priors[c] = len(members) / len(features)
+                    centered[y == c] = members - means[c]
+            covariance = centered.T @ centered / max(1, len(features) - nr_classes)
+            covariance = (1 - self.shrinkage) * covariance + self.shrinkage * np.trace(covariance) / len(covariance) * np.eye(len(covariance))
+            precision_means = np.linalg.solve(covariance, means.T)
+            self.coef = precision_means.astype(np.float32)
+            self.intercept = (-0.5 * np.sum(means.T * precision_means, axis=0) + np.log(priors)).astype(np.float32)
+        elif self.kind == "knn":
+            self.features = features.astype(np.float32)
+            self.y = y.astype(np.int32)
+        else:
+            raise ValueError("unknown recognizer kind %s" % self.kind)
+        return self
+
+
+    def predict(self, windows):
+        features = (self.extract(windows) - self.mean) / self.std
+
+        if self.kind == "lda":
+            scores = features @ self.coef + self.intercept
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            return scores / scores.sum(axis=1, keepdims=True)
+
+        # k-nn: the probability of a label is the fraction of the k nearest neighbours with that label
+        distances = (features * features).sum(axis=1, keepdims=True) - 2 * features @ self.features.T + (self.features * self.features).sum(axis=1)
+        k = min(self.k, len(self.y))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        probabilities = np.zeros((len(features), len(self.labels)), dtype=np.float32)
+        for i in range(len(features)):
+            np.add.at(probabilities[i], self.y[nearest[i]], 1.0 / k)
+        return probabilities
+
+
+    def save(self, path):
+        arrays = {"kind": self.kind, "labels": np.array(self.labels), "nr_segments": self.nr_segments, "shrinkage": self.shrinkage, "k": self.k, "mean": self.mean, "std": self.std}
+        if self.resolution is not None:
+            arrays.update(resolution=self.resolution)
+        if self.kind == "lda":
+            arrays.update(coef=self.coef, intercept=self.intercept)
+        else:
+            arrays.update(features=self.features, y=self.y)
+        np.savez_compressed(path, **arrays)
+
+
+
+# loads a recognizer saved with ClassicalRecognizer.save
+def loadClassical(path):
+    with np.load(path) as f:
+        recognizer = ClassicalRecognizer(str(f["kind"]), [str(l) for l in f["labels"]], int(f["nr_segments"]), float(f["shrinkage"]), int(f["k"]))
+        recognizer.mean = f["mean"]
+        recognizer.std = f["std"]
+        if "resolution" in f.files:
+            recognizer.resolution = str(f["resolution"])
+        if recognizer.kind == "lda":
+            recognizer.coef = f["coef"]
+            recognizer.intercept = f["intercept"]
+        else:
+            recognizer.features = f["features"]
+            recognizer.y = f["y"]
+    return recognizer
+
+
+# trainer for sweep.py: config fields "model" ("lda" or "knn"), "nr_segments", "shrinkage", "k"
+def trainClassical(config, x_train, y_train, x_test, y_test, nr_classes):
+    recognizer = ClassicalRecognizer(config.get("model", "lda"), [str(c) for c in range(nr_classes)], config.get("nr_segments", 4), config.get("shrinkage", 0.1), config.get("k", 5))
+    recognizer.fit(x_train, y_train)
+    return float(np.mean(np.argmax(recognizer.predict(x_test), axis=1) == y_test))
+
+
+# returns the median and the 99th percentile latency in milliseconds of a predict function on a single window
+def measureLatency(predict, window, repetitions=200):
+    batch = window[np.newaxis]
+    predict(batch) # warm up
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        predict(batch)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.median(times), np.percentile(times, 99)
+
+
+# trains a keras architecture (json) file from scratch on a fold
+# keras is imported here, so that the classical recognizers can be benchmarked where tensorflow is not installed
+def trainKerasFold(model, x_train, y_train, epochs=30):
+    from keras.models import model_from_json
+    from keras.optimizers import Adam
+
+    with open(model, 'r') as f:
+        classificator = model_from_json(f.read())
+    classificator.compile(optimizer=Adam(0.001), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    classificator.fit(x_train, y_train, epochs=epochs, batch_size=32, verbose=0)
+    return classificator
+
+
+# compares the classical recognizers with a keras model on the dataset
+# all the recognizers are trained and evaluated on the same stratified k folds;
+# the keras architecture is trained from scratch on every fold, its trained weights are not used as they have seen the test folds
+def benchmark(store_path, k=5, model=None, epochs=30, profile=None):
+    store = dataset.openStore(store_path, profile=profile)
+    samples = np.asarray(store.samples)
+    print("%-10s %10s %14s %14s" % ("recognizer", "accuracy", "median (ms)", "p99 (ms)"))
+
+    folds = dataset.kFolds(store.labels, k)
+
+    for kind in ("lda", "knn"):
+        accuracies = []
+        for train, test in folds:
+            recognizer = ClassicalRecognizer(kind, store.label_names).fit(samples[train], store.labels[train])
+            accuracies.append(np.mean(np.argmax(recognizer.predict(samples[test]), axis=1) == store.labels[test]))
+        median, p99 = measureLatency(recognizer.predict, samples[0])
+        print("%-10s %10.4f %14.3f %14.3f" % (kind, np.mean(accuracies), median, p99))
+
+    if model is not None:
+        # the keras models of the Testing panel classify the 26 letters in alphabetical order, samples of other gestures are left out
+        y = np.array([dataset.LABELS.index(l) if l in dataset.LABELS else -1 for l in store.label_names])[store.labels]
+        accuracies = []
+        for train, test in folds:
+            train = train[y[train] >= 0]
+            test = test[y[test] >= 0]
+            classificator = trainKerasFold(model, samples[train], y[train], epochs)
+            accuracies.append(np.mean(np.argmax(classificator.predict(samples[test], verbose=0), axis=1) == y[test]))
+        median, p99 = measureLatency(lambda batch: classificator.predict(batch, verbose=0), samples[0], repetitions=50)
+        print("%-10s %10.4f %14.3f %14.3f" % ("keras", np.mean(accuracies), median, p99))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Classical (LDA, k-NN) gesture recognizers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="trains a recognizer on the whole dataset")
+    train_parser.add_argument('--kind', choices=['lda', 'knn'], default='lda')
+    train_parser.add_argument('--segments', type=int, default=4, help="number of time segments of the features")
+    train_parser.add_argument('--resolution', choices=resolution.LEVELS, default=None, help="resolution level of the input, see resolution.py")
+    train_parser.add_argument('--output', default=os.path.join(os.getcwd(), 'NeuralNetwork', 'classical.npz'))
+    train_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    train_parser.add_argument('--profile', default=None, help="user whose calibration profile is applied to the dataset, see calibration.py")
+
+    benchmark_parser = subparsers.add_parser('benchmark', help="compares accuracy and latency with a keras model")
+    benchmark_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    benchmark_parser.add_argument('--profile', default=None, help="user whose calibration profile is applied to the dataset, see calibration.py")
+    benchmark_parser.add_argument('--k', type=int, default=5, help="number of folds")
+    benchmark_parser.add_argument('--model', default=None, help="keras architecture (json) file, trained on every fold")
+    benchmark_parser.add_argument('--epochs', type=int, default=30, help="training epochs of the keras model on every fold")
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        store = dataset.openStore(args.store, profile=calibration.userProfile(args.profile))
+        recognizer = ClassicalRecognizer(args.kind, store.label_names, args.segments, resolution=args.resolution).fit(np.asarray(store.samples), store.labels)
+        recognizer.save(args.output)
+        print("Saved %s recognizer to %s" % (args.kind, args.output))
+    else:
+        benchmark(args.store, args.k, args.model, args.epochs, calibration.userProfile(args.profile))
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import argparse
+import datetime
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# letters of the Italian Sign Language alphabet, in the order used by the classifiers
+LABELS = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]
+
+NR_CHANNELS = 18 # 8 emg + 3 gyroscope + 3 acceleration + 4 orientation
+
+TIMESTAMP_FORMAT = "%d/%m/%y/%H:%M:%S" # format of the timestamps written by Acquisition.onConf
+
+DATASET_DIRECTORY = os.path.join(os.getcwd(), 'Dataset')
+STORE_DIRECTORY = os.path.join(os.getcwd(), 'Store')
+
+
+# returns the (gesture, path) pairs of all the samples in the dataset
+# gestures and files are sorted, so that the order is the same at every call
+def listSamples(path=DATASET_DIRECTORY):
+    samples = []
+    for gesture in sorted(os.listdir(path)):
+        gesture_directory = os.path.join(path, gesture)
+        if not os.path.isdir(gesture_directory):
+            continue
+        for file_name in sorted(os.listdir(gesture_directory)):
+            if file_name.endswith('.json'):
+                samples.append((gesture, os.path.join(gesture_directory, file_name)))
+    return samples
+
+
+# reads a json sample as saved by the Acquisition panel
+def loadSample(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# reads the fields written before the signals (e.g. timestamp) from the beginning of a json sample, without decoding the whole file
+# returns None for the fields that are not found
+def readHeader(path, fields=("timestamp",), size=256):
+    with open(path, 'r') as f:
+        head = f.read(size)
+    header = {}
+    for field in fields:
+        match = re.search(r'"%s":\s*"([^"]*)"' % field, head)
+        header[field] = match.group(1) if match is not None else None
+    return header
+
+
+# converts a json sample into a (rows x 18) matrix with the same column order used by Prediction.createArray
+# i.e. emg, gyroscope, acceleration, orientation
+def sampleToArray(data, dtype=np.float32):
+    emg = np.asarray(data["emg"]["data"], dtype=dtype).reshape(-1, 8)
+    imu = np.asarray([m["gyroscope"] + m["acceleration"] + m["orientation"] for m in data["imu"]["data"]], dtype=dtype).reshape(-1, NR_CHANNELS - 8)
+    rows = min(len(emg), len(imu))
+    return np.concatenate((emg[:rows], imu[:rows]), axis=1)
+
+
+# converts the whole dataset into a tensor store that can be memory-mapped
+# the json files are decoded one at a time, so the memory usage does not depend on the size of the dataset
+# the store is made of:
+#  - samples.npy, a float32 tensor (samples x rows x 18)
+#  - labels.npy, the index of the gesture of each sample
+#  - index.json, the gesture names, the source files and the timestamps of the samples, and the files skipped because empty
+# the files are written as .tmp and renamed at the end, index.json last, so an interrupted build is never taken for a store
+def buildStore(dataset_path=DATASET_DIRECTORY, store_path=STORE_DIRECTORY, rows=400):
+    samples = listSamples(dataset_path)
+    gestures = sorted(set(gesture for gesture, _ in samples))
+
+    if not os.path.exists(store_path):
+        os.makedirs(store_path)
+
+    samples_path = os.path.join(store_path, 'samples.npy')
+    tensor = np.lib.format.open_memmap(samples_path + '.tmp', mode='w+', dtype=np.float32, shape=(len(samples), rows, NR_CHANNELS))
+    labels = np.empty(len(samples), dtype=np.int16)
+    files = []
+    timestamps = []
+    skipped = []
+
+    for gesture, path in samples:
+        data = loadSample(path)
+        array = sampleToArray(data)[:rows]
+        if len(array) == 0:
+            skipped.append(os.path.relpath(path, dataset_path))
+            continue
+        # shorter samples are padded with their last row
+        if len(array) < rows:
+            array = np.concatenate((array, np.repeat(array[-1:], rows - len(array), axis=0)))
+        tensor[len(files)] = array
+        labels[len(files)] = gestures.index(gesture)
+        files.append(os.path.relpath(path, dataset_path))
+        timestamps.append(data["timestamp"])
+
+    tensor.flush()
+    del tensor
+    if len(skipped) > 0:
+        # the rows of the skipped samples are left out of the tensor
+        full = np.load(samples_path + '.tmp', mmap_mode='r')
+        tensor = np.lib.format.open_memmap(samples_path + '.part', mode='w+', dtype=np.float32, shape=(len(files), rows, NR_CHANNELS))
+        tensor[:] = full[:len(files)]
+        tensor.flush()
+        del tensor, full
+        os.replace(samples_path + '.part', samples_path + '.tmp')
+        print("Skipped %d empty samples: %s" % (len(skipped), ", ".join(skipped)))
+
+    with open(os.path.join(store_path, 'labels.npy.tmp'), 'wb') as f:
+        np.save(f, labels[:len(files)])
+    with open(os.path.join(store_path, 'index.json.tmp'), 'w') as f:
+        json.dump({"labels": gestures, "files": files, "timestamps": timestamps, "skipped": skipped}, f)
+    for name in ('samples.npy', 'labels.npy', 'index.json'):
+        os.replace(os.path.join(store_path, name + '.tmp'), os.path.join(store_path, name))
+
+
+# True when the store does not contain the samples of the dataset: files added, removed or modified after the build
+def isStale(store_path=STORE_DIRECTORY, dataset_path=DATASET_DIRECTORY):
+    index_path = os.path.join(store_path, 'index.json')
+    if not os.path.isdir(dataset_path):
+        return False
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    paths = [path for _, path in listSamples(dataset_path)]
+    if sorted(os.path.relpath(path, dataset_path) for path in paths) != sorted(index["files"] + index.get("skipped", [])):
+        return True
+    built = os.path.getmtime(index_path)
+    return any(os.path.getmtime(path) > built for path in paths)
+
+
+# opens the tensor store, building it from the dataset if it does not exist yet or if the dataset has changed since
+# with a calibration profile (see calibration.py) the samples are calibrated with it
+def openStore(store_path=STORE_DIRECTORY, dataset_path=DATASET_DIRECTORY, profile=None):
+    if not os.path.exists(os.path.join(store_path, 'index.json')):
+        buildStore(dataset_path, store_path)
+    elif isStale(store_path, dataset_path):
+        print("The dataset has changed since the tensor store was built, rebuilding it")
+        buildStore(dataset_path, store_path)
+    store = TensorStore(store_path)
+    if profile is not None:
+        store.calibrate(profile)
+    return store
+
+
+# parses the timestamp of a sample
+def parseTimestamp(timestamp):
+    return datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+# returns the session of a sample, i.e. the day of the acquisition (dd/mm/yy)
+def sessionOf(timestamp):
+    return timestamp[:8]
+
+
+# stratified k-fold split: returns a list of (train indices, test indices)
+# the samples of each gesture are shuffled and spread evenly among the folds
+def kFolds(labels, k=5, seed=0):
+    labels = np.asarray(labels)
+    random = np.random.default_rng(seed)
+    fold_of = np.empty(len(labels), dtype=np.int64)
+    for label in np.unique(labels):
+        indices = random.permutation(np.flatnonzero(labels == label))
+        fold_of[indices] = np.arange(len(indices)) % k
+    return [(np.flatnonzero(fold_of != f), np.flatnonzero(fold_of == f)) for f in range(k)]
+
+
+# leave-one-session-out split: returns a list of (session, train indices, test indices)
+def sessionFolds(timestamps):
+    sessions = np.array([sessionOf(t) for t in timestamps])
+    folds = []
+    for session in sorted(set(sessions), key=lambda s: datetime.datetime.strptime(s, "%d/%m/%y")):
+        folds.append((session, np.flatnonzero(sessions != session), np.flatnonzero(sessions == session)))
+    return folds
+
+
+# read-only view over a tensor store built by buildStore
+# the samples are memory-mapped, so only the pages that are actually read are loaded from disk
+class TensorStore():
+
+    def __init__(self, path=STORE_DIRECTORY):
+        self.path = path
+        self.samples_path = os.path.join(path, 'samples.npy') # file backing the samples, a calibrated copy after calibrate
+        self.samples = np.load(self.samples_path, mmap_mode='r')
+        self.labels = np.load(os.path.join(path, 'labels.npy'))
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            index = json.load(f)
+        self.label_names = index["labels"]
+        self.files = index["files"]
+        self.timestamps = index["timestamps"]
+
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+
+    # replaces the samples with a copy calibrated with a profile, written once next to samples.npy
+    # the copy is memory-mapped like the samples, and is named after the fingerprint of the profile, so a new profile writes a new copy
+    def calibrate(self, profile, chunk=256):
+        path = os.path.join(self.path, 'calibrated_' + profile.fingerprint() + '.npy')
+        samples_path = os.path.join(self.path, 'samples.npy')
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(samples_path):
+            output = np.lib.format.open_memmap(path + '.part', mode='w+', dtype=np.float32, shape=self.samples.shape)
+            for start in range(0, len(self), chunk):
+                output[start:start + chunk] = profile.apply(self.samples[start:start + chunk])
+            output.flush()
+            del output
+            os.replace(path + '.part', path)
+        self.samples_path = path
+        self.samples = np.load(path, mmap_mode='r')
+
+
+    # returns the whole (rows x 18) sample, as a view on the memory-mapped file
+    def sample(self, sample_index):
+        return self.samples[sample_index]
+
+
+    # returns the gesture name of a sample
+    def label(self, sample_index):
+        return self.label_names[self.labels[sample_index]]
+
+
+
+# random access to fixed-length windows (crops) of the samples of a store
+# windows are strided views on the memory-mapped tensor, so reading a window never copies or allocates the data
+class WindowReader():
+
+    def __init__(self, store, length, step=1):
+        self.store = store
+        self.length = length
+        self.step = step
+
+        # (samples x windows x 18 x length) view, swapped to (samples x windows x length x 18)
+        views = sliding_window_view(store.samples, length, axis=1)
+        self.windows = views[:, ::step].swapaxes(2, 3)
+        self.nr_windows = self.windows.shape[1]
+
+
+    def __len__(self):
+        return self.windows.shape[0] * self.nr_windows
+
+
+    # returns the window of a sample starting at row "start"
+    # the result is a read-only view: copy it if it has to be modified
+    def window(self, sample_index, start, length=None):
+        if length is None:
+            length = self.length
+        # checked before any indexing, as negative starts would wrap around
+        if start < 0 or start + length > self.store.samples.shape[1]:
+            raise IndexError("window [%d, %d) out of range" % (start, start + length))
+        if length == self.length and start % self.step == 0:
+            return self.windows[sample_index, start // self.step]
+        return self.store.samples[sample_index, start:start + length]
+
+
+    # gathers a batch of windows into "out", which can be reused across batches
+    # starts are expressed in rows and must be multiples of the step
+    def batch(self, sample_indices, starts, out=None):
+        if out is None:
+            out = np.empty((len(sample_indices), self.length, self.windows.shape[3]), dtype=self.windows.dtype)
+        for k in range(len(sample_indices)):
+            out[k] = self.windows[sample_indices[k], starts[k] // self.step]
+        return out
+
+
+
+# shuffling sampler for a WindowReader
+# samples are grouped in blocks of contiguous samples, i.e. contiguous regions of the memory-mapped file
+# at every epoch the order of the blocks is shuffled and the windows are shuffled only inside each block,
+# so that the pages of a block stay in the page cache while its windows are read
+class BlockShuffleSampler():
+
+    def __init__(self, reader, block_size=32, sample_indices=None, seed=None):
+        self.reader = reader
+        self.block_size = block_size
+        if sample_indices is None:
+            sample_indices = np.arange(reader.windows.shape[0])
+        self.sample_indices = np.sort(np.asarray(sample_indices))
+        self.random = np.random.default_rng(seed)
+
+
+    def __len__(self):
+        return len(self.sample_indices) * self.reader.nr_windows
+
+
+    # yields (sample indices, starts) arrays of at most batch_size windows, covering every window once per epoch
+    def batches(self, batch_size):
+        blocks = [self.sample_indices[i:i + self.block_size] for i in range(0, len(self.sample_indices), self.block_size)]
+        pending_samples = np.empty(0, dtype=np.int64)
+        pending_starts = np.empty(0, dtype=np.int64)
+
+        for b in self.random.permutation(len(blocks)):
+            block = blocks[b]
+            samples = np.repeat(block, self.reader.nr_windows)
+            starts = np.tile(np.arange(self.reader.nr_windows) * self.reader.step, len(block))
+            order = self.random.permutation(len(samples))
+            pending_samples = np.concatenate((pending_samples, samples[order]))
+            pending_starts = np.concatenate((pending_starts, starts[order]))
+
+            while len(pending_samples) >= batch_size:
+                yield pending_samples[:batch_size], pending_starts[:batch_size]
+                pending_samples = pending_samples[batch_size:]
+                pending_starts = pending_starts[batch_size:]
+
+        if len(pending_samples) > 0:
+            yield pending_samples, pending_starts
+
+
+    # yields (sample index, start) pairs, one window at a time
+    def __iter__(self):
+        for samples, starts in self.batches(self.block_size * self.reader.nr_windows):
+            for i in range(len(samples)):
+                yield int(samples[i]), int(starts[i])
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts the json dataset into a memory-mapped tensor store")
+    parser.add_argument('--dataset', default=DATASET_DIRECTORY, help="dataset directory")
+    parser.add_argument('--store', default=STORE_DIRECTORY, help="output directory of the tensor store")
+    parser.add_argument('--rows', type=int, default=400, help="number of rows of each sample")
+    args = parser.parse_args()
+
+    buildStore(args.dataset, args.store, args.rows)
@@ -0,0 +1,295 @@
+import os
+import time
+import argparse
+import unicodedata
+import numpy as np
+
+import dataset
+
+
+# fingerspelling word decoder
+# the probability vectors of successive predictions (one per spelled letter) are decoded into words with a beam search:
+# a hypothesis is a node of a prefix trie of the lexicon, so only prefixes of real words are kept,
+# and its score adds the log-probability of each letter given by the recognizer and the log-probability of a letter n-gram model.
+# a step expands each of the beam_width hypotheses with the children of its node (at most one per letter),
+# so its cost does not depend on the size of the lexicon.
+# the trie is stored in compressed arrays (children of a node are contiguous), built once from a word list and saved as npz
+
+
+LEXICON_PATH = os.path.join(os.getcwd(), 'NeuralNetwork', 'lexicon.txt')
+
+END = 0 # symbol of the beginning and of the end of a word in the n-gram model; letters are 1..26
+
+
+# uppercase letters of a word without accents (e.g. "perché" -> "PERCHE"), None if it contains other characters
+def normalizeWord(word, alphabet):
+    word = unicodedata.normalize('NFD', word.strip()).encode('ascii', 'ignore').decode().upper()
+    if word == '' or any(c not in alphabet for c in word):
+        return None
+    return word
+
+
+# reads a word list with one word per line, optionally followed by its frequency
+# returns the normalized words, sorted, and their frequencies (the frequencies of words that normalize to the same letters are summed)
+def readWordList(path, alphabet=dataset.LABELS):
+    frequencies = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            word = normalizeWord(fields[0], alphabet)
+            if word is not None:
+                frequencies[word] = frequencies.get(word, 0.0) + (float(fields[1]) if len(fields) > 1 else 1.0)
+    words = sorted(frequencies.keys())
+    return words, np.array([frequencies[w] for w in words], dtype=np.float64)
+
+
+class Lexicon():
+
+    # words must be sorted; letters are indices in alphabet
+    def __init__(self, words, frequencies, alphabet=dataset.LABELS, order=3, smoothing=0.1):
+        self.alphabet = list(alphabet)
+        self.words = np.array(words)
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.order = order
+        self.buildTrie(words)
+        self.buildNgrams(words, smoothing)
+
+
+    # trie in compressed sparse row layout: the children of node n are edge_child[first[n]:first[n + 1]], reached with edge_letter
+    # terminal[n] is the index of the word ending at n (-1 if none), best[n] is the most frequent word below n
+    def buildTrie(self, words):
+        index = {letter: i for i, letter in enumerate(self.alphabet)}
+        parents = []
+        letters = []
+        terminal = [-1]
+        path = [0] # nodes of the previous word, words are sorted so a new word shares a prefix of this path
+        previous = ''
+        for w, word in enumerate(words):
+            common = 0
+            while common < min(len(word), len(previous)) and word[common] == previous[common]:
+                common = common + 1
+            del path[common + 1:]
+            for c in word[common:]:
+                parents.append(path[-1])
+                letters.append(index[c])
+                terminal.append(-1)
+                path.append(len(terminal) - 1)
+            terminal[path[-1]] = w
+            previous = word
+
+        nr_nodes = len(terminal)
+        parents = np.array(parents, dtype=np.int32)
+        order = np.argsort(parents, kind='stable') # node k (k >= 1) is the child of the edge k - 1
+        self.edge_child = (order + 1).astype(np.int32)
+        self.edge_letter = np.array(letters, dtype=np.int8)[order]
+        self.first = np.concatenate(([0], np.cumsum(np.bincount(parents, minlength=nr_nodes)))).astype(np.int32)
+        self.terminal = np.array(terminal, dtype=np.int32)
+
+        # children are created after their parent, so the nodes are visited in reverse order
+        best = np.where(self.terminal >= 0, self.terminal, -1)
+        weight = np.where(self.terminal >= 0, self.frequencies[np.maximum(self.terminal, 0)], -1.0)
+        for node in range(nr_nodes - 1, 0, -1):
+            parent = parents[node - 1]
+            if weight[node] > weight[parent]:
+                weight[parent] = weight[node]
+                best[parent] = best[node]
+        self.best = best.astype(np.int32)
+
+
+    # letter n-gram model with add-k smoothing, weighted by the word frequencies
+    # log_probabilities[context, symbol], where context encodes the previous order - 1 symbols
+    def buildNgrams(self, words, smoothing):
+        size = len(self.alphabet) + 1
+        self.nr_contexts = size ** (self.order - 1)
+        counts = np.full((self.nr_contexts, size), smoothing)
+        index = {letter: i + 1 for i, letter in enumerate(self.alphabet)}
+        weights = np.log1p(self.frequencies) # frequent words count more, but do not dominate the model
+        for word, weight in zip(words, weights):
+            context = 0
+            for symbol in [index[c] for c in word] + [END]:
+                counts[context, symbol] += weight
+                context = self.nextContext(context, symbol)
+        self.log_probabilities = np.log(counts / counts.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+    def nextContext(self, context, symbol):
+        return (context * (len(self.alphabet) + 1) + symbol) % self.nr_contexts
+
+
+    def __len__(self):
+        return len(self.words)
+
+
+    def save(self, path):
+        np.savez(path, alphabet=np.array(self.alphabet), words=self.words, frequencies=self.frequencies, order=self.order,
+                 edge_child=self.edge_child, edge_letter=self.edge_letter, first=self.first, terminal=self.terminal, best=self.best,
+                 log_probabilities=self.log_probabilities)
+
+
+
+# loads a lexicon saved with Lexicon.save (.npz), or builds it from a word list
+def loadLexicon(path=LEXICON_PATH, alphabet=dataset.LABELS, order=3):
+    if not path.lower().endswith('.npz'):
+        words, frequencies = readWordList(path, alphabet)
+        return Lexicon(words, frequencies, alphabet, order)
+    lexicon = Lexicon.__new__(Lexicon)
+    with np.load(path) as f:
+        lexicon.alphabet = [str(a) for a in f["alphabet"]]
+        lexicon.words = f["words"]
+        lexicon.frequencies = f["frequencies"]
+        lexicon.order = int(f["order"])
+        for name in ("edge_child", "edge_letter", "first", "terminal", "best", "log_probabilities"):
+            setattr(lexicon, name, f[name])
+    lexicon.nr_contexts = lexicon.log_probabilities.shape[0]
+    return lexicon
+
+
+
+# incremental beam search over the trie of a lexicon
+class WordDecoder():
+
+    def __init__(self, lexicon, beam_width=16, lm_weight=0.5, skip_penalty=4.0, floor=1e-4):
+        self.lexicon = lexicon
+        self.beam_width = beam_width
+        self.lm_weight = lm_weight
+        self.skip_log = -skip_penalty # a prediction can be skipped (e.g. a repeated or spurious gesture) with this log-penalty
+        self.floor = floor # minimum probability of a letter, so that a confident mistake of the recognizer does not remove a word
+        self.label_map = {}
+        self.reset()
+
+
+    # starts a new word
+    def reset(self):
+        self.nodes = np.zeros(1, dtype=np.int64)
+        self.scores = np.zeros(1)
+        self.contexts = np.zeros(1, dtype=np.int64)
+        self.steps = 0
+
+
+    # indices of the lexicon alphabet in the labels of a recognizer (-1 if a letter is not recognized)
+    def labelIndices(self, labels):
+        key = tuple(labels)
+        if key not in self.label_map:
+            self.label_map[key] = np.array([key.index(l) if l in key else -1 for l in self.lexicon.alphabet])
+        return self.label_map[key]
+
+
+    # adds the probability vector of a prediction, over the labels of the recognizer
+    def step(self, probabilities, labels=dataset.LABELS):
+        indices = self.labelIndices(labels)
+        probabilities = np.asarray(probabilities, dtype=np.float64).reshape(-1)
+        log_p = np.log(np.maximum(np.where(indices >= 0, probabilities[indices], 0), self.floor))
+
+        lexicon = self.lexicon
+        candidate_nodes = [self.nodes]
+        candidate_scores = [self.scores + self.skip_log]
+        candidate_contexts = [self.contexts]
+        for node, score, context in zip(self.nodes, self.scores, self.contexts):
+            start, end = lexicon.first[node], lexicon.first[node + 1]
+            if start == end:
+                continue
+            letters = lexicon.edge_letter[start:end].astype(np.int64)
+            candidate_nodes.append(lexicon.edge_child[start:end])
+            candidate_scores.append(score + log_p[letters] + self.lm_weight * lexicon.log_probabilities[context, letters + 1])
+            candidate_contexts.append((context * (len(lexicon.alphabet) + 1) + letters + 1) % lexicon.nr_contexts)
+
+        nodes = np.concatenate(candidate_nodes)
+        scores = np.concatenate(candidate_scores)
+        contexts = np.concatenate(candidate_contexts)
+        if len(scores) > self.beam_width:
+            keep = np.argpartition(-scores, self.beam_width - 1)[:self.beam_width]
+            nodes, scores, contexts = nodes[keep], scores[keep], contexts[keep]
+        order = np.argsort(-scores)
+        self.nodes, self.scores, self.contexts = nodes[order], scores[order], contexts[order]
+        self.steps = self.steps + 1
+
+
+    # word hypotheses as (word, score, complete), best first
+    # complete words are scored with the probability of ending the word; a prefix is completed with its most frequent word
+    def hypotheses(self, n=5):
+        lexicon = self.lexicon
+        results = {}
+        for node, score, context in zip(self.nodes, self.scores, self.contexts):
+            if lexicon.terminal[node] >= 0:
+                word = str(lexicon.words[lexicon.terminal[node]])
+                complete = score + self.lm_weight * lexicon.log_probabilities[context, END]
+                if word not in results or results[word][0] < complete:
+                    results[word] = (complete, True)
+            if node != 0 and lexicon.best[node] >= 0:
+                word = str(lexicon.words[lexicon.best[node]])
+                if word not in results:
+                    results[word] = (score, False)
+        ranked = sorted(results.items(), key=lambda item: (not item[1][1], -item[1][0]))
+        return [(word, float(score), complete) for word, (score, complete) in ranked[:n]]
+
+
+    # returns the best complete word (None if there is none) and starts a new word
+    def endWord(self):
+        complete = [h for h in self.hypotheses(self.beam_width) if h[2]]
+        self.reset()
+        return complete[0][0] if len(complete) > 0 else None
+
+
+
+# spells words of the lexicon with samples of the tensor store classified by a recognizer, and compares
+# the word accuracy of the decoder with the word accuracy of the argmax letters; reports the cost of a decoding step
+def evaluate(lexicon_path, model, weight=None, store_path=dataset.STORE_DIRECTORY, nr_words=200, beam_width=16, seed=0):
+    import recognizers
+    store = dataset.openStore(store_path)
+    classificator = recognizers.loadRecognizer(model, weight)
+    labels = list(getattr(classificator, 'labels', dataset.LABELS))
+    start = time.perf_counter()
+    lexicon = loadLexicon(lexicon_path)
+    print("%d words, %d trie nodes, loaded in %.2f s" % (len(lexicon), len(lexicon.terminal), time.perf_counter() - start))
+
+    random = np.random.default_rng(seed)
+    samples_of = {name: np.flatnonzero(store.labels == i) for i, name in enumerate(store.label_names)}
+    candidates = [i for i, w in enumerate(lexicon.words) if all(c in samples_of for c in str(w))]
+    decoder = WordDecoder(lexicon, beam_width)
+    argmax_correct = 0
+    decoder_correct = 0
+    times = []
+    for w in random.choice(candidates, min(nr_words, len(candidates)), replace=False):
+        word = str(lexicon.words[w])
+        windows = np.asarray(store.samples[[random.choice(samples_of[c]) for c in word]])
+        probabilities = np.asarray(classificator.predict(windows))
+        argmax_correct += ''.join(labels[i] for i in np.argmax(probabilities, axis=1)) == word
+        for p in probabilities:
+            start = time.perf_counter()
+            decoder.step(p, labels)
+            times.append((time.perf_counter() - start) * 1000)
+        decoder_correct += decoder.endWord() == word
+
+    total = min(nr_words, len(candidates))
+    print("word accuracy: argmax %.4f, decoder %.4f" % (argmax_correct / total, decoder_correct / total))
+    print("decoding step: median %.3f ms, p99 %.3f ms" % (np.median(times), np.percentile(times, 99)))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fingerspelling word decoder")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="builds the trie and the n-gram model of a word list")
+    build_parser.add_argument('words', help="word list, one word per line optionally followed by its frequency")
+    build_parser.add_argument('--output', default=os.path.splitext(LEXICON_PATH)[0] + '.npz')
+    build_parser.add_argument('--order', type=int, default=3, help="order of the letter n-gram model")
+
+    evaluate_parser = subparsers.add_parser('evaluate', help="spells words of the lexicon with samples of the dataset")
+    evaluate_parser.add_argument('lexicon', help="word list or lexicon (.npz)")
+    evaluate_parser.add_argument('model', help="architecture (json) file, or standalone .npz / .tflite model")
+    evaluate_parser.add_argument('weight', nargs='?', default=None)
+    evaluate_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    evaluate_parser.add_argument('--words', type=int, default=200, help="number of spelled words")
+    evaluate_parser.add_argument('--beam', type=int, default=16, help="beam width")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        lexicon = loadLexicon(args.words, order=args.order)
+        lexicon.save(args.output)
+        print("%d words, %d trie nodes, built in %.2f s, saved in %s" % (len(lexicon), len(lexicon.terminal), time.perf_counter() - start, args.output))
+    else:
+        evaluate(args.lexicon, args.model, args.weight, args.store, args.words, args.beam)
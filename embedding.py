@@ -0,0 +1,289 @@
+import os
+import time
+import argparse
+import numpy as np
+
+import dataset
+import classical
+import calibration
+
+
+# embeddings of the samples and a vector index for nearest-neighbour recognition
+# a sample is mapped to a fixed-length unit vector, either by the penultimate layer of a keras model
+# or by the time-domain features of classical.py projected on their principal components.
+# the vectors of the dataset are kept in an in-memory index; every sample saved by the Acquisition panel is inserted in it,
+# so a new gesture is recognized from its first samples, without training a model.
+# the index is saved as .npz (kind "index") and can be selected in the Testing panel like the classical recognizers
+# an index built on a calibrated dataset records the fingerprint of the profile, whose windows it must be queried with
+
+
+INDEX_PATH = os.path.join(os.getcwd(), 'NeuralNetwork', 'index.npz')
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+# classical features, standardized and projected on the first principal components of the dataset
+class FeatureEmbedder():
+
+    def __init__(self, dim=64, nr_segments=4):
+        self.dim = dim
+        self.nr_segments = nr_segments
+
+
+    def fit(self, windows):
+        features = classical.extractFeatures(windows, self.nr_segments)
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0) + 1e-6
+        _, _, vt = np.linalg.svd((features - self.mean) / self.std, full_matrices=False)
+        self.projection = vt[:self.dim].T.astype(np.float32)
+        return self
+
+
+    def __call__(self, windows):
+        features = (classical.extractFeatures(windows, self.nr_segments) - self.mean) / self.std
+        return normalize(features @ self.projection)
+
+
+    def arrays(self):
+        return {"embedder": "features", "dim": self.dim, "nr_segments": self.nr_segments, "mean": self.mean, "std": self.std, "projection": self.projection}
+
+
+
+# output of the penultimate layer of a keras model
+class KerasEmbedder():
+
+    def __init__(self, model, weight):
+        import recognizers
+        from keras.models import Model
+        self.model_path = model
+        self.weight_path = weight
+        classificator = recognizers.loadKerasModel(model, weight)
+        self.model = Model(inputs=classificator.inputs, outputs=classificator.layers[-2].output)
+
+
+    def __call__(self, windows):
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[np.newaxis]
+        return normalize(np.asarray(self.model.predict_on_batch(windows)).reshape(len(windows), -1))
+
+
+    def arrays(self):
+        return {"embedder": "keras", "model": self.model_path, "weight": self.weight_path}
+
+
+
+# exhaustive cosine-similarity index of unit vectors
+# the vectors are kept in a preallocated matrix whose capacity doubles when it is full, so an insert does not copy the index
+class VectorIndex():
+
+    def __init__(self, dim, capacity=1024):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.size = 0
+        self.labels = []
+        self.files = []
+
+
+    def __len__(self):
+        return self.size
+
+
+    def add(self, vectors, labels, files=None):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.size + len(vectors) > len(self.vectors):
+            capacity = max(2 * len(self.vectors), self.size + len(vectors))
+            grown = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size:self.size + len(vectors)] = vectors
+        self.size = self.size + len(vectors)
+        self.labels.extend(labels)
+        self.files.extend(files if files is not None else [''] * len(vectors))
+
+
+    # returns (similarities, indices) of the k nearest vectors of each query, most similar first
+    def search(self, queries, k=5):
+        if self.size == 0:
+            raise ValueError("the index is empty")
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, self.size)
+        similarities = queries @ self.vectors[:self.size].T
+        nearest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        nearest_similarities = np.take_along_axis(similarities, nearest, axis=1)
+        order = np.argsort(-nearest_similarities, axis=1)
+        return np.take_along_axis(nearest_similarities, order, axis=1), np.take_along_axis(nearest, order, axis=1)
+
+
+
+# recognizer on an index: the probability of a label is its share of the similarity-weighted votes of the k nearest samples
+# the labels are the gestures in the index, in order of insertion, so new gestures are added to them
+class IndexRecognizer():
+
+    def __init__(self, embedder, index, k=5, temperature=0.05, profile=None):
+        self.embedder = embedder
+        self.k = k
+        self.temperature = temperature
+        self.profile = profile # fingerprint of the calibration profile of the embedded samples, None for raw samples
+        self.setIndex(index)
+
+
+    def setIndex(self, index):
+        self.index = index
+        self.labels = []
+        self.label_of = {}
+        for label in index.labels:
+            self.addLabel(label)
+        self.label_indices = np.array([self.label_of[label] for label in index.labels], dtype=np.int32)
+
+
+    def addLabel(self, label):
+        if label not in self.label_of:
+            self.label_of[label] = len(self.labels)
+            self.labels.append(label)
+
+
+    # inserts samples (windows x rows x 18) of a gesture, e.g. an acquisition just saved
+    def insert(self, windows, label, files=None):
+        vectors = self.embedder(windows)
+        self.addLabel(label)
+        self.index.add(vectors, [label] * len(vectors), files)
+        self.label_indices = np.concatenate((self.label_indices, np.full(len(vectors), self.label_of[label], dtype=np.int32)))
+
+
+    # keeps the index consistent when a gesture is renamed or deleted in the Gestures List
+    def renameGesture(self, old, new):
+        if old not in self.label_of:
+            return
+        self.index.labels = [new if label == old else label for label in self.index.labels]
+        self.index.files = [new + f[len(old):] if label == new else f for label, f in zip(self.index.labels, self.index.files)]
+        self.labels[self.label_of[old]] = new
+        self.label_of[new] = self.label_of.pop(old)
+
+
+    def deleteGesture(self, gesture):
+        if gesture not in self.label_of:
+            return
+        keep = [i for i, label in enumerate(self.index.labels) if label != gesture]
+        index = VectorIndex(self.index.vectors.shape[1], len(self.index.vectors))
+        index.add(self.index.vectors[keep], [self.index.labels[i] for i in keep], [self.index.files[i] for i in keep])
+        self.setIndex(index)
+
+
+    def predict(self, windows):
+        similarities, nearest = self.index.search(self.embedder(windows), self.k)
+        weights = np.exp((similarities - similarities[:, :1]) / self.temperature)
+        probabilities = np.zeros((len(nearest), len(self.labels)), dtype=np.float32)
+        for i in range(len(nearest)):
+            np.add.at(probabilities[i], self.label_indices[nearest[i]], weights[i])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+    def save(self, path):
+        arrays = {"kind": "index", "k": self.k, "temperature": self.temperature, "profile": self.profile or '',
+                  "vectors": self.index.vectors[:self.index.size], "labels": np.array(self.index.labels), "files": np.array(self.index.files)}
+        arrays.update(self.embedder.arrays())
+        np.savez(path, **arrays)
+
+
+
+# loads an index saved with IndexRecognizer.save
+def loadIndex(path):
+    with np.load(path) as f:
+        if str(f["embedder"]) == "keras":
+            embedder = KerasEmbedder(str(f["model"]), str(f["weight"]))
+        else:
+            embedder = FeatureEmbedder(int(f["dim"]), int(f["nr_segments"]))
+            embedder.mean = f["mean"]
+            embedder.std = f["std"]
+            embedder.projection = f["projection"]
+        vectors = f["vectors"]
+        index = VectorIndex(vectors.shape[1], max(1024, 2 * len(vectors)))
+        index.add(vectors, [str(l) for l in f["labels"]], [str(p) for p in f["files"]])
+        profile = str(f["profile"]) if "profile" in f else ''
+        return IndexRecognizer(embedder, index, int(f["k"]), float(f["temperature"]), profile or None)
+
+
+# builds the index of all the samples of the tensor store, calibrated with the profile of that fingerprint if any
+def buildIndex(store, model=None, weight=None, dim=64, k=5, profile=None):
+    samples = np.asarray(store.samples)
+    embedder = KerasEmbedder(model, weight) if model is not None else FeatureEmbedder(dim).fit(samples)
+    vectors = np.concatenate([embedder(samples[i:i + 256]) for i in range(0, len(samples), 256)])
+    index = VectorIndex(vectors.shape[1], max(1024, 2 * len(vectors)))
+    index.add(vectors, [store.label_names[l] for l in store.labels], list(store.files))
+    return IndexRecognizer(embedder, index, k, profile=profile)
+
+
+# few-shot accuracy: for every fold, only "shots" samples per gesture of the training part are in the index
+# the embedder is fitted on the gestures that are not evaluated, as for a gesture enrolled after the training
+def fewShot(store, shots=5, k=5, dim=64, seed=0):
+    samples = np.asarray(store.samples)
+    random = np.random.default_rng(seed)
+    gestures = random.permutation(len(store.label_names))
+    held_out = set(gestures[:len(gestures) // 2].tolist())
+    known = np.array([l not in held_out for l in store.labels])
+    embedder = FeatureEmbedder(dim).fit(samples[known])
+
+    accuracies = []
+    for train, test in dataset.kFolds(store.labels, 5, seed):
+        test = test[~known[test]]
+        index = VectorIndex(dim)
+        for label in sorted(held_out):
+            members = random.permutation(train[store.labels[train] == label])[:shots]
+            index.add(embedder(samples[members]), [store.label_names[label]] * len(members))
+        recognizer = IndexRecognizer(embedder, index, min(k, shots))
+        predictions = np.argmax(recognizer.predict(samples[test]), axis=1)
+        accuracies.append(np.mean(np.array(recognizer.labels)[predictions] == np.array(store.label_names)[store.labels[test]]))
+    return float(np.mean(accuracies))
+
+
+# query latency of an index of "size" vectors, obtained by perturbing the vectors of the dataset
+def benchmark(recognizer, size=100000, repetitions=200, seed=0):
+    random = np.random.default_rng(seed)
+    base = recognizer.index.vectors[:recognizer.index.size]
+    index = VectorIndex(base.shape[1], size)
+    picks = random.integers(0, len(base), size)
+    index.add(normalize(base[picks] + 0.05 * random.standard_normal((size, base.shape[1])).astype(np.float32)), [recognizer.index.labels[p] for p in picks])
+    query = base[:1]
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        index.search(query, recognizer.k)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.median(times), np.percentile(times, 99)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Embedding index for nearest-neighbour recognition")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="builds the index of the dataset")
+    build_parser.add_argument('--output', default=INDEX_PATH)
+    build_parser.add_argument('--model', default=None, help="keras architecture (json) file, whose penultimate layer is the embedding")
+    build_parser.add_argument('--weight', default=None, help="keras weights file")
+    build_parser.add_argument('--dim', type=int, default=64, help="dimension of the feature embedding")
+    build_parser.add_argument('--k', type=int, default=5, help="number of neighbours")
+    build_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    build_parser.add_argument('--profile', default=None, help="user whose calibration profile is applied to the dataset, see calibration.py")
+
+    evaluate_parser = subparsers.add_parser('evaluate', help="few-shot accuracy and query latency")
+    evaluate_parser.add_argument('--shots', type=int, nargs='+', default=[1, 3, 5, 10])
+    evaluate_parser.add_argument('--size', type=int, default=100000, help="size of the index of the latency benchmark")
+    evaluate_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    evaluate_parser.add_argument('--profile', default=None, help="user whose calibration profile is applied to the dataset, see calibration.py")
+    args = parser.parse_args()
+
+    profile = calibration.userProfile(args.profile)
+    store = dataset.openStore(args.store, profile=profile)
+    if args.command == 'build':
+        recognizer = buildIndex(store, args.model, args.weight, args.dim, args.k, None if profile is None else profile.fingerprint())
+        recognizer.save(args.output)
+        print("Saved index of %d samples to %s" % (len(recognizer.index), args.output))
+    else:
+        for shots in args.shots:
+            print("%2d shots: accuracy %.4f on the gestures not seen by the embedder" % (shots, fewShot(store, shots)))
+        median, p99 = benchmark(buildIndex(store), args.size)
+        print("top-k query on %d vectors: median %.3f ms, p99 %.3f ms" % (args.size, median, p99))
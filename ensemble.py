@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import dataset
+import recognizers
+
+
+# ensemble of recognizers, e.g. an emg-only, an imu-only and a combined model, that vote on the same window
+# the members are loaded once and run concurrently in a thread pool (numpy, tensorflow and tflite release the GIL while they compute);
+# their probability vectors are averaged with the coefficient of each member, over the union of their labels.
+# the latency of every member is followed with an exponential moving average: with a latency budget, members that do not answer
+# within the budget are left out of the average of that prediction, and members whose average latency exceeds the budget are dropped.
+# a dropped member is probed again every probe_interval predictions, so a member slowed down only for a while comes back.
+# a member that raises an error is left out of the average of that prediction.
+# an ensemble is a json file ending in .ensemble.json, that can be selected in the Testing panel like a standalone model:
+#   {"budget_ms": 50,
+#    "members": [{"model": "classical.npz"},
+#                {"name": "emg", "model": "emg.json", "weight": "emg.h5", "channels": [0, 1, 2, 3, 4, 5, 6, 7], "coefficient": 2}]}
+# the paths of the members are relative to the directory of the ensemble file
+
+
+EXTENSION = '.ensemble.json'
+
+ROWS = 400 # rows of the windows of the Prediction panel, used to warm up the members
+
+
+def isEnsemble(model):
+    return model.lower().endswith(EXTENSION)
+
+
+# recognizer of an ensemble, with its coefficient and the channels of the window it takes (all of them by default)
+class Member():
+
+    def __init__(self, name, recognizer, coefficient=1.0, channels=None):
+        self.name = name
+        self.recognizer = recognizer
+        self.coefficient = coefficient
+        self.channels = None if channels is None else np.asarray(channels, dtype=np.intp)
+        self.labels = list(getattr(recognizer, 'labels', dataset.LABELS))
+        # keras models are called with predict_on_batch, which has not the overhead of predict on a single window
+        self.predict_function = getattr(recognizer, 'predict_on_batch', recognizer.predict)
+        self.latency = None # moving average of the latency in milliseconds
+        self.last_latency = None
+        self.active = True
+        self.error = None # last error raised by the member
+
+
+    def predict(self, windows):
+        if self.channels is not None:
+            windows = windows[..., self.channels]
+        return np.asarray(self.predict_function(windows), dtype=np.float32)
+
+
+
+class EnsembleRecognizer():
+
+    def __init__(self, members, budget_ms=None, smoothing=0.2, probe_interval=20):
+        self.members = members
+        self.budget_ms = budget_ms
+        self.smoothing = smoothing # weight of the last latency in the moving average
+        self.probe_interval = probe_interval
+        self.nr_predictions = 0
+        self.running = {} # future of the members still running after the end of a prediction
+
+        # columns of the labels of every member in the labels of the ensemble
+        self.labels = []
+        for member in members:
+            for label in member.labels:
+                if label not in self.labels:
+                    self.labels.append(label)
+        self.columns = [np.array([self.labels.index(label) for label in member.labels], dtype=np.intp) for member in members]
+
+        self.pool = ThreadPoolExecutor(max_workers=len(members), thread_name_prefix='ensemble')
+
+
+    # runs a member in the pool and records its latency
+    def run(self, member, windows):
+        start = time.perf_counter()
+        probabilities = member.predict(windows)
+        elapsed = (time.perf_counter() - start) * 1000
+        member.last_latency = elapsed
+        member.latency = elapsed if member.latency is None else (1 - self.smoothing) * member.latency + self.smoothing * elapsed
+        return probabilities
+
+
+    # one call of every member, so that the first predictions (e.g. the graph tracing of tensorflow) are not taken as latency
+    def warmUp(self, rows=ROWS):
+        window = np.zeros((1, rows, dataset.NR_CHANNELS), dtype=np.float32)
+        for member in self.members:
+            member.predict(window)
+
+
+    # members called in the next prediction: the active ones and, every probe_interval predictions, the dropped ones,
+    # whose average latency is measured anew; a member still running from a previous prediction is not called,
+    # so a member is never run by two threads at once
+    def selected(self):
+        self.running = {i: future for i, future in self.running.items() if not future.done()}
+        probe = self.probe_interval > 0 and self.nr_predictions % self.probe_interval == 0
+        selected = []
+        for i, member in enumerate(self.members):
+            if i in self.running or not (member.active or probe):
+                continue
+            if not member.active:
+                member.latency = None
+            selected.append(i)
+        return selected
+
+
+    def predict(self, windows):
+        windows = np.asarray(windows, dtype=np.float32)
+        self.nr_predictions = self.nr_predictions + 1
+        futures = {self.pool.submit(self.run, self.members[i], windows): i for i in self.selected()}
+        if len(futures) == 0:
+            raise RuntimeError("all the members of the ensemble are still running")
+
+        probabilities = np.zeros((len(windows), len(self.labels)), dtype=np.float32)
+        total = 0.0
+
+        # members that raise an error are left out
+        def add(done):
+            nonlocal total
+            for future in done:
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    self.members[i].error = error
+                    continue
+                self.members[i].error = None
+                probabilities[:, self.columns[i]] += self.members[i].coefficient * result
+                total = total + self.members[i].coefficient
+
+        done, pending = wait(futures, timeout=None if self.budget_ms is None else self.budget_ms / 1000)
+        add(done)
+        # when no member has answered within the budget, the next answers are waited for until one succeeds
+        while total == 0 and len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            add(done)
+
+        # the late members are left out of this prediction only
+        for future in pending:
+            self.running[futures[future]] = future
+
+        self.drop()
+        if total == 0:
+            raise RuntimeError("every member of the ensemble failed: " + "; ".join(str(self.members[i].error) for i in futures.values()))
+        return probabilities / total
+
+
+    # a member is active while its average latency is within the budget; the fastest member is always kept
+    def drop(self):
+        if self.budget_ms is None:
+            return
+        measured = sorted((m for m in self.members if m.latency is not None), key=lambda m: m.latency)
+        for rank, member in enumerate(measured):
+            member.active = rank == 0 or member.latency <= self.budget_ms
+
+
+    # all the members take part in the next predictions again, with their latency measured anew
+    def reset(self):
+        for member in self.members:
+            member.active = True
+            member.latency = None
+
+
+    # (name, moving average latency, last latency, active) of every member
+    def report(self):
+        return [(member.name, member.latency, member.last_latency, member.active) for member in self.members]
+
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+
+# loads the members of an ensemble file, warmed up
+def loadEnsemble(path, budget_ms=None):
+    with open(path, 'r') as f:
+        config = json.load(f)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    members = []
+    for entry in config["members"]:
+        model = os.path.join(directory, entry["model"])
+        weight = os.path.join(directory, entry["weight"]) if entry.get("weight") else None
+        name = entry.get("name", os.path.splitext(os.path.basename(entry["model"]))[0])
+        members.append(Member(name, recognizers.loadRecognizer(model, weight), entry.get("coefficient", 1.0), entry.get("channels")))
+
+    ensemble = EnsembleRecognizer(members, budget_ms if budget_ms is not None else config.get("budget_ms"))
+    ensemble.warmUp()
+    return ensemble
+
+
+# accuracy of every member and of the ensemble on the tensor store, and latency on single windows
+def evaluate(path, store_path, budget_ms=None, repetitions=100):
+    store = dataset.openStore(store_path)
+    samples = np.asarray(store.samples)
+    ensemble = loadEnsemble(path, budget_ms)
+
+    def accuracy(probabilities, labels):
+        names = np.array(labels)[np.argmax(probabilities, axis=1)]
+        return np.mean(names == np.array(store.label_names)[store.labels])
+
+    print("%-16s %10s %14s" % ("member", "accuracy", "median (ms)"))
+    for member in ensemble.members:
+        probabilities = np.concatenate([member.predict(samples[i:i + 256]) for i in range(0, len(samples), 256)])
+        times = []
+        for r in range(repetitions):
+            start = time.perf_counter()
+            member.predict(samples[r % len(samples)][np.newaxis])
+            times.append((time.perf_counter() - start) * 1000)
+        print("%-16s %10.4f %14.3f" % (member.name, accuracy(probabilities, member.labels), np.median(times)))
+
+    # the whole dataset without budget, then single windows as in the Prediction panel
+    budget_ms = ensemble.budget_ms
+    ensemble.budget_ms = None
+    probabilities = np.concatenate([ensemble.predict(samples[i:i + 256]) for i in range(0, len(samples), 256)])
+    ensemble.budget_ms = budget_ms
+    ensemble.reset()
+    times = []
+    for r in range(repetitions):
+        start = time.perf_counter()
+        ensemble.predict(samples[r % len(samples)][np.newaxis])
+        times.append((time.perf_counter() - start) * 1000)
+    print("%-16s %10.4f %14.3f   (p99 %.3f ms)" % ("ensemble", accuracy(probabilities, ensemble.labels), np.median(times), np.percentile(times, 99)))
+
+    if budget_ms is not None:
+        print("\nbudget %.1f ms" % budget_ms)
+        for name, latency, last_latency, active in ensemble.report():
+            # a member that never answered within the budget has no latency
+            latency = "n/a" if latency is None else "%.3f" % latency
+            print("%-16s %10s ms   %s" % (name, latency, "active" if active else "dropped"))
+    ensemble.close()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ensembles of recognizers")
+    parser.add_argument('ensemble', help="ensemble (" + EXTENSION + ") file")
+    parser.add_argument('--budget', type=float, default=None, help="latency budget in milliseconds, overrides the one of the file")
+    parser.add_argument('--repetitions', type=int, default=100, help="single-window predictions of the latency measure")
+    parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    args = parser.parse_args()
+
+    evaluate(args.ensemble, args.store, args.budget, args.repetitions)
@@ -0,0 +1,203 @@
+import os
+import json
+import argparse
+import multiprocessing
+import numpy as np
+
+import dataset
+
+
+# export of the dataset to standard machine learning formats: npz, hdf5, parquet and tfrecord
+# the samples are assigned to splits (by letter, by session or at random) and to fixed-size shards before any file is decoded;
+# the shards are then decoded by a process pool and written one at a time, so the memory usage is bounded by the shard size.
+# the members of every shard and every completed shard are recorded in a manifest: running the same command again resumes
+# a partial export, as long as the dataset has not changed in the meantime, which would move samples across the shards
+
+
+FORMATS = {"npz": ".npz", "hdf5": ".h5", "parquet": ".parquet", "tfrecord": ".tfrecord"}
+
+# reads the timestamp of a sample from the beginning of its file, without decoding the whole json
+def readTimestamp(path):
+    timestamp = dataset.readHeader(path)["timestamp"]
+    if timestamp is not None:
+        return timestamp
+    return dataset.loadSample(path)["timestamp"]
+
+
+# assigns the samples to the splits
+#  - "letter": a split for each gesture
+#  - "session": a split for each day of acquisition
+#  - "random": splits with the given fractions, e.g. {"train": 0.8, "test": 0.2}
+# returns a dict split -> list of (gesture, path)
+def assignSplits(samples, split, fractions=None, seed=0):
+    splits = {}
+    if split == "letter":
+        for gesture, path in samples:
+            splits.setdefault(gesture, []).append((gesture, path))
+    elif split == "session":
+        for gesture, path in samples:
+            session = dataset.sessionOf(readTimestamp(path)).replace('/', '-')
+            splits.setdefault(session, []).append((gesture, path))
+    else:
+        order = np.random.default_rng(seed).permutation(len(samples))
+        names = sorted(fractions.keys())
+        bounds = np.cumsum([fractions[n] for n in names]) / sum(fractions.values()) * len(samples)
+        start = 0
+        for name, bound in zip(names, np.round(bounds).astype(int)):
+            splits[name] = [samples[i] for i in sorted(order[start:bound])]
+            start = bound
+    return splits
+
+
+# returns the shards of the export as a list of (shard name, split, list of (gesture, path))
+def planShards(splits, shard_size):
+    shards = []
+    for split in sorted(splits.keys()):
+        members = splits[split]
+        for i, start in enumerate(range(0, len(members), shard_size)):
+            shards.append(("%s-%05d" % (split, i), split, members[start:start + shard_size]))
+    return shards
+
+
+# decodes a sample in a worker of the pool
+def decodeSample(task):
+    gesture, path, rows = task
+    data = dataset.loadSample(path)
+    array = dataset.sampleToArray(data)[:rows]
+    if len(array) < rows:
+        array = np.concatenate((array, np.repeat(array[-1:], rows - len(array), axis=0)))
+    return array, gesture, data["timestamp"], os.path.basename(path)
+
+
+def writeNpz(path, x, labels, timestamps, files):
+    with open(path, 'wb') as f:
+        np.savez(f, x=x, label=np.array(labels), timestamp=np.array(timestamps), source=np.array(files))
+
+
+def writeHdf5(path, x, labels, timestamps, files):
+    import h5py
+    with h5py.File(path, 'w') as f:
+        f.create_dataset("x", data=x, chunks=(1,) + x.shape[1:], compression="gzip")
+        f.create_dataset("label", data=np.array(labels, dtype="S"))
+        f.create_dataset("timestamp", data=np.array(timestamps, dtype="S"))
+        f.create_dataset("source", data=np.array(files, dtype="S"))
+
+
+def writeParquet(path, x, labels, timestamps, files):
+    import pyarrow
+    import pyarrow.parquet
+    table = pyarrow.table({
+        "label": labels,
+        "timestamp": timestamps,
+        "source": files,
+        "rows": [x.shape[1]] * len(x),
+        "data": pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(x.reshape(-1)), x.shape[1] * x.shape[2]),
+    })
+    pyarrow.parquet.write_table(table, path)
+
+
+def writeTFRecord(path, x, labels, timestamps, files):
+    import tensorflow as tf
+    with tf.io.TFRecordWriter(path) as writer:
+        for i in range(len(x)):
+            example = tf.train.Example(features=tf.train.Features(feature={
+                "data": tf.train.Feature(float_list=tf.train.FloatList(value=x[i].reshape(-1))),
+                "shape": tf.train.Feature(int64_list=tf.train.Int64List(value=x[i].shape)),
+                "label": tf.train.Feature(bytes_list=tf.train.BytesList(value=[labels[i].encode()])),
+                "timestamp": tf.train.Feature(bytes_list=tf.train.BytesList(value=[timestamps[i].encode()])),
+                "source": tf.train.Feature(bytes_list=tf.train.BytesList(value=[files[i].encode()])),
+            }))
+            writer.write(example.SerializeToString())
+
+
+WRITERS = {"npz": writeNpz, "hdf5": writeHdf5, "parquet": writeParquet, "tfrecord": writeTFRecord}
+
+
+def readManifest(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return None
+
+
+def writeManifest(path, manifest):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+# exports the dataset into output_path
+def export(dataset_path, output_path, file_format="npz", split="random", fractions=None, shard_size=256, rows=400, workers=None, seed=0):
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    manifest_path = os.path.join(output_path, 'manifest.json')
+
+    parameters = {"format": file_format, "split": split, "fractions": fractions, "shard_size": shard_size, "rows": rows, "seed": seed}
+    manifest = readManifest(manifest_path)
+    if manifest is not None and manifest["parameters"] != parameters:
+        raise ValueError("%s contains an export with different parameters: %s" % (output_path, manifest["parameters"]))
+    if manifest is None:
+        manifest = {"parameters": parameters, "shards": {}}
+
+    shards = planShards(assignSplits(dataset.listSamples(dataset_path), split, fractions, seed), shard_size)
+    plan = {name: [os.path.relpath(path, dataset_path).replace('\\', '/') for _, path in members] for name, _, members in shards}
+    if "plan" not in manifest:
+        if len(manifest["shards"]) > 0:
+            raise ValueError("%s contains an export without the members of its shards, which cannot be resumed: export to a new directory" % output_path)
+        manifest["plan"] = plan
+        writeManifest(manifest_path, manifest)
+    elif manifest["plan"] != plan:
+        raise ValueError("the dataset has changed since the export in %s was started, so its shards would not be the same: export to a new directory" % output_path)
+    pending = [shard for shard in shards if shard[0] not in manifest["shards"]]
+    print("%d shards, %d already exported" % (len(shards), len(shards) - len(pending)))
+
+    writer = WRITERS[file_format]
+    with multiprocessing.Pool(workers) as pool:
+        for name, split_name, members in pending:
+            x = np.empty((len(members), rows, dataset.NR_CHANNELS), dtype=np.float32)
+            labels = []
+            timestamps = []
+            files = []
+            tasks = [(gesture, path, rows) for gesture, path in members]
+            for i, (array, gesture, timestamp, file_name) in enumerate(pool.imap(decodeSample, tasks, chunksize=8)):
+                x[i] = array
+                labels.append(gesture)
+                timestamps.append(timestamp)
+                files.append(file_name)
+
+            # the shard is written under a temporary name, so a partial shard is never mistaken for a complete one
+            path = os.path.join(output_path, name + FORMATS[file_format])
+            writer(path + '.tmp', x, labels, timestamps, files)
+            os.replace(path + '.tmp', path)
+
+            manifest["shards"][name] = {"split": split_name, "samples": len(members), "file": os.path.basename(path)}
+            writeManifest(manifest_path, manifest)
+            print("Exported %s (%d samples)" % (name, len(members)))
+
+
+
+# parses fractions like "train=0.8,test=0.2"
+def parseFractions(text):
+    fractions = {}
+    for item in text.split(','):
+        name, value = item.split('=')
+        fractions[name.strip()] = float(value)
+    return fractions
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports the dataset to npz, hdf5, parquet or tfrecord shards")
+    parser.add_argument('output', help="output directory")
+    parser.add_argument('--format', choices=sorted(FORMATS.keys()), default='npz')
+    parser.add_argument('--split', choices=['letter', 'session', 'random'], default='random')
+    parser.add_argument('--fractions', default='train=0.8,test=0.2', help="fractions of the random split")
+    parser.add_argument('--shard-size', type=int, default=256, help="samples in each shard")
+    parser.add_argument('--rows', type=int, default=400, help="rows of each sample, shorter samples are padded")
+    parser.add_argument('--workers', type=int, default=None, help="decoding processes, by default the number of cpus")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dataset', default=dataset.DATASET_DIRECTORY, help="dataset directory")
+    args = parser.parse_args()
+
+    fractions = parseFractions(args.fractions) if args.split == 'random' else None
+    export(args.dataset, args.output, args.format, args.split, fractions, args.shard_size, args.rows, args.workers, args.seed)
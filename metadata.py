@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import argparse
+import numpy as np
+
+import dataset
+
+
+# metadata index of the dataset, in an sqlite database
+# for each sample it records gesture, date and time of the acquisition, session (day) and device,
+# so that the samples can be selected without opening the json files.
+# the Acquisition panel adds every saved sample; the samples already in the dataset are added by a backfill scan.
+# queries return the files of the samples or their indices in the tensor store, to be passed to the loaders
+
+
+INDEX_PATH = os.path.join(os.getcwd(), 'metadata.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    file TEXT PRIMARY KEY,
+    gesture TEXT NOT NULL,
+    recorded TEXT,
+    session TEXT,
+    device TEXT,
+    store_index INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_gesture ON samples (gesture, recorded);
+CREATE INDEX IF NOT EXISTS samples_recorded ON samples (recorded);
+CREATE INDEX IF NOT EXISTS samples_device ON samples (device, recorded);
+"""
+
+
+# converts a timestamp of the dataset (dd/mm/yy/HH:MM:SS) into the iso format used in the index, which sorts as a date
+def isoTimestamp(timestamp):
+    try:
+        return dataset.parseTimestamp(timestamp).isoformat(sep=' ')
+    except (TypeError, ValueError):
+        return None
+
+
+class MetadataIndex():
+
+    def __init__(self, path=INDEX_PATH, dataset_path=dataset.DATASET_DIRECTORY):
+        self.dataset_path = dataset_path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+
+    # adds or updates a sample; file is the path relative to the dataset directory (gesture/uuid.json)
+    def addSample(self, file, gesture, timestamp, device=None):
+        recorded = isoTimestamp(timestamp)
+        session = recorded[:10] if recorded is not None else None
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO samples (file, gesture, recorded, session, device) VALUES (?, ?, ?, ?, ?)", (file.replace('\\', '/'), gesture, recorded, session, device))
+
+
+    # keeps the index consistent when a gesture is renamed or deleted in the Gestures List
+    def renameGesture(self, old, new):
+        with self.connection:
+            self.connection.execute("UPDATE samples SET gesture = ?, file = ? || substr(file, ?) WHERE gesture = ?", (new, new, len(old) + 1, old))
+
+
+    def deleteGesture(self, gesture):
+        with self.connection:
+            self.connection.execute("DELETE FROM samples WHERE gesture = ?", (gesture,))
+
+
+    # adds the samples of the dataset that are not in the index yet, and removes the samples whose file no longer exists
+    # only the beginning of each file is read
+    def backfill(self):
+        known = set(row[0] for row in self.connection.execute("SELECT file FROM samples"))
+        present = set()
+        added = 0
+        for gesture, path in dataset.listSamples(self.dataset_path):
+            file = os.path.relpath(path, self.dataset_path).replace('\\', '/')
+            present.add(file)
+            if file not in known:
+                header = dataset.readHeader(path, ("timestamp", "device"))
+                if header["timestamp"] is None:
+                    header["timestamp"] = dataset.loadSample(path)["timestamp"]
+                self.addSample(file, gesture, header["timestamp"], header["device"])
+                added = added + 1
+
+        removed = known - present
+        with self.connection:
+            self.connection.executemany("DELETE FROM samples WHERE file = ?", [(file,) for file in removed])
+        return added, len(removed)
+
+
+    # records the index of every sample in a tensor store
+    def linkStore(self, store):
+        with self.connection:
+            self.connection.execute("UPDATE samples SET store_index = NULL")
+            self.connection.executemany("UPDATE samples SET store_index = ? WHERE file = ?", [(i, file.replace('\\', '/')) for i, file in enumerate(store.files)])
+
+
+    # returns the samples matching all the given filters, sorted by date
+    # since and until are dates or datetimes (or iso strings), until is exclusive
+    def query(self, gesture=None, since=None, until=None, device=None, session=None, columns="file, gesture, recorded, device, store_index"):
+        conditions = []
+        parameters = []
+        if gesture is not None:
+            conditions.append("gesture = ?")
+            parameters.append(gesture)
+        if since is not None:
+            conditions.append("recorded >= ?")
+            parameters.append(str(since))
+        if until is not None:
+            conditions.append("recorded < ?")
+            parameters.append(str(until))
+        if device is not None:
+            conditions.append("device = ?")
+            parameters.append(device)
+        if session is not None:
+            conditions.append("session = ?")
+            parameters.append(str(session))
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+        return self.connection.execute("SELECT " + columns + " FROM samples" + where + " ORDER BY recorded, file", parameters).fetchall()
+
+
+    # absolute paths of the matching samples, for the json loaders
+    def files(self, **filters):
+        return [os.path.join(self.dataset_path, row[0]) for row in self.query(columns="file", **filters)]
+
+
+    # indices in the tensor store of the matching samples, e.g. for TensorStore.samples or BlockShuffleSampler
+    # linkStore must have been called with the store
+    def storeIndices(self, **filters):
+        return np.array([row[0] for row in self.query(columns="store_index", **filters) if row[0] is not None], dtype=np.int64)
+
+
+    def close(self):
+        self.connection.close()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Metadata index of the dataset")
+    parser.add_argument('--index', default=INDEX_PATH, help="sqlite database")
+    parser.add_argument('--dataset', default=dataset.DATASET_DIRECTORY, help="dataset directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = subparsers.add_parser('backfill', help="adds the samples of the dataset to the index")
+    backfill_parser.add_argument('--store', default=None, help="tensor store whose indices are recorded in the index")
+
+    query_parser = subparsers.add_parser('query', help="lists the samples matching the filters")
+    query_parser.add_argument('--gesture')
+    query_parser.add_argument('--since', help="first date, e.g. 2020-07-01")
+    query_parser.add_argument('--until', help="date after the last one, e.g. 2020-08-01")
+    query_parser.add_argument('--device')
+    query_parser.add_argument('--session', help="day of acquisition, e.g. 2020-07-09")
+    query_parser.add_argument('--indices', action='store_true', help="prints the tensor store indices instead of the files")
+    args = parser.parse_args()
+
+    index = MetadataIndex(args.index, args.dataset)
+    if args.command == 'backfill':
+        added, removed = index.backfill()
+        print("%d samples added, %d removed" % (added, removed))
+        if args.store is not None:
+            index.linkStore(dataset.TensorStore(args.store))
+    else:
+        filters = dict(gesture=args.gesture, since=args.since, until=args.until, device=args.device, session=args.session)
+        if args.indices:
+            print(" ".join(str(i) for i in index.storeIndices(**filters)))
+        else:
+            for row in index.query(**filters):
+                print("%s\t%s\t%s\t%s" % row[:4])
+    index.close()
@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import numpy as np
+
+import dataset
+
+
+# drift and data-quality monitor of the recognition
+# every window classified by the Prediction panel is submitted with its probabilities and the battery level of the device;
+# submit only copies the window into a queue, the statistics are updated by a worker thread, so the inference path is not slowed down.
+# the monitor keeps constant-memory statistics of the recent windows (exponentially weighted, so old windows are forgotten):
+#  - per-channel mean and variance of the signal levels (absolute value of the emg, raw imu)
+#  - per-channel histogram of the window means over the deciles of the dataset, compared with the dataset by the population stability index
+#  - confidence (maximum probability) of the predictions and fraction of low-confidence predictions
+# and compares them with reference statistics computed once from the tensor store.
+# alerts (weak or flat emg channels, shifted distributions, low confidence, low battery) and periodic metrics are logged
+# the battery level is requested to the device every battery_interval_s by the worker, through the battery_request function
+
+
+NR_EMG = 8
+NR_BINS = 10 # the reference histogram of each channel has 10 bins of equal probability
+CHANNEL_NAMES = ["EMG " + str(c + 1) for c in range(NR_EMG)] + ["gyroscope " + a for a in "xyz"] + ["acceleration " + a for a in "xyz"] + ["orientation " + a for a in "xyzw"]
+
+REFERENCE_NAME = 'monitor.json' # reference statistics, in the tensor store directory
+
+MAX_REFERENCE_WINDOWS = 10000 # windows whose means give the deciles of the reference
+
+logger = logging.getLogger("monitor")
+file_handlers = {} # log path -> [handler, number of monitors writing to it], so a file is attached to the logger once
+
+
+# signal levels of a window (rows x 18) or of a batch: absolute value of the emg, raw imu
+def levels(windows):
+    windows = np.array(windows, dtype=np.float32)
+    windows[..., :NR_EMG] = np.abs(windows[..., :NR_EMG])
+    return windows
+
+
+# reference statistics of the dataset: per-channel mean and variance of the levels, deciles of the window means
+# the store is read in chunks, so the memory does not depend on its size: the mean and the variance are accumulated,
+# and the deciles are computed on the means of at most max_windows windows evenly spread over the store
+# if a recognizer is given, also the distribution of its confidence on the dataset
+def computeReference(store, recognizer=None, chunk=256, max_windows=MAX_REFERENCE_WINDOWS):
+    total = np.zeros(dataset.NR_CHANNELS)
+    squares = np.zeros(dataset.NR_CHANNELS)
+    nr_rows = 0
+    kept = np.unique(np.linspace(0, len(store) - 1, min(len(store), max_windows)).astype(np.int64))
+    window_means = []
+    for start in range(0, len(store), chunk):
+        samples = levels(store.samples[start:start + chunk]).astype(np.float64)
+        total += samples.sum(axis=(0, 1))
+        squares += (samples * samples).sum(axis=(0, 1))
+        nr_rows = nr_rows + samples.shape[0] * samples.shape[1]
+        indices = kept[(kept >= start) & (kept < start + len(samples))] - start
+        window_means.append(samples[indices].mean(axis=1))
+    mean = total / nr_rows
+    reference = {
+        "mean": mean.tolist(),
+        "var": np.maximum(squares / nr_rows - mean * mean, 0).tolist(),
+        "edges": np.percentile(np.concatenate(window_means), np.arange(1, NR_BINS) * 100 / NR_BINS, axis=0).T.tolist(),
+    }
+    if recognizer is not None:
+        predict = getattr(recognizer, 'predict_on_batch', recognizer.predict)
+        confidence = np.concatenate([np.asarray(predict(np.asarray(store.samples[i:i + 64]))).max(axis=1) for i in range(0, len(store), 64)])
+        reference["confidence"] = float(confidence.mean())
+    return reference
+
+
+# loads the reference statistics, computing them from the tensor store the first time
+def loadReference(store_path=dataset.STORE_DIRECTORY, recognizer=None):
+    path = os.path.join(store_path, REFERENCE_NAME)
+    if not os.path.exists(path) or recognizer is not None:
+        reference = computeReference(dataset.openStore(store_path), recognizer)
+        with open(path, 'w') as f:
+            json.dump(reference, f)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# population stability index between two histograms (channels x bins) of probabilities
+def stabilityIndex(observed, expected):
+    observed = np.maximum(observed, 1e-4)
+    expected = np.maximum(expected, 1e-4)
+    return ((observed - expected) * np.log(observed / expected)).sum(axis=-1)
+
+
+class DriftMonitor():
+
+    def __init__(self, reference=None, store_path=None, halflife=50, min_windows=10, confidence_threshold=0.5, battery_threshold=15,
+                 amplitude_range=(0.5, 2.0), psi_threshold=0.25, report_every=20, cooldown_s=60, log_path=None, queue_size=64,
+                 battery_request=None, battery_interval_s=60):
+        self.reference = reference
+        self.store_path = store_path # the reference is loaded from here by the worker, if not given
+        self.decay = 0.5 ** (1 / halflife) # weight of the past after each window
+        self.min_windows = min_windows
+        self.confidence_threshold = confidence_threshold
+        self.battery_threshold = battery_threshold
+        self.amplitude_range = amplitude_range
+        self.psi_threshold = psi_threshold
+        self.report_every = report_every
+        self.cooldown_s = cooldown_s
+        self.battery_request = battery_request
+        self.battery_interval_s = battery_interval_s
+        self.battery_requested = None # time of the last request of the battery level
+
+        self.logger = logger
+        self.logger.setLevel(logging.INFO)
+        self.log_path = None if log_path is None else os.path.abspath(log_path)
+        if self.log_path is not None:
+            if self.log_path not in file_handlers:
+                handler = logging.FileHandler(self.log_path)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+                self.logger.addHandler(handler)
+                file_handlers[self.log_path] = [handler, 0]
+            file_handlers[self.log_path][1] += 1
+
+        # exponentially weighted statistics; weight is the total weight, used to correct the bias of the first windows
+        self.count = 0
+        self.dropped = 0
+        self.weight = 0.0
+        self.mean = np.zeros(dataset.NR_CHANNELS)
+        self.square = np.zeros(dataset.NR_CHANNELS)
+        self.histogram = np.zeros((dataset.NR_CHANNELS, NR_BINS))
+        self.confidence = 0.0
+        self.low_confidence = 0.0
+        self.confidence_weight = 0.0
+        self.battery = None
+
+        self.alerts = {} # active alerts: key -> (message, time of the last log)
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+
+    # called on the inference path: the window is copied and queued, the statistics are updated by the worker
+    # when the worker is behind, the window is dropped rather than blocking the caller
+    def submit(self, window, probabilities=None, battery=None):
+        try:
+            self.queue.put_nowait((np.array(window, dtype=np.float32), None if probabilities is None else np.array(probabilities, dtype=np.float32), battery))
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+
+    # an error on a window is logged and the window is skipped, so the monitoring goes on
+    def run(self):
+        if self.reference is None and self.store_path is not None:
+            try:
+                self.reference = loadReference(self.store_path)
+            except Exception as e:
+                self.logger.warning("no reference statistics, only battery, flat channels and confidence are checked: %s", e)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.requestBattery()
+                self.update(*item)
+            except Exception:
+                self.logger.exception("monitoring of a window failed")
+
+
+    # asks the device for its battery level every battery_interval_s, the level comes with the next windows
+    def requestBattery(self):
+        now = time.monotonic()
+        if self.battery_request is None or (self.battery_requested is not None and now - self.battery_requested < self.battery_interval_s):
+            return
+        self.battery_requested = now
+        self.battery_request()
+
+
+    # updates the statistics with a window (rows x 18), the probabilities predicted for it and the battery level, then checks them
+    def update(self, window, probabilities=None, battery=None):
+        window = levels(window)
+        if window.ndim != 2 or window.shape[1] != dataset.NR_CHANNELS:
+            raise ValueError("a window is rows x %d, not %s" % (dataset.NR_CHANNELS, "x".join(map(str, window.shape))))
+        means = window.mean(axis=0)
+        variances = window.var(axis=0)
+
+        with self.lock:
+            d = self.decay
+            self.count = self.count + 1
+            self.weight = d * self.weight + (1 - d)
+            self.mean = d * self.mean + (1 - d) * means
+            self.square = d * self.square + (1 - d) * (means * means + variances)
+            if self.reference is not None:
+                bins = [np.searchsorted(edges, m) for edges, m in zip(self.reference["edges"], means)]
+                self.histogram = d * self.histogram
+                self.histogram[np.arange(dataset.NR_CHANNELS), bins] += 1 - d
+            if probabilities is not None:
+                confidence = float(np.max(probabilities))
+                self.confidence_weight = d * self.confidence_weight + (1 - d)
+                self.confidence = d * self.confidence + (1 - d) * confidence
+                self.low_confidence = d * self.low_confidence + (1 - d) * (confidence < self.confidence_threshold)
+            if battery is not None:
+                self.battery = battery
+
+        self.check(variances)
+        if self.count % self.report_every == 0:
+            self.logger.info("metrics %s", json.dumps(self.metrics()))
+
+
+    # current statistics, with the bias of the first windows corrected
+    def metrics(self):
+        with self.lock:
+            weight = max(self.weight, 1e-12)
+            mean = self.mean / weight
+            metrics = {"windows": self.count, "dropped": self.dropped, "battery": self.battery,
+                       "mean": np.round(mean, 4).tolist(), "var": np.round(np.maximum(self.square / weight - mean * mean, 0), 4).tolist()}
+            if self.confidence_weight > 0:
+                metrics["confidence"] = round(self.confidence / self.confidence_weight, 4)
+                metrics["low_confidence"] = round(self.low_confidence / self.confidence_weight, 4)
+            if self.reference is not None:
+                metrics["amplitude"] = np.round(mean[:NR_EMG] / np.maximum(self.reference["mean"][:NR_EMG], 1e-6), 3).tolist()
+                metrics["psi"] = np.round(stabilityIndex(self.histogram / weight, np.full(NR_BINS, 1 / NR_BINS)), 3).tolist()
+        return metrics
+
+
+    # compares the statistics with the reference and the thresholds, and raises or clears the alerts
+    def check(self, variances):
+        metrics = self.metrics()
+        ready = self.count >= self.min_windows
+        # the histograms need more windows than the means: they are compared after two half-lives
+        histogram_ready = self.weight > 0.75
+
+        for c in range(NR_EMG):
+            self.setAlert("flat %d" % c, variances[c] < 1e-6, "%s is flat: check the contact of the armband with the skin" % CHANNEL_NAMES[c])
+            if ready and "amplitude" in metrics:
+                ratio = metrics["amplitude"][c]
+                drifted = not self.amplitude_range[0] <= ratio <= self.amplitude_range[1]
+                self.setAlert("amplitude %d" % c, drifted, "%s amplitude is %d%% of the dataset: the armband may have moved" % (CHANNEL_NAMES[c], ratio * 100))
+            if histogram_ready and "psi" in metrics:
+                self.setAlert("psi %d" % c, metrics["psi"][c] > self.psi_threshold, "%s distribution shifted from the dataset (PSI %.2f)" % (CHANNEL_NAMES[c], metrics["psi"][c]))
+
+        if ready and "confidence" in metrics:
+            reference = self.reference.get("confidence", 1.0) if self.reference is not None else 1.0
+            low = metrics["confidence"] < min(self.confidence_threshold, reference) or metrics["low_confidence"] > 0.5
+            self.setAlert("confidence", low, "low prediction confidence (%.2f, %d%% of the predictions below %.2f)" % (metrics["confidence"], metrics["low_confidence"] * 100, self.confidence_threshold))
+
+        if self.battery is not None:
+            self.setAlert("battery", self.battery < self.battery_threshold, "battery level %d%%" % self.battery)
+
+
+    # logs an alert when it is raised, and again every cooldown_s while it stays active
+    def setAlert(self, key, active, message):
+        now = time.monotonic()
+        with self.lock:
+            if not active:
+                if key in self.alerts:
+                    del self.alerts[key]
+                    self.logger.info("resolved: %s", key)
+                return
+            previous = self.alerts.get(key)
+            if previous is not None and now - previous[1] < self.cooldown_s:
+                self.alerts[key] = (message, previous[1])
+                return
+            self.alerts[key] = (message, now)
+        self.logger.warning(message)
+
+
+    # messages of the active alerts, e.g. to show them in the app
+    def activeAlerts(self):
+        with self.lock:
+            return [message for message, _ in self.alerts.values()]
+
+
+    # processes the queued windows and stops the worker, waiting at most timeout seconds
+    # the log file is detached from the logger when no other monitor writes to it
+    def close(self, timeout=None):
+        self.queue.put(None)
+        self.worker.join(timeout)
+        if self.log_path is not None and self.log_path in file_handlers:
+            file_handlers[self.log_path][1] -= 1
+            if file_handlers[self.log_path][1] == 0:
+                handler = file_handlers.pop(self.log_path)[0]
+                self.logger.removeHandler(handler)
+                handler.close()
+            self.log_path = None
+
+
+
+# replays the dataset through the monitor, optionally with a simulated drift of the emg amplitude,
+# and reports the cost of submit on the inference path
+def replay(store_path, model=None, weight=None, gain=1.0, windows=200, seed=0):
+    store = dataset.openStore(store_path)
+    classificator = None
+    if model is not None:
+        import recognizers
+        classificator = recognizers.loadRecognizer(model, weight)
+    logging.basicConfig(format="%(levelname)s %(message)s")
+    monitor = DriftMonitor(loadReference(store_path), queue_size=windows)
+
+    indices = np.random.default_rng(seed).choice(len(store), windows)
+    times = []
+    for i in indices:
+        window = np.array(store.samples[i])
+        window[:, :NR_EMG] = window[:, :NR_EMG] * gain
+        probabilities = np.asarray(classificator.predict(window[np.newaxis]))[0] if classificator is not None else None
+        start = time.perf_counter()
+        monitor.submit(window, probabilities, battery=100)
+        times.append((time.perf_counter() - start) * 1e6)
+    monitor.close()
+
+    print("submit: median %.1f us, p99 %.1f us, %d windows dropped" % (np.median(times), np.percentile(times, 99), monitor.dropped))
+    print(json.dumps({key: value for key, value in monitor.metrics().items() if key not in ("mean", "var")}))
+    for message in monitor.activeAlerts():
+        print("alert: " + message)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drift and data-quality monitor")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reference_parser = subparsers.add_parser('reference', help="computes the reference statistics of the dataset")
+    reference_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    reference_parser.add_argument('--model', default=None, help="recognizer whose confidence on the dataset is recorded")
+    reference_parser.add_argument('--weight', default=None)
+
+    replay_parser = subparsers.add_parser('replay', help="replays the dataset through the monitor")
+    replay_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    replay_parser.add_argument('--model', default=None)
+    replay_parser.add_argument('--weight', default=None)
+    replay_parser.add_argument('--gain', type=float, default=1.0, help="gain applied to the emg, to simulate a drift")
+    replay_parser.add_argument('--windows', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'reference':
+        recognizer = None
+        if args.model is not None:
+            import recognizers
+            recognizer = recognizers.loadRecognizer(args.model, args.weight)
+        reference = loadReference(args.store, recognizer)
+        print("reference statistics of %d channels saved in %s" % (len(reference["mean"]), os.path.join(args.store, REFERENCE_NAME)))
+    else:
+        replay(args.store, args.model, args.weight, args.gain, args.windows)
@@ -0,0 +1,181 @@
+import time
+import wx
+import numpy as np
+
+
+# live plot of the emg and imu streams of the Listener
+# the plot is drawn into a bitmap that scrolls: at every frame only the columns of the events received since the previous frame are drawn.
+# each column summarizes rows_per_column emg events with their minimum and maximum (decimation that keeps the peaks),
+# so the cost of a frame depends on the width of the plot and on the frame rate, not on the 200 Hz rate of the data.
+# frames are driven by a timer at a fixed rate, which is lowered when drawing exceeds the cpu budget, so the acquisition timers are not delayed
+
+
+FREQ_EMG = 200
+NR_EMG = 8
+MIN_FPS = 5
+
+EMG_RANGE = 128.0 # the emg values of the Myo Armband are in [-128, 127]
+IMU_LANES = [("Gyroscope", 0, 500.0), ("Acceleration", 3, 2.0)] # label, first column in the imu row, full scale (deg/s, g)
+
+BACKGROUND = wx.Colour(20, 20, 20)
+EMG_COLOUR = wx.Colour(80, 200, 120)
+AXIS_COLOURS = [wx.Colour(230, 80, 80), wx.Colour(80, 200, 120), wx.Colour(90, 140, 240)] # x, y, z
+LABEL_COLOUR = wx.Colour(200, 200, 200)
+
+
+# minimum and maximum of each column of rows (columns * rows_per_column x channels)
+def decimate(rows, rows_per_column):
+    columns = rows.reshape(-1, rows_per_column, rows.shape[1])
+    return columns.min(axis=1), columns.max(axis=1)
+
+
+class SignalPlot(wx.Panel):
+
+    def __init__(self, parent, listener, seconds=4, fps=25, budget=0.05, pos=wx.DefaultPosition, size=(560, 360)):
+        wx.Panel.__init__(self, parent=parent, pos=pos, size=size)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+
+        self.emg = listener.emg_stream
+        self.imu = listener.imu_stream
+        self.seconds = seconds # time shown in the plot
+        self.fps = fps
+        self.budget = budget # fraction of the cpu time that the plot can use
+        self.interval = 1000 / fps
+        self.cost = 0.0 # moving average of the time spent on a frame, in seconds
+        self.paint_time = 0.0
+
+        # next events to plot
+        self.emg_read = self.emg.count
+        self.imu_read = self.imu.count
+
+        self.labels = ["EMG " + str(c + 1) for c in range(NR_EMG)] + [lane[0] for lane in IMU_LANES]
+        self.emg_pen = wx.Pen(EMG_COLOUR)
+        self.axis_pens = [wx.Pen(colour) for colour in AXIS_COLOURS]
+        self.InitBuffer()
+
+        self.Bind(wx.EVT_PAINT, self.onPaint)
+        self.Bind(wx.EVT_SIZE, self.onSize)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.onDestroy)
+
+        self.frame_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onFrame, self.frame_timer)
+        self.frame_timer.Start(int(self.interval))
+
+
+    # creates the bitmap of the plot for the current size of the panel
+    def InitBuffer(self):
+        width, height = self.GetClientSize()
+        self.backbuffer = wx.Bitmap(max(width, 1), max(height, 1))
+        self.rows_per_column = max(1, int(round(self.seconds * FREQ_EMG / max(width, 1))))
+        self.lane_height = max(height, 1) / len(self.labels)
+        self.centres = (np.arange(len(self.labels)) + 0.5) * self.lane_height
+
+        dc = wx.MemoryDC(self.backbuffer)
+        dc.SetBackground(wx.Brush(BACKGROUND))
+        dc.Clear()
+        dc.SelectObject(wx.NullBitmap)
+
+
+    def onSize(self, e):
+        self.InitBuffer()
+        self.Refresh(False)
+        e.Skip()
+
+
+    def onDestroy(self, e):
+        if e.GetEventObject() is self:
+            self.frame_timer.Stop()
+        e.Skip()
+
+
+    # reads the events received since the previous frame and draws the complete columns
+    def onFrame(self, e):
+        start = time.perf_counter()
+        width = self.backbuffer.GetWidth()
+
+        # the events that do not fit in the plot, or that have already been overwritten in the stream, are skipped
+        stop = self.emg.count
+        self.emg_read = max(self.emg_read, stop - min(self.emg.capacity, width * self.rows_per_column))
+        columns = (stop - self.emg_read) // self.rows_per_column
+
+        if columns > 0:
+            end = self.emg_read + columns * self.rows_per_column
+            low, high = decimate(self.emg.slice(self.emg_read, end), self.rows_per_column)
+            self.emg_read = end
+
+            # the imu (50 Hz) is shown with the range of the events received during the frame
+            imu = self.imu.slice(self.imu_read, self.imu.count)
+            self.imu_read = self.imu.count
+            if len(imu) == 0:
+                imu = self.imu.latest()[0][np.newaxis]
+
+            self.draw(columns, low, high, imu.min(axis=0), imu.max(axis=0))
+            self.Refresh(False)
+
+        self.adapt(time.perf_counter() - start)
+
+
+    # scrolls the bitmap by the new columns and draws only them
+    def draw(self, columns, low, high, imu_low, imu_high):
+        width, height = self.backbuffer.GetWidth(), self.backbuffer.GetHeight()
+        dc = wx.MemoryDC(self.backbuffer)
+        dc.Blit(0, 0, width - columns, height, dc, columns, 0)
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.Brush(BACKGROUND))
+        dc.DrawRectangle(width - columns, 0, columns, height)
+
+        half = self.lane_height * 0.45
+        x = np.arange(width - columns, width)
+
+        # emg: a vertical segment from the minimum to the maximum of each column, in the lane of each channel
+        top = self.centres[:NR_EMG] - np.clip(high / EMG_RANGE, -1, 1) * half
+        bottom = self.centres[:NR_EMG] - np.clip(low / EMG_RANGE, -1, 1) * half + 1
+        xs = np.repeat(x[:, np.newaxis], NR_EMG, axis=1)
+        dc.DrawLineList(np.stack((xs, top, xs, bottom), axis=-1).reshape(-1, 4).astype(int).tolist(), self.emg_pen)
+
+        # imu: the three axes of gyroscope and acceleration, overlapped in their lane
+        for lane, (label, first, scale) in enumerate(IMU_LANES):
+            centre = self.centres[NR_EMG + lane]
+            for axis in range(3):
+                top = int(centre - np.clip(imu_high[first + axis] / scale, -1, 1) * half)
+                bottom = int(centre - np.clip(imu_low[first + axis] / scale, -1, 1) * half) + 1
+                dc.DrawLineList([(int(c), top, int(c), bottom) for c in x], self.axis_pens[axis])
+
+        dc.SelectObject(wx.NullBitmap)
+
+
+    def onPaint(self, e):
+        start = time.perf_counter()
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.DrawBitmap(self.backbuffer, 0, 0)
+        dc.SetTextForeground(LABEL_COLOUR)
+        dc.SetFont(wx.Font(7, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+        for lane, label in enumerate(self.labels):
+            dc.DrawText(label, 2, int(lane * self.lane_height))
+        self.paint_time = self.paint_time + time.perf_counter() - start
+
+
+    # keeps the plot within its cpu budget: the frame rate is halved when a frame costs more than budget x interval,
+    # and restored when frames are well below it
+    def adapt(self, elapsed):
+        self.cost = 0.9 * self.cost + 0.1 * (elapsed + self.paint_time)
+        self.paint_time = 0.0
+        allowed = self.budget * self.interval / 1000
+        if self.cost > allowed and self.interval < 1000 / MIN_FPS:
+            self.interval = self.interval * 2
+            self.frame_timer.Start(int(self.interval))
+        elif self.cost < allowed / 4 and self.interval > 1000 / self.fps:
+            self.interval = self.interval / 2
+            self.frame_timer.Start(int(self.interval))
+
+
+
+# window with the live plot, opened from the Acquisition panel
+class SignalWindow(wx.Frame):
+
+    def __init__(self, parent, listener):
+        wx.Frame.__init__(self, parent, title='Signals', size=(600, 420), style=wx.DEFAULT_FRAME_STYLE | wx.FRAME_FLOAT_ON_PARENT)
+        self.plot = SignalPlot(self, listener)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.plot, 1, wx.EXPAND)
+        self.SetSizer(sizer)
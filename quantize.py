@@ -0,0 +1,205 @@
+import os
+import gzip
+import time
+import argparse
+import numpy as np
+
+import dataset
+import recognizers
+
+
+# export of smaller and faster variants of a keras model (architecture json + weights), as uploaded in the Testing panel:
+#  - "pruned": the model is fine-tuned while the smallest weights of every kernel are gradually set to zero,
+#    then exported as a float tensorflow lite model; the zeros make the file much smaller once compressed (.tflite.gz)
+#  - "dynamic": tensorflow lite model with int8 weights and float activations
+#  - "int8": tensorflow lite model with int8 weights and activations, calibrated on samples of the dataset
+# pruning and quantization are separate variants, so the report shows the effect of each one
+# the fine-tuning and the calibration use the training part of the dataset, and every variant is validated against the original model
+# on the held-out part: the test files of the training of the model if given, otherwise a fold of the dataset, on which the original
+# model may have been trained, so that its accuracy is a training-set figure
+# the .tflite variants can be selected in the Testing panel as model file, without a weight file
+
+
+# sparsity at a point (0 to 1) of the fine-tuning: it grows from 0 to the final sparsity along a cubic curve
+# (gradual magnitude pruning), fast at the beginning, when many weights are redundant, and slowly at the end
+def pruningSchedule(progress, sparsity):
+    return sparsity * (1 - (1 - min(progress, 1.0)) ** 3)
+
+
+# (layer, mask) of every kernel of the model, the mask keeping the weights with the largest magnitude
+# biases and normalization parameters are not pruned
+def pruningMasks(classificator, sparsity):
+    masks = []
+    for layer in classificator.layers:
+        weights = layer.get_weights()
+        if len(weights) == 0 or weights[0].ndim < 2:
+            continue
+        threshold = np.quantile(np.abs(weights[0]), sparsity)
+        masks.append((layer, (np.abs(weights[0]) >= threshold).astype(weights[0].dtype)))
+    return masks
+
+
+# fine-tunes the model on (x, y) while pruning it to the fraction "sparsity" of zero weights in every kernel:
+# the masks follow pruningSchedule at every epoch and are applied after every batch, so the pruned weights stay at zero
+def pruneModel(classificator, sparsity, x, y, epochs=10, batch_size=32, learning_rate=1e-4):
+    from keras.callbacks import Callback
+    from keras.optimizers import Adam
+
+    class Pruning(Callback):
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.masks = pruningMasks(classificator, pruningSchedule((epoch + 1) / epochs, sparsity))
+            self.apply()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.apply()
+
+        def apply(self):
+            for layer, mask in self.masks:
+                weights = layer.get_weights()
+                weights[0] = weights[0] * mask
+                layer.set_weights(weights)
+
+    classificator.compile(optimizer=Adam(learning_rate), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    classificator.fit(x, y, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=[Pruning()])
+    return classificator
+
+
+# converts the model to tensorflow lite
+# with representative windows the whole model is quantized to int8, otherwise only the weights are; with quantize=False it stays float
+def convertTFLite(classificator, representative=None, quantize=True):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(classificator)
+    if not quantize:
+        return converter.convert()
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if representative is not None:
+        def representativeDataset():
+            for window in representative:
+                yield [window[np.newaxis].astype(np.float32)]
+        converter.representative_dataset = representativeDataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+# size in bytes of a model, summing the weight file if any
+def modelSize(model, weight=None):
+    size = os.path.getsize(model)
+    if weight is not None:
+        size = size + os.path.getsize(weight)
+    return size
+
+
+# size in bytes of a model compressed with gzip, e.g. to be distributed; the zeros of a pruned model are compressed away
+def compressedSize(model, weight=None):
+    size = 0
+    for path in (model, weight):
+        if path is not None:
+            with open(path, 'rb') as f:
+                size = size + len(gzip.compress(f.read()))
+    return size
+
+
+# returns load time (ms), accuracy on the dataset, median latency (ms) of a single window and the predictions
+def evaluate(model, weight, samples, y, repetitions=50):
+    start = time.perf_counter()
+    classificator = recognizers.loadRecognizer(model, weight)
+    load_time = (time.perf_counter() - start) * 1000
+
+    predict = getattr(classificator, 'predict_on_batch', classificator.predict)
+    predictions = np.concatenate([np.asarray(predict(samples[i:i + 64])) for i in range(0, len(samples), 64)])
+    accuracy = float(np.mean(np.argmax(predictions, axis=1) == y))
+
+    window = samples[:1]
+    predict(window) # warm up
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        predict(window)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return load_time, accuracy, float(np.median(times)), predictions
+
+
+# held-out samples of the store: the files listed in test_files (one path relative to the dataset per line, e.g. gesture/uuid.json),
+# held out when the model was trained, or else the first of 5 folds; returns (train, test, held out at training time)
+def heldOut(store, test_files=None):
+    if test_files is None:
+        return dataset.kFolds(store.labels, 5)[0] + (False,)
+    with open(test_files, 'r') as f:
+        held_out = set(line.strip().replace('\\', '/') for line in f if line.strip())
+    test = np.array([file.replace('\\', '/') in held_out for file in store.files])
+    if not test.any():
+        raise ValueError("none of the files of %s is in the tensor store" % test_files)
+    return np.flatnonzero(~test), np.flatnonzero(test), True
+
+
+# exports the variants of the model in output_path and prints the report
+def export(model, weight, output_path, store_path, sparsity=0.5, calibration_samples=200, epochs=10, test_files=None):
+    store = dataset.openStore(store_path)
+    samples = np.asarray(store.samples)
+    # the keras models of the Testing panel classify the 26 letters in alphabetical order, samples of other gestures are left out
+    y = np.array([dataset.LABELS.index(l) if l in dataset.LABELS else -1 for l in store.label_names])[store.labels]
+    train, test, documented = heldOut(store, test_files)
+    train = train[y[train] >= 0]
+    test = test[y[test] >= 0]
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    name = os.path.splitext(os.path.basename(model))[0]
+    variants = [("original", model, weight)]
+
+    # pruned model, fine-tuned on the training part, kept in float; a gzip copy is written for distribution
+    pruned = pruneModel(recognizers.loadKerasModel(model, weight), sparsity, samples[train], y[train], epochs)
+    pruned_path = os.path.join(output_path, name + '_pruned.tflite')
+    with open(pruned_path, 'wb') as f:
+        f.write(convertTFLite(pruned, quantize=False))
+    with open(pruned_path, 'rb') as f, gzip.open(pruned_path + '.gz', 'wb') as compressed:
+        compressed.write(f.read())
+    variants.append(("pruned %d%%" % (sparsity * 100), pruned_path, None))
+
+    classificator = recognizers.loadKerasModel(model, weight)
+
+    dynamic_path = os.path.join(output_path, name + '_dynamic.tflite')
+    with open(dynamic_path, 'wb') as f:
+        f.write(convertTFLite(classificator))
+    variants.append(("dynamic", dynamic_path, None))
+
+    # calibration windows, spread over all the gestures
+    random = np.random.default_rng(0)
+    representative = samples[random.permutation(train)[:calibration_samples]]
+    int8_path = os.path.join(output_path, name + '_int8.tflite')
+    with open(int8_path, 'wb') as f:
+        f.write(convertTFLite(classificator, representative))
+    variants.append(("int8", int8_path, None))
+
+    if documented:
+        print("%d held-out samples of %s" % (len(test), test_files))
+    else:
+        print("%d samples of a fold of the dataset: the model may have been trained on them, so its accuracy is a training-set figure" % len(test))
+    print("%-12s %12s %12s %12s %14s %10s %12s %10s" % ("variant", "size (KB)", "gzip (KB)", "load (ms)", "latency (ms)", "accuracy", "delta", "agreement"))
+    reference = None
+    for variant, variant_model, variant_weight in variants:
+        load_time, accuracy, latency, predictions = evaluate(variant_model, variant_weight, samples[test], y[test])
+        if reference is None:
+            reference = (accuracy, np.argmax(predictions, axis=1))
+        agreement = np.mean(np.argmax(predictions, axis=1) == reference[1]) # same prediction of the original model
+        print("%-12s %12.1f %12.1f %12.1f %14.3f %10.4f %+12.4f %10.4f" % (variant, modelSize(variant_model, variant_weight) / 1024, compressedSize(variant_model, variant_weight) / 1024,
+                                                                         load_time, latency, accuracy, accuracy - reference[0], agreement))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports pruned and int8-quantized variants of a keras model")
+    parser.add_argument('model', help="keras architecture (json) file")
+    parser.add_argument('weight', help="keras weights file")
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), 'NeuralNetwork'), help="directory of the variants")
+    parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    parser.add_argument('--sparsity', type=float, default=0.5, help="fraction of the weights set to zero in the pruned variant")
+    parser.add_argument('--epochs', type=int, default=10, help="fine-tuning epochs of the pruned variant")
+    parser.add_argument('--calibration', type=int, default=200, help="number of samples used to calibrate the int8 variant")
+    parser.add_argument('--test-files', default=None, help="text file with the samples (gesture/uuid.json) held out when the model was trained")
+    args = parser.parse_args()
+
+    export(args.model, args.weight, args.output, args.store, args.sparsity, args.calibration, args.epochs, args.test_files)
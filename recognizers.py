@@ -0,0 +1,73 @@
+import json
+import numpy as np
+
+
+# loading of the recognizers that can be selected in the Testing panel
+# every recognizer exposes predict(batch of windows) -> one probability vector per window, like a keras model;
+# recognizers that are not trained on the 26 letters in alphabetical order also expose the list of their labels
+
+
+# returns True if the model file contains the whole recognizer, i.e. it does not need a weight file
+# an ensemble file refers to its members, with their weight files
+def isStandalone(model):
+    return model.lower().endswith(('.npz', '.tflite', '.ensemble.json'))
+
+
+# loads a keras model from an architecture (json) file and a weights file
+# keras is imported here, so that the classical recognizers can be used where tensorflow is not installed
+def loadKerasModel(model, weight):
+    from keras.models import model_from_json
+
+    with open(model, 'r') as f:
+        architecture = json.load(f)
+
+    classificator = model_from_json(json.dumps(architecture)) # upload architecture model
+    classificator.load_weights(weight) # upload weights
+    return classificator
+
+
+# tensorflow lite model, e.g. the quantized variants exported by quantize.py
+# tflite_runtime is enough to run it, otherwise the interpreter of tensorflow is used
+class TFLiteRecognizer():
+
+    def __init__(self, model):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=model)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+
+    def predict(self, windows):
+        windows = np.asarray(windows, dtype=self.input["dtype"])
+        # the tensors are reallocated only when the batch size changes
+        if self.interpreter.get_input_details()[0]["shape"][0] != len(windows):
+            self.interpreter.resize_tensor_input(self.input["index"], windows.shape)
+            self.interpreter.allocate_tensors()
+        self.interpreter.set_tensor(self.input["index"], windows)
+        self.interpreter.invoke()
+        return np.array(self.interpreter.get_tensor(self.output["index"]))
+
+
+
+# loads the recognizer stored in the model file, and in the weight file for keras models
+def loadRecognizer(model, weight=None):
+    if model.lower().endswith('.ensemble.json'):
+        import ensemble
+        return ensemble.loadEnsemble(model)
+    if model.lower().endswith('.tflite'):
+        return TFLiteRecognizer(model)
+    if isStandalone(model):
+        with np.load(model) as f:
+            kind = str(f["kind"])
+        if kind == "index":
+            import embedding
+            return embedding.loadIndex(model)
+        import classical
+        return classical.loadClassical(model)
+    return loadKerasModel(model, weight)
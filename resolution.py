@@ -0,0 +1,129 @@
+import os
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import dataset
+
+
+# multi-resolution representation of the samples
+# the acquisitions are sampled at 200 Hz, but many letters are recognized as well at a lower temporal resolution,
+# with a fraction of the compute. a sample (rows x 18) is represented at several levels:
+#  - "200", "100", "50": the signals low-pass filtered (windowed sinc) and decimated to that frequency
+#  - "summary": one row every SUMMARY_ROWS rows, with the mean absolute value of the emg and the mean of the imu channels
+# the levels of the tensor store are computed once and cached next to it, one row per sample
+
+
+FREQ = 200 # acquisition frequency of the dataset
+LEVELS = ["200", "100", "50", "summary"]
+SUMMARY_ROWS = 20 # rows summarized by a row of the summary level, i.e. 100 ms
+TAPS_PER_FACTOR = 8 # length of the low-pass filter, in output samples on each side
+
+NR_EMG = 8
+
+kernels = {}
+
+
+# low-pass filter for a decimation by factor: windowed sinc with the cutoff at the new Nyquist frequency
+def lowpassKernel(factor):
+    if factor not in kernels:
+        n = np.arange(2 * TAPS_PER_FACTOR * factor + 1) - TAPS_PER_FACTOR * factor
+        kernel = np.sinc(n / factor) * np.hamming(len(n))
+        kernels[factor] = (kernel / kernel.sum()).astype(np.float32)
+    return kernels[factor]
+
+
+# anti-aliased decimation of a sample (rows x 18) or of a batch (samples x rows x 18) along the rows
+# the filter is evaluated only at the kept rows, as a single matrix product over strided views; the edges are padded with the first and last row
+def downsample(array, factor):
+    array = np.asarray(array, dtype=np.float32)
+    if factor == 1:
+        return array
+    kernel = lowpassKernel(factor)
+    pad = len(kernel) // 2
+    padded = np.pad(array, [(0, 0)] * (array.ndim - 2) + [(pad, pad), (0, 0)], mode='edge')
+    windows = sliding_window_view(padded, len(kernel), axis=-2)[..., ::factor, :, :] # (... x rows / factor x 18 x taps)
+    return windows @ kernel
+
+
+# summary windows of a sample or of a batch: emg mean absolute value and imu mean of every SUMMARY_ROWS rows
+def summarize(array, rows=SUMMARY_ROWS):
+    array = np.asarray(array, dtype=np.float32)
+    nr_windows = array.shape[-2] // rows
+    windows = array[..., :nr_windows * rows, :].reshape(array.shape[:-2] + (nr_windows, rows, array.shape[-1]))
+    return np.concatenate((np.abs(windows[..., :NR_EMG]).mean(axis=-2), windows[..., NR_EMG:].mean(axis=-2)), axis=-1)
+
+
+# representation of a sample or of a batch at one level
+def transform(array, level):
+    if level == "summary":
+        return summarize(array)
+    return downsample(array, FREQ // int(level))
+
+
+# all the levels of a sample, e.g. of the array assembled by Prediction.createArray
+def pyramid(array, levels=LEVELS):
+    return {level: transform(array, level) for level in levels}
+
+
+# returns a level of the whole tensor store (samples x rows x 18), memory-mapped
+# the lower levels are computed in chunks and cached in the store directory, one cache for the raw samples and one for each calibrated copy
+# (e.g. pyramid_100_calibrated_<fingerprint>.npy); a cache is rebuilt when the samples it comes from are newer
+def loadLevel(store, level, chunk=256):
+    if level == str(FREQ):
+        return store.samples
+    source = os.path.splitext(os.path.basename(store.samples_path))[0]
+    name = 'pyramid_%s.npy' % level if source == 'samples' else 'pyramid_%s_%s.npy' % (level, source)
+    path = os.path.join(store.path, name)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(store.samples_path):
+        shape = transform(store.samples[:1], level).shape[1:]
+        cache = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32, shape=(len(store),) + shape)
+        for start in range(0, len(store), chunk):
+            cache[start:start + chunk] = transform(store.samples[start:start + chunk], level)
+        cache.flush()
+        del cache
+        os.replace(path + '.tmp', path)
+    return np.load(path, mmap_mode='r')
+
+
+# accuracy and latency of a classical recognizer at each level, with stratified k-fold cross-validation
+# the latency includes the computation of the level from a raw 200 Hz window, as in the Prediction panel
+def evaluate(store_path, levels=LEVELS, k=5, kind="lda"):
+    import classical
+    store = dataset.openStore(store_path)
+    window = np.asarray(store.samples[0])
+    print("%-10s %12s %10s %14s %14s" % ("level", "rows", "accuracy", "median (ms)", "p99 (ms)"))
+
+    for level in levels:
+        data = np.asarray(loadLevel(store, level))
+        accuracies = []
+        for train, test in dataset.kFolds(store.labels, k):
+            recognizer = classical.ClassicalRecognizer(kind, store.label_names).fit(data[train], store.labels[train])
+            accuracies.append(np.mean(np.argmax(recognizer.predict(data[test]), axis=1) == store.labels[test]))
+        recognizer.resolution = level
+        median, p99 = classical.measureLatency(recognizer.predict, window)
+        print("%-10s %12s %10.4f %14.3f %14.3f" % (level, "x".join(str(d) for d in data.shape[1:]), np.mean(accuracies), median, p99))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Multi-resolution representation of the samples")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    cache_parser = subparsers.add_parser('cache', help="computes the levels of the tensor store")
+    cache_parser.add_argument('--levels', nargs='+', choices=LEVELS, default=LEVELS)
+    cache_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help="reports accuracy and latency at each level")
+    evaluate_parser.add_argument('--levels', nargs='+', choices=LEVELS, default=LEVELS)
+    evaluate_parser.add_argument('--kind', choices=['lda', 'knn'], default='lda')
+    evaluate_parser.add_argument('--k', type=int, default=5, help="number of folds")
+    evaluate_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == 'cache':
+        store = dataset.openStore(args.store)
+        for level in args.levels:
+            print("%s: %s" % (level, loadLevel(store, level).shape))
+    else:
+        evaluate(args.store, args.levels, args.k, args.kind)
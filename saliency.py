@@ -0,0 +1,184 @@
+import os
+import zlib
+import struct
+import argparse
+import numpy as np
+
+import dataset
+import recognizers
+
+
+# occlusion saliency of a recognizer over the whole dataset
+# a part of a sample (a channel, a time block, or a group of channels in a time block) is replaced by the mean of the dataset,
+# and its attribution is the drop of the probability of the right letter.
+# all the occluded variants of a chunk of samples are built in a single array and classified with one large predict call,
+# so the job runs in a few hundred calls on CPU.
+# the attributions are averaged per letter and written as an npz file and as png heatmaps
+
+
+# groups of channels occluded together in the channel x time grid
+GROUPS = [("EMG " + str(c + 1), [c]) for c in range(8)] + [("Gyroscope", [8, 9, 10]), ("Acceleration", [11, 12, 13]), ("Orientation", [14, 15, 16, 17])]
+
+
+# rows of the time blocks of a window, from 1 row to the whole window
+def blockRows(block_ms, freq, rows):
+    block_rows = int(round(block_ms * freq / 1000))
+    if block_rows < 1:
+        raise ValueError("a block of %g ms is shorter than a row at %d Hz" % (block_ms, freq))
+    if block_rows > rows:
+        raise ValueError("a block of %g ms is longer than the window of %d rows at %d Hz" % (block_ms, rows, freq))
+    return block_rows
+
+
+# (start, end) rows of the time blocks of a window; the last block is shorter when the rows are not a multiple of block_rows
+def timeBlocks(rows, block_rows):
+    return [(start, min(start + block_rows, rows)) for start in range(0, rows, block_rows)]
+
+
+# boolean masks (perturbations x rows x 18) of the occluded parts:
+# every channel over the whole window, every time block over all the channels and, if grid is set, every group of channels in every time block
+def occlusionMasks(rows, block_rows, grid=True):
+    blocks = timeBlocks(rows, block_rows)
+    masks = []
+    for c in range(dataset.NR_CHANNELS):
+        mask = np.zeros((rows, dataset.NR_CHANNELS), dtype=bool)
+        mask[:, c] = True
+        masks.append(mask)
+    for start, end in blocks:
+        mask = np.zeros((rows, dataset.NR_CHANNELS), dtype=bool)
+        mask[start:end] = True
+        masks.append(mask)
+    if grid:
+        for _, channels in GROUPS:
+            for start, end in blocks:
+                mask = np.zeros((rows, dataset.NR_CHANNELS), dtype=bool)
+                mask[start:end, channels] = True
+                masks.append(mask)
+    return np.stack(masks)
+
+
+# attributions of a batch of samples (samples x rows x 18) for their labels y
+# returns (samples x perturbations) drops of probability and the probabilities of the original samples
+def occlude(predict, samples, y, masks, baseline, batch_size=2048):
+    nr_perturbations = len(masks) + 1
+    per_call = max(1, batch_size // nr_perturbations)
+    drops = np.empty((len(samples), len(masks)), dtype=np.float32)
+    probabilities = []
+    for start in range(0, len(samples), per_call):
+        chunk = samples[start:start + per_call]
+        # the original sample followed by its occluded variants
+        batch = np.empty((len(chunk), nr_perturbations) + chunk.shape[1:], dtype=np.float32)
+        batch[:] = chunk[:, np.newaxis]
+        np.copyto(batch[:, 1:], baseline, where=masks[np.newaxis])
+        output = np.asarray(predict(batch.reshape((-1,) + chunk.shape[1:]))).reshape(len(chunk), nr_perturbations, -1)
+        target = output[np.arange(len(chunk)), :, y[start:start + per_call]]
+        drops[start:start + len(chunk)] = target[:, :1] - target[:, 1:]
+        probabilities.append(output[:, 0])
+    return drops, np.concatenate(probabilities)
+
+
+# diverging colour map: blue for negative, white for zero, red for positive attributions
+def colourMap(values, limit):
+    v = np.clip(values / max(limit, 1e-9), -1, 1)[..., np.newaxis]
+    white = np.array([255, 255, 255], dtype=np.float32)
+    red = np.array([200, 30, 30], dtype=np.float32)
+    blue = np.array([30, 60, 200], dtype=np.float32)
+    return np.where(v >= 0, white + v * (red - white), white - v * (blue - white)).astype(np.uint8)
+
+
+# writes an rgb image (height x width x 3) as png, with zlib only
+def writePng(path, image):
+    height, width, _ = image.shape
+    raw = b"".join(b"\x00" + image[r].tobytes() for r in range(height))
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 9)))
+        f.write(chunk(b"IEND", b""))
+
+
+# writes a matrix as a heatmap with cells of cell x cell pixels
+def writeHeatmap(path, matrix, cell=16, limit=None):
+    if limit is None:
+        limit = np.abs(matrix).max()
+    image = colourMap(np.asarray(matrix, dtype=np.float32), limit)
+    writePng(path, np.repeat(np.repeat(image, cell, axis=0), cell, axis=1))
+
+
+# computes the attributions of a recognizer on the samples of the tensor store and writes them in output_path
+def analyze(model, weight, output_path, store_path, block_ms=200, grid=True, batch_size=2048, freq=200):
+    store = dataset.openStore(store_path)
+    rows = store.samples.shape[1]
+    block_rows = blockRows(block_ms, freq, rows)
+    nr_blocks = len(timeBlocks(rows, block_rows))
+
+    classificator = recognizers.loadRecognizer(model, weight)
+    predict = getattr(classificator, 'predict_on_batch', classificator.predict)
+    labels = list(getattr(classificator, 'labels', dataset.LABELS))
+    y = np.array([labels.index(l) if l in labels else -1 for l in store.label_names])[store.labels]
+
+    masks = occlusionMasks(rows, block_rows, grid)
+    baseline = np.asarray(store.samples).mean(axis=(0, 1)).astype(np.float32)
+    print("%d samples, %d perturbations each, %d samples per predict call" % (len(store), len(masks), max(1, batch_size // (len(masks) + 1))))
+
+    known = np.flatnonzero(y >= 0)
+    drops = np.zeros((len(store), len(masks)), dtype=np.float32)
+    correct = np.zeros(len(store), dtype=bool)
+    for start in range(0, len(known), 256):
+        indices = known[start:start + 256]
+        drops[indices], probabilities = occlude(predict, np.asarray(store.samples[indices]), y[indices], masks, baseline, batch_size)
+        correct[indices] = np.argmax(probabilities, axis=1) == y[indices]
+        print("%d/%d samples" % (start + len(indices), len(known)))
+
+    # averages per letter
+    names = store.label_names
+    channel = np.zeros((len(names), dataset.NR_CHANNELS), dtype=np.float32)
+    time = np.zeros((len(names), nr_blocks), dtype=np.float32)
+    cells = np.zeros((len(names), len(GROUPS), nr_blocks), dtype=np.float32)
+    accuracy = np.zeros(len(names), dtype=np.float32)
+    for l in range(len(names)):
+        members = np.flatnonzero((store.labels == l) & (y >= 0))
+        if len(members) == 0:
+            continue
+        mean = drops[members].mean(axis=0)
+        channel[l] = mean[:dataset.NR_CHANNELS]
+        time[l] = mean[dataset.NR_CHANNELS:dataset.NR_CHANNELS + nr_blocks]
+        if grid:
+            cells[l] = mean[dataset.NR_CHANNELS + nr_blocks:].reshape(len(GROUPS), nr_blocks)
+        accuracy[l] = correct[members].mean()
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    np.savez(os.path.join(output_path, 'attributions.npz'), labels=np.array(names), channel=channel, time=time, grid=cells,
+             accuracy=accuracy, groups=np.array([g[0] for g in GROUPS]), block_ms=block_ms, samples=drops, correct=correct)
+
+    # letters x channels and letters x time blocks, then a groups x time blocks map for each letter, with the same colour scale
+    writeHeatmap(os.path.join(output_path, 'channels.png'), channel)
+    writeHeatmap(os.path.join(output_path, 'time.png'), time)
+    if grid:
+        limit = np.abs(cells).max()
+        for l, name in enumerate(names):
+            writeHeatmap(os.path.join(output_path, name + '.png'), cells[l], limit=limit)
+
+    print("%-8s %10s   %s" % ("letter", "accuracy", "most important channels"))
+    channel_names = ["EMG " + str(c + 1) for c in range(8)] + ["gyro " + a for a in "xyz"] + ["acc " + a for a in "xyz"] + ["ori " + a for a in "xyzw"]
+    for l, name in enumerate(names):
+        top = np.argsort(channel[l])[::-1][:3]
+        print("%-8s %10.4f   %s" % (name, accuracy[l], ", ".join("%s (%.3f)" % (channel_names[c], channel[l, c]) for c in top)))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Occlusion saliency of a recognizer over the dataset")
+    parser.add_argument('model', help="architecture (json) file, or standalone .npz / .tflite model")
+    parser.add_argument('weight', nargs='?', default=None, help="weights file of keras models")
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), 'Saliency'), help="directory of the attributions and heatmaps")
+    parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    parser.add_argument('--block', type=int, default=200, help="length of the occluded time blocks in milliseconds")
+    parser.add_argument('--no-grid', action='store_true', help="only occludes whole channels and whole time blocks")
+    parser.add_argument('--batch-size', type=int, default=2048, help="windows in each predict call")
+    args = parser.parse_args()
+
+    analyze(args.model, args.weight, args.output, args.store, args.block, not args.no_grid, args.batch_size)
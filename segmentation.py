@@ -0,0 +1,236 @@
+import os
+import json
+import argparse
+import numpy as np
+
+import dataset
+
+
+# gesture onset/offset detection on the emg envelope and on the imu motion
+# OnsetDetector runs incrementally, one row at a time, on the live stream of the Myo Armband, and LiveSegmenter uses it
+# to align the acquisitions of the app on the gesture; segmentArray runs it on a whole sample and is used to re-segment the dataset offline
+
+
+ONSET = "onset"
+OFFSET = "offset"
+
+
+class OnsetDetector():
+
+    def __init__(self, freq=200, envelope_ms=50, baseline_ms=300, onset_ratio=3.0, offset_ratio=2.0, min_envelope=4.0, motion_threshold=20.0, onset_ms=25, hold_ms=150):
+        self.alpha = 1 - np.exp(-1000 / (envelope_ms * freq)) # smoothing of the envelopes
+        self.baseline_alpha = 1 - np.exp(-1000 / (baseline_ms * freq)) # adaptation of the rest level
+        self.onset_ratio = onset_ratio # envelope / rest level that starts a gesture
+        self.offset_ratio = offset_ratio # envelope / rest level under which the gesture may end
+        self.min_envelope = min_envelope # emg envelope always considered active
+        self.motion_threshold = motion_threshold # gyroscope magnitude (deg/s) considered motion
+        self.onset_rows = max(1, int(onset_ms * freq / 1000)) # active rows needed to start a gesture
+        self.hold_rows = max(1, int(hold_ms * freq / 1000)) # inactive rows needed to end a gesture
+        self.reset()
+
+
+    def reset(self):
+        self.envelope = None
+        self.baseline = None
+        self.motion = 0.0
+        self.active = False
+        self.count = 0 # consecutive rows against the current state
+        self.row = 0
+
+
+    # processes a row of the stream: 8 emg values and the 3 gyroscope values (None if not available yet)
+    # returns ONSET or OFFSET when the state changes, None otherwise
+    def update(self, emg, gyroscope=None):
+        level = float(np.abs(np.asarray(emg, dtype=np.float32)).mean()) if len(emg) > 0 else 0.0
+        if self.envelope is None:
+            self.envelope = level
+            self.baseline = max(level, 1.0)
+        self.envelope = self.envelope + self.alpha * (level - self.envelope)
+        if gyroscope is not None:
+            self.motion = self.motion + self.alpha * (float(np.linalg.norm(gyroscope)) - self.motion)
+        self.row = self.row + 1
+
+        ratio = self.envelope / self.baseline
+        moving = self.motion > self.motion_threshold
+        if self.active:
+            active = ratio > self.offset_ratio or self.envelope > self.min_envelope or moving
+        else:
+            active = (ratio > self.onset_ratio and self.envelope > self.min_envelope) or moving
+            # the rest level follows the signal only while no gesture is performed
+            self.baseline = max(self.baseline + self.baseline_alpha * (self.envelope - self.baseline), 1.0)
+
+        if active == self.active:
+            self.count = 0
+            return None
+
+        self.count = self.count + 1
+        if self.active and self.count >= self.hold_rows:
+            self.active = False
+            self.count = 0
+            return OFFSET
+        if not self.active and self.count >= self.onset_rows:
+            self.active = True
+            self.count = 0
+            return ONSET
+        return None
+
+
+
+# live segmentation of an acquisition in auto mode, one row at a time
+# before the onset only the last "history" rows are kept (the pre-roll); after it the rows are recorded until the offset,
+# and then until a window of "length" rows centred on the gesture is complete, or until "capacity" rows have been recorded.
+# the positions are rows of the recording, whose first row is the first row of the pre-roll
+class LiveSegmenter():
+
+    def __init__(self, freq=200, length=400, history=200, capacity=800, **parameters):
+        self.detector = OnsetDetector(freq, **parameters)
+        self.length = length
+        self.history = history
+        self.capacity = capacity
+        self.rows = 0 # rows of the recording
+        self.start = None
+        self.end = None
+
+
+    # processes a row like OnsetDetector.update and returns its events
+    def update(self, emg, gyroscope=None):
+        event = self.detector.update(emg, gyroscope)
+        if self.start is None:
+            self.rows = min(self.rows + 1, self.history)
+            if event == ONSET:
+                self.start = max(0, self.rows - self.detector.onset_rows)
+        else:
+            self.rows = self.rows + 1
+            if event == OFFSET and self.end is None:
+                self.end = max(self.start, self.rows - self.detector.hold_rows)
+        return event
+
+
+    # first row of the window centred on the gesture; while the gesture goes on, it ends at the last row
+    def first(self):
+        end = self.end if self.end is not None else self.rows
+        return max((self.start + end) // 2 - self.length // 2, 0)
+
+
+    # returns True when the recording can stop
+    def complete(self):
+        if self.start is None:
+            return False
+        return self.rows >= self.capacity or (self.end is not None and self.rows >= self.first() + self.length)
+
+
+    # returns (first, last) rows of the window in the recording and (start, end) rows of the gesture in the window
+    def window(self):
+        first = min(self.first(), max(self.rows - self.length, 0))
+        last = first + self.length
+        end = self.end if self.end is not None else self.rows
+        return first, last, max(self.start - first, 0), min(end, last) - first
+
+
+
+# returns the (start, end) rows of the active part of a sample (rows x 18), from the first onset to the last offset
+# the rows needed by the detector to confirm a change are subtracted, so start and end are the actual change points
+# returns (0, rows) if no gesture is detected
+def segmentArray(array, freq=200, **parameters):
+    detector = OnsetDetector(freq, **parameters)
+    start = None
+    end = None
+    for i in range(len(array)):
+        event = detector.update(array[i, :8], array[i, 8:11])
+        if event == ONSET and start is None:
+            start = max(0, i + 1 - detector.onset_rows)
+        elif event == OFFSET:
+            end = i + 1 - detector.hold_rows
+    if start is None:
+        return 0, len(array)
+    if end is None or end <= start:
+        end = len(array)
+    return start, end
+
+
+# returns a window of "length" rows centred on the active part [start, end)
+# the window is shifted to stay inside the sample, and padded with the first or last row if the sample is too short
+def alignWindow(array, start, end, length):
+    first = (start + end) // 2 - length // 2
+    first = min(max(first, 0), max(len(array) - length, 0))
+    window = array[first:first + length]
+    if len(window) < length:
+        window = np.concatenate((window, np.repeat(window[-1:], length - len(window), axis=0)))
+    return window, first
+
+
+# crops the per-row lists of a signal (emg or imu) of a json sample, i.e. the lists as long as its data,
+# and pads them with their last entry up to "length" rows
+def cropSignal(signal, first, last, length):
+    rows = len(signal["data"])
+    cropped = dict(signal)
+    for key, value in signal.items():
+        if isinstance(value, list) and len(value) == rows:
+            value = value[first:last]
+            if 0 < len(value) < length:
+                value = value + value[-1:] * (length - len(value))
+            cropped[key] = value
+    return cropped
+
+
+# returns a copy of a json sample restricted to the rows [first, last), padded with the last row up to "length" rows if given
+# the imu events are kept from the first to the last of these rows, and the active part (auto mode) is shifted to the new rows
+def cropSample(data, first, last, length=None):
+    if length is None:
+        length = last - first
+    cropped = dict(data)
+    cropped["duration"] = int(round(length * 1000 / data["emg"]["frequency"]))
+    cropped["emg"] = cropSignal(data["emg"], first, last, length)
+    cropped["imu"] = cropSignal(data["imu"], first, last, length)
+
+    timestamps = data["imu"].get("timestamps")
+    events = data["imu"].get("events")
+    if events is not None and timestamps is not None and last > first:
+        keep = [i for i, t in enumerate(events["timestamps"]) if timestamps[first] <= t <= timestamps[min(last, len(timestamps)) - 1]]
+        cropped["imu"]["events"] = {"data": [events["data"][i] for i in keep], "timestamps": [events["timestamps"][i] for i in keep]}
+    if "active" in data:
+        start = min(max(data["active"]["start"] - first, 0), length)
+        cropped["active"] = {"start": start, "end": max(min(data["active"]["end"] - first, length), start)}
+
+    cropped["segment"] = {"start": first, "end": last}
+    return cropped
+
+
+# re-segments every sample of the dataset into output_path, with the same directory structure
+# mode "trim" keeps only the active rows, mode "align" keeps a window of "length" rows centred on them
+def segmentDataset(dataset_path, output_path, mode="trim", length=200):
+    total_rows = 0
+    active_rows = 0
+    for gesture, path in dataset.listSamples(dataset_path):
+        data = dataset.loadSample(path)
+        array = dataset.sampleToArray(data)
+        start, end = segmentArray(array, data["emg"]["frequency"])
+        total_rows = total_rows + len(array)
+        active_rows = active_rows + end - start
+
+        # in align mode the samples shorter than the window are padded with their last row, as by alignWindow
+        if mode == "align":
+            _, first = alignWindow(array, start, end, length)
+            cropped = cropSample(data, first, min(first + length, len(array)), length)
+        else:
+            cropped = cropSample(data, start, end)
+
+        directory = os.path.join(output_path, gesture)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, os.path.basename(path)), 'w') as f:
+            json.dump(cropped, f)
+
+    print("Active rows: %d of %d (%.1f%%)" % (active_rows, total_rows, 100 * active_rows / max(1, total_rows)))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-segments the dataset around the active part of each gesture")
+    parser.add_argument('output', help="output directory")
+    parser.add_argument('--dataset', default=dataset.DATASET_DIRECTORY, help="dataset directory")
+    parser.add_argument('--mode', choices=['trim', 'align'], default='trim', help="keep only the active rows, or a fixed-length window centred on them")
+    parser.add_argument('--length', type=int, default=200, help="rows of the windows in align mode")
+    args = parser.parse_args()
+
+    segmentDataset(args.dataset, args.output, args.mode, args.length)
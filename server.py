@@ -0,0 +1,289 @@
+import time
+import queue
+import socket
+import argparse
+import threading
+import collections
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+import dataset
+import recognizers
+
+
+# inference service shared by several recognition clients
+# every request is a single window (rows x 18), like the one assembled by Prediction.createArray;
+# the requests waiting in the queue are grouped in micro-batches, so that the recognizer runs a single predict
+# for a whole batch instead of one for each window, and the results are sent back to each client
+
+
+DEFAULT_ADDRESS = ('localhost', 6000)
+AUTHKEY = b'sign-language'
+
+
+# runs the recognizer on a batch of windows and returns the probabilities as a numpy array
+# keras models have predict_on_batch, which skips the overhead of predict on small batches
+def predictBatch(recognizer, batch):
+    predict = getattr(recognizer, 'predict_on_batch', None)
+    if predict is None:
+        predict = recognizer.predict
+    return np.asarray(predict(batch))
+
+
+class InferenceServer():
+
+    def __init__(self, recognizer, max_batch=32, max_latency_ms=5, rows=400, channels=dataset.NR_CHANNELS):
+        self.recognizer = recognizer
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.requests = queue.Queue()
+        self.batch = np.empty((max_batch, rows, channels), dtype=np.float32) # reused by every batch
+
+        # metrics
+        self.lock = threading.Lock()
+        self.nr_requests = 0
+        self.nr_batches = 0
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=10000) # seconds from submit to result, of the last requests
+        self.max_queue_depth = 0
+
+        self.stop = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+
+    # queues a window and returns a Future that will contain its probability vector
+    # a window with the wrong shape is rejected here, so it never reaches the batch of the other requests
+    def submit(self, window):
+        window = np.asarray(window, dtype=np.float32)
+        if window.shape != self.batch.shape[1:]:
+            raise ValueError("window of shape %s, expected %s" % (window.shape, self.batch.shape[1:]))
+        future = Future()
+        with self.lock:
+            if self.stop:
+                raise RuntimeError("the inference server is closed")
+            self.requests.put((time.perf_counter(), window, future))
+            self.max_queue_depth = max(self.max_queue_depth, self.requests.qsize())
+        return future
+
+
+    # queues a window and waits for its probability vector
+    def predict(self, window):
+        return self.submit(window).result()
+
+
+    # worker thread: waits for a request, then collects the following ones until the batch is full
+    # or the first request of the batch has waited max_latency
+    def run(self):
+        while not self.stop:
+            try:
+                first = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            pending = [first]
+            deadline = first[0] + self.max_latency
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout <= 0:
+                        pending.append(self.requests.get_nowait())
+                    else:
+                        pending.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.process(pending)
+
+
+    # runs a single predict for the pending requests and sets their results
+    def process(self, pending):
+        size = len(pending)
+        try:
+            for i, (_, window, _) in enumerate(pending):
+                self.batch[i] = window
+            probabilities = predictBatch(self.recognizer, self.batch[:size])
+        except Exception as error:
+            for _, _, future in pending:
+                future.set_exception(error)
+            return
+
+        end = time.perf_counter()
+        for i, (arrival, _, future) in enumerate(pending):
+            future.set_result(probabilities[i])
+
+        with self.lock:
+            self.nr_requests = self.nr_requests + size
+            self.nr_batches = self.nr_batches + 1
+            self.batch_sizes[size] += 1
+            self.latencies.extend(end - arrival for arrival, _, _ in pending)
+
+
+    # returns the current metrics of the service
+    def metrics(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            return {
+                "queue_depth": self.requests.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.nr_requests,
+                "batches": self.nr_batches,
+                "mean_batch_size": self.nr_requests / self.nr_batches if self.nr_batches > 0 else 0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) > 0 else 0,
+                "latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) > 0 else 0,
+            }
+
+
+    # the requests still queued are failed, so that no caller waits for them forever
+    def close(self):
+        with self.lock:
+            self.stop = True
+        self.worker.join()
+        while True:
+            try:
+                _, _, future = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError("the inference server is closed"))
+
+
+
+# disables Nagle's algorithm on the socket of a connection
+# a message is sent as a header and a body, and waiting for the ack of the header would add ~40 ms to every request
+def setNoDelay(connection):
+    s = socket.fromfd(connection.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    s.close()
+
+
+# serves the recognition clients over a socket, one thread for each connection
+# a client sends ("predict", window) and receives the probability vector, or ("metrics",) and receives the metrics
+# a request that fails, or that is not known, is answered with the exception, which the client raises
+def serve(server, address=DEFAULT_ADDRESS):
+    listener = Listener(address, authkey=AUTHKEY)
+    print("Serving on %s:%d" % address)
+    while True:
+        connection = listener.accept()
+        setNoDelay(connection)
+        threading.Thread(target=handleConnection, args=(server, connection), daemon=True).start()
+
+
+def handleConnection(server, connection):
+    try:
+        while True:
+            message = connection.recv()
+            try:
+                if message[0] == "predict":
+                    reply = server.predict(message[1])
+                elif message[0] == "metrics":
+                    reply = server.metrics()
+                else:
+                    reply = ValueError("unknown message %r" % (message[0],))
+            except Exception as error:
+                reply = error
+            connection.send(reply)
+    except (EOFError, OSError):
+        pass
+    finally:
+        connection.close()
+
+
+# client of serve, with the same predict interface of a local InferenceServer
+class RecognitionClient():
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.connection = Client(address, authkey=AUTHKEY)
+        setNoDelay(self.connection)
+
+
+    def predict(self, window):
+        self.connection.send(("predict", window))
+        return self.receive()
+
+
+    def metrics(self):
+        self.connection.send(("metrics",))
+        return self.receive()
+
+
+    # raises the errors sent back by the service
+    def receive(self):
+        reply = self.connection.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+    def close(self):
+        self.connection.close()
+
+
+
+# load generator: several clients replay the samples of the dataset as fast as they can
+# returns throughput (windows/s) and median and p99 latency (ms) seen by the clients
+def loadTest(make_client, samples, nr_clients, nr_requests):
+    latencies = [[] for _ in range(nr_clients)]
+
+    def replay(c):
+        client = make_client()
+        for i in range(c, nr_requests, nr_clients):
+            start = time.perf_counter()
+            client.predict(samples[i % len(samples)])
+            latencies[c].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=replay, args=(c,)) for c in range(nr_clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.array(l) for l in latencies]) * 1000
+    return nr_requests / elapsed, np.percentile(all_latencies, 50), np.percentile(all_latencies, 99)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inference service with dynamic micro-batching")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="serves a recognizer over a socket")
+    loadgen_parser = subparsers.add_parser('loadgen', help="replays the dataset against the service and reports throughput and latency")
+    for p in (serve_parser, loadgen_parser):
+        p.add_argument('--model', help="keras architecture (json) file or classical model (npz)")
+        p.add_argument('--weight', default=None, help="keras weights file")
+        p.add_argument('--max-latency', type=float, default=5, help="maximum time in ms a request waits for its batch")
+        p.add_argument('--port', type=int, default=DEFAULT_ADDRESS[1])
+    serve_parser.add_argument('--max-batch', type=int, default=32, help="maximum size of a micro-batch")
+    loadgen_parser.add_argument('--max-batch', type=int, nargs='+', default=[1, 32], help="maximum sizes of a micro-batch to compare, 1 disables batching")
+    loadgen_parser.add_argument('--remote', action='store_true', help="connect to a running service instead of starting one")
+    loadgen_parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16], help="numbers of concurrent clients")
+    loadgen_parser.add_argument('--requests', type=int, default=2000, help="number of requests of each run")
+    loadgen_parser.add_argument('--store', default=dataset.STORE_DIRECTORY)
+    args = parser.parse_args()
+
+    address = (DEFAULT_ADDRESS[0], args.port)
+
+    if args.command == 'serve':
+        serve(InferenceServer(recognizers.loadRecognizer(args.model, args.weight), args.max_batch, args.max_latency), address)
+    elif args.remote:
+        samples = np.asarray(dataset.openStore(args.store).samples)
+        print("%8s %14s %12s %12s" % ("clients", "windows/s", "p50 (ms)", "p99 (ms)"))
+        for nr_clients in args.clients:
+            throughput, p50, p99 = loadTest(lambda: RecognitionClient(address), samples, nr_clients, args.requests)
+            print("%8d %14.1f %12.2f %12.2f" % (nr_clients, throughput, p50, p99))
+        print(RecognitionClient(address).metrics())
+    else:
+        samples = np.asarray(dataset.openStore(args.store).samples)
+        recognizer = recognizers.loadRecognizer(args.model, args.weight)
+        print("%10s %8s %14s %12s %12s %12s" % ("max batch", "clients", "windows/s", "p50 (ms)", "p99 (ms)", "mean batch"))
+        for max_batch in args.max_batch:
+            for nr_clients in args.clients:
+                server = InferenceServer(recognizer, max_batch, args.max_latency)
+                throughput, p50, p99 = loadTest(lambda: server, samples, nr_clients, args.requests)
+                metrics = server.metrics()
+                server.close()
+                print("%10d %8d %14.1f %12.2f %12.2f %12.2f" % (max_batch, nr_clients, throughput, p50, p99, metrics["mean_batch_size"]))
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import psutil
+import numpy as np
+
+import dataset
+import classical
+import calibration
+
+
+# cross-validation and hyperparameter sweep runner
+# the tensor store is copied once into a shared memory block, which every worker of the pool maps without copying
+# each (config, fold) pair is a task; the results are appended to a checkpoint file as soon as they are ready,
+# so an interrupted sweep is resumed by running the same command again
+
+
+# state of a worker process, set by initWorker
+worker = {}
+
+
+# trains a small convolutional network with keras and returns the test accuracy
+# keras is imported here, after the number of threads of the worker has been set
+def trainKeras(config, x_train, y_train, x_test, y_test, nr_classes):
+    import tensorflow as tf
+    from keras.models import Sequential
+    from keras.layers import Conv1D, MaxPooling1D, GlobalAveragePooling1D, Dense, Dropout
+    from keras.optimizers import Adam
+
+    threads = worker.get("threads", 1)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    model = Sequential()
+    model.add(Conv1D(config.get("filters", 32), config.get("kernel_size", 5), activation='relu', input_shape=x_train.shape[1:]))
+    model.add(MaxPooling1D(config.get("pool_size", 4)))
+    model.add(Conv1D(config.get("filters", 32) * 2, config.get("kernel_size", 5), activation='relu'))
+    model.add(GlobalAveragePooling1D())
+    model.add(Dropout(config.get("dropout", 0.3)))
+    model.add(Dense(config.get("units", 64), activation='relu'))
+    model.add(Dense(nr_classes, activation='softmax'))
+    model.compile(optimizer=Adam(config.get("learning_rate", 0.001)), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+
+    model.fit(x_train, y_train, epochs=config.get("epochs", 30), batch_size=config.get("batch_size", 32), verbose=0)
+    _, accuracy = model.evaluate(x_test, y_test, verbose=0)
+    return float(accuracy)
+
+
+# trainers selectable with the "model" field of a config
+TRAINERS = {
+    "keras": trainKeras,
+    "lda": classical.trainClassical,
+    "knn": classical.trainClassical,
+}
+
+
+# expands a grid, i.e. a dict whose values are lists of values, into the list of all the configs
+# a list of configs is returned unchanged
+def expandGrid(grid):
+    if isinstance(grid, list):
+        return grid
+    keys = sorted(grid.keys())
+    values = [grid[k] if isinstance(grid[k], list) else [grid[k]] for k in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+# returns an identifier of a config, stable across runs, used as key in the checkpoint file
+def configId(config):
+    if "name" in config:
+        return config["name"]
+    return json.dumps(config, sort_keys=True)
+
+
+# returns the folds of the sweep as a list of (fold name, train indices, test indices)
+def makeFolds(store, scheme, k, seed):
+    if scheme == "session":
+        return dataset.sessionFolds(store.timestamps)
+    folds = dataset.kFolds(store.labels, k, seed)
+    return [("fold%d" % i, train, test) for i, (train, test) in enumerate(folds)]
+
+
+# reads the results already written in the checkpoint file
+def readCheckpoint(path):
+    results = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    results.append(json.loads(line))
+    return results
+
+
+# runs in every worker when the pool starts
+# maps the shared memory block and pins the process to its own set of cpus,
+# so that the thread pools of the workers do not compete for the same cores
+def initWorker(shm_name, shape, dtype, labels, cpu_sets, threads):
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+
+    cpus = cpu_sets.get()
+    if cpus:
+        try:
+            psutil.Process().cpu_affinity(cpus)
+        except (AttributeError, psutil.Error):
+            pass # cpu affinity is not supported on every platform
+
+    worker["shm"] = shared_memory.SharedMemory(name=shm_name)
+    worker["samples"] = np.ndarray(shape, dtype=dtype, buffer=worker["shm"].buf)
+    worker["labels"] = labels
+    worker["threads"] = threads
+
+
+# runs a single (config, fold) task in a worker
+def runTask(task):
+    config_id, config, fold_name, train, test, nr_classes = task
+    samples = worker["samples"]
+    labels = worker["labels"]
+
+    start = time.perf_counter()
+    x_train = samples[train]
+    x_test = samples[test]
+
+    # per-channel standardization, with the statistics of the training set only
+    mean = x_train.mean(axis=(0, 1))
+    std = x_train.std(axis=(0, 1)) + 1e-6
+    x_train = (x_train - mean) / std
+    x_test = (x_test - mean) / std
+
+    trainer = TRAINERS[config.get("model", "keras")]
+    accuracy = trainer(config, x_train, labels[train], x_test, labels[test], nr_classes)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "config": config_id,
+        "fold": fold_name,
+        "accuracy": accuracy,
+        "train_samples": len(train),
+        "test_samples": len(test),
+        "wall_time": wall_time,
+        "throughput": (len(train) + len(test)) / wall_time,
+        "pid": os.getpid(),
+    }
+
+
+# prints the result of every fold and the mean accuracy of every config
+def report(results):
+    print("%-40s %-10s %9s %10s %12s" % ("config", "fold", "accuracy", "time (s)", "samples/s"))
+    for r in results:
+        print("%-40s %-10s %9.4f %10.2f %12.1f" % (r["config"][:40], r["fold"], r["accuracy"], r["wall_time"], r["throughput"]))
+
+    print()
+    by_config = {}
+    for r in results:
+        by_config.setdefault(r["config"], []).append(r)
+    for config_id, rs in sorted(by_config.items(), key=lambda item: -np.mean([r["accuracy"] for r in item[1]])):
+        accuracies = [r["accuracy"] for r in rs]
+        print("%-40s mean accuracy %.4f +- %.4f over %d folds, %.2f s per fold" % (config_id[:40], np.mean(accuracies), np.std(accuracies), len(rs), np.mean([r["wall_time"] for r in rs])))
+
+
+# runs the sweep of the configs over the folds, skipping the tasks already in the checkpoint
+def runSweep(configs, store_path, checkpoint, scheme="kfold", k=5, seed=0, workers=None, threads=1, profile=None):
+    store = dataset.openStore(store_path, profile=profile)
+
+    folds = makeFolds(store, scheme, k, seed)
+    done = set((r["config"], r["fold"]) for r in readCheckpoint(checkpoint))
+    nr_classes = len(store.label_names)
+
+    tasks = []
+    skipped = 0
+    for config in configs:
+        for fold_name, train, test in folds:
+            if (configId(config), fold_name) in done:
+                skipped = skipped + 1
+            else:
+                tasks.append((configId(config), config, fold_name, train, test, nr_classes))
+    print("%d tasks to run, %d already done" % (len(tasks), skipped))
+
+    if len(tasks) > 0:
+        if workers is None:
+            workers = max(1, psutil.cpu_count() // threads)
+        workers = min(workers, len(tasks))
+
+        # load and preprocess the dataset once, in a shared memory block
+        shm = shared_memory.SharedMemory(create=True, size=store.samples.nbytes)
+        try:
+            samples = np.ndarray(store.samples.shape, dtype=store.samples.dtype, buffer=shm.buf)
+            samples[:] = store.samples
+
+            # disjoint sets of cpus, one for each worker
+            cpus = list(range(psutil.cpu_count()))
+            cpu_sets = multiprocessing.Queue()
+            for w in range(workers):
+                cpu_sets.put([cpus[(w * threads + t) % len(cpus)] for t in range(threads)])
+
+            start = time.perf_counter()
+            with multiprocessing.Pool(workers, initializer=initWorker, initargs=(shm.name, samples.shape, samples.dtype, store.labels, cpu_sets, threads)) as pool:
+                with open(checkpoint, 'a') as f:
+                    for i, result in enumerate(pool.imap_unordered(runTask, tasks)):
+                        f.write(json.dumps(result) + "\n")
+                        f.flush()
+                        print("[%d/%d] %s %s accuracy %.4f in %.2f s" % (i + 1, len(tasks), result["config"][:40], result["fold"], result["accuracy"], result["wall_time"]))
+            elapsed = time.perf_counter() - start
+            print("%d tasks in %.2f s, %.2f tasks/min" % (len(tasks), elapsed, len(tasks) * 60 / elapsed))
+        finally:
+            del samples
+            shm.close()
+            shm.unlink()
+
+    report(readCheckpoint(checkpoint))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cross-validation and hyperparameter sweep")
+    parser.add_argument('configs', help="json file with a list of configs or a grid (a dict of lists of values)")
+    parser.add_argument('--store', default=dataset.STORE_DIRECTORY, help="tensor store directory, built from the dataset if missing")
+    parser.add_argument('--checkpoint', default='sweep_results.jsonl', help="file where the results are appended")
+    parser.add_argument('--scheme', choices=['kfold', 'session'], default='kfold', help="k-fold or leave-one-session-out")
+    parser.add_argument('--k', type=int, default=5, help="number of folds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="number of processes, by default cpus / threads")
+    parser.add_argument('--threads', type=int, default=1, help="threads of each process")
+    parser.add_argument('--profile', default=None, help="user whose calibration profile is applied to the dataset, see calibration.py")
+    args = parser.parse_args()
+
+    with open(args.configs, 'r') as f:
+        configs = expandGrid(json.load(f))
+
+    runSweep(configs, args.store, args.checkpoint, args.scheme, args.k, args.seed, args.workers, args.threads, calibration.userProfile(args.profile))
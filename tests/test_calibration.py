@@ -0,0 +1,64 @@
+import os
+import json
+import numpy as np
+
+import dataset
+import calibration
+
+
+def test_apply_permutes_scales_and_offsets():
+    profile = calibration.Profile("user", rotation=2, scale=np.arange(1, 19), offset=np.full(18, 0.5))
+    array = np.tile(np.arange(18, dtype=np.float32), (3, 1))
+    calibrated = profile.apply(array)
+    expected = np.concatenate(((np.arange(8) + 2) % 8, np.arange(8, 18))) * np.arange(1, 19) + 0.5
+    np.testing.assert_allclose(calibrated, np.tile(expected, (3, 1)))
+    # a batch is calibrated like each of its samples
+    np.testing.assert_allclose(profile.apply(array[np.newaxis].repeat(2, axis=0))[1], calibrated)
+
+
+def test_fingerprint_depends_on_the_transform():
+    profile = calibration.Profile("user", rotation=1)
+    assert profile.fingerprint() == calibration.Profile("user", rotation=1).fingerprint()
+    assert profile.fingerprint() != calibration.Profile("user", rotation=2).fingerprint()
+    assert profile.fingerprint().startswith("user_")
+
+
+def test_save_and_load(tmp_path):
+    profile = calibration.Profile("user", 3, np.full(18, 2.0), np.full(18, -1.0))
+    path = str(tmp_path / "user.json")
+    profile.save(path)
+    loaded = calibration.loadProfile(path)
+    assert loaded.rotation == 3
+    np.testing.assert_array_equal(loaded.apply(np.ones((2, 18))), profile.apply(np.ones((2, 18))))
+
+
+def test_compute_profile_recovers_the_rotation_and_the_gain():
+    random = np.random.default_rng(0)
+    pattern = np.array([10, 20, 40, 80, 40, 20, 10, 5], dtype=np.float32)
+    reference = {"levels": (pattern * 2).tolist()}
+    # the armband of the user is rotated by 3 channels and has half the gain of the dataset, and a gyroscope bias
+    raw_pattern = np.roll(pattern, 3)
+    rest = np.zeros((400, 18), dtype=np.float32)
+    rest[:, 8:11] = 1.5
+    mvc = np.zeros((400, 18), dtype=np.float32)
+    mvc[:, :8] = raw_pattern * random.choice([-1, 1], size=(400, 8))
+    profile = calibration.computeProfile("user", rest, mvc, reference)
+    assert profile.rotation == 3
+    np.testing.assert_allclose(calibration.emgLevels(profile.apply(mvc)), pattern * 2, rtol=1e-5)
+    np.testing.assert_allclose(profile.apply(rest)[:, 8:11], 0, atol=1e-6)
+
+
+def test_calibrated_store_is_cached(tmp_path):
+    samples = np.ones((3, 10, dataset.NR_CHANNELS), dtype=np.float32)
+    np.save(str(tmp_path / "samples.npy"), samples)
+    np.save(str(tmp_path / "labels.npy"), np.zeros(3, dtype=np.int16))
+    with open(str(tmp_path / "index.json"), 'w') as f:
+        json.dump({"labels": ["A"], "files": ["A/%d.json" % i for i in range(3)], "timestamps": [""] * 3}, f)
+    profile = calibration.Profile("user", scale=np.full(18, 3.0))
+    store = dataset.TensorStore(str(tmp_path))
+    store.calibrate(profile)
+    assert np.all(store.samples == 3.0)
+    path = str(tmp_path / ("calibrated_" + profile.fingerprint() + ".npy"))
+    modified = os.path.getmtime(path)
+    dataset.TensorStore(str(tmp_path)).calibrate(profile, chunk=2)
+    assert os.path.getmtime(path) == modified
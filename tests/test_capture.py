@@ -0,0 +1,140 @@
+import multiprocessing
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+import capture
+
+
+# consumer process: attaches to the buffer, sends back what it reads, writes a row and releases its reference
+def consume(handle, results):
+    buffer = capture.CaptureBuffer.attach(handle)
+    results.put((buffer.emg_count, buffer.imu_count, buffer.event_count, buffer.references, buffer.toArray().sum(), buffer.imuEvents()["timestamps"]))
+    buffer.appendEmg(np.full(8, 7.0))
+    buffer.release()
+    buffer.close()
+
+
+def test_attach_round_trip_in_another_process():
+    pool = capture.CapturePool(rows=10, size=1)
+    buffer = pool.acquire()
+    for r in range(3):
+        buffer.appendEmg(np.ones(8))
+        buffer.appendImu(np.ones(10), 1000.0 * r)
+    buffer.appendImuEvents(np.ones((2, 10), dtype=np.float32), [500.0, 1500.0])
+    buffer.retain() # reference of the consumer
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=consume, args=(buffer.handle(), results))
+    process.start()
+    emg_count, imu_count, event_count, references, total, event_timestamps = results.get(timeout=30)
+    process.join(timeout=30)
+
+    assert (emg_count, imu_count, event_count, references) == (3, 3, 2, 2)
+    assert total == 3 * 18
+    assert event_timestamps == [500.0, 1500.0]
+    # the row and the release of the consumer are seen by the producer
+    assert buffer.emg_count == 4
+    assert buffer.references == 1
+    buffer.release()
+    assert pool.acquire() is buffer
+    pool.close()
+
+
+def test_attach_does_not_reset_the_buffer():
+    pool = capture.CapturePool(rows=10, size=1)
+    buffer = pool.acquire()
+    buffer.appendEmg(np.ones(8))
+    attached = capture.CaptureBuffer.attach(buffer.handle())
+    assert attached.emg_count == 1
+    assert attached.references == 1
+    np.testing.assert_array_equal(attached.toArray(), buffer.toArray())
+    attached.close()
+    pool.close()
+
+
+def test_release_below_zero_raises():
+    pool = capture.CapturePool(rows=10, size=1)
+    buffer = pool.acquire()
+    buffer.release()
+    with pytest.raises(ValueError):
+        buffer.release()
+    assert pool.free == [buffer]
+    pool.close()
+
+
+def test_buffer_released_elsewhere_is_taken_back():
+    pool = capture.CapturePool(rows=10, size=1)
+    buffer = pool.acquire()
+    attached = capture.CaptureBuffer.attach(buffer.handle())
+    attached.release() # without pool, as in another process
+    attached.close()
+    assert pool.acquire() is buffer
+    assert len(pool.buffers) == 1
+    pool.close()
+
+
+def test_pool_creates_buffers_when_all_are_in_use():
+    pool = capture.CapturePool(rows=10, size=1)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    assert len(pool.buffers) == 2
+    pool.close()
+
+
+def test_release_after_pool_close():
+    pool = capture.CapturePool(rows=10, size=1)
+    buffer = pool.acquire()
+    pool.close()
+    buffer.release()
+    assert pool.free == []
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+# orientation event of myo-python
+def imuEvent(value, timestamp):
+    vector = lambda *values: SimpleNamespace(**dict(zip("xyzw", values)))
+    return SimpleNamespace(gyroscope=vector(value, value, value), acceleration=vector(value, value, value),
+                           orientation=vector(value, value, value, value), timestamp=timestamp)
+
+
+def test_imu_stream_events_are_copied_with_their_timestamps():
+    stream = capture.ImuStream(capacity=4)
+    buffer = capture.CaptureBuffer(10)
+    read = 0
+    for row in range(3):
+        for e in range(2):
+            stream.write(imuEvent(row + e * 0.5, 1000.0 * row + 500 * e))
+        read = buffer.appendImuStream(stream, read)
+    assert read == 6
+    assert buffer.imu_count == 3
+    assert buffer.event_count == 6
+    events = buffer.imuEvents()
+    assert events["timestamps"] == [0.0, 500.0, 1000.0, 1500.0, 2000.0, 2500.0]
+    assert events["data"][1]["gyroscope"] == [0.5, 0.5, 0.5]
+    # the last event of every row is the imu row
+    assert buffer.imuTimestamps() == [500.0, 1500.0, 2500.0]
+    buffer.close()
+
+
+def test_imu_values_keep_their_float32_decimals():
+    buffer = capture.CaptureBuffer(2)
+    buffer.appendImu(np.full(10, 0.1, dtype=np.float32))
+    assert buffer.imuList()[0]["gyroscope"] == [0.1, 0.1, 0.1]
+    buffer.close()
+
+
+def test_crop_keeps_the_rows_and_their_events():
+    buffer = capture.CaptureBuffer(10)
+    for r in range(6):
+        buffer.appendEmg(np.full(8, r))
+        buffer.appendImu(np.full(10, r), 1000.0 * r)
+    buffer.appendImuEvents(np.arange(6, dtype=np.float32)[:, np.newaxis].repeat(10, axis=1), [1000.0 * e + 500 for e in range(6)])
+    buffer.crop(2, 5)
+    assert buffer.emg_count == buffer.imu_count == 3
+    np.testing.assert_array_equal(buffer.toArray()[:, 0], [2, 3, 4])
+    assert buffer.imuTimestamps() == [2000.0, 3000.0, 4000.0]
+    assert buffer.imuEvents()["timestamps"] == [2500.0, 3500.0]
+    buffer.close()
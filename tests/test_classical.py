@@ -0,0 +1,52 @@
+import numpy as np
+
+import classical
+
+
+# features of the first emg channel of one segment: mav, rms, wl, zc, ssc
+def emgFeatures(signal):
+    window = np.zeros((len(signal), 18), dtype=np.float32)
+    window[:, 0] = signal
+    features = classical.extractFeatures(window, nr_segments=1).reshape(-1)
+    return features[[0, 8, 16, 24, 32]]
+
+
+def test_constant_signal():
+    mav, rms, wl, zc, ssc = emgFeatures(np.full(100, 3.0))
+    assert mav == rms == 3.0
+    assert wl == zc == ssc == 0
+
+
+def test_alternating_signal_crosses_zero_and_changes_slope():
+    _, _, _, zc, ssc = emgFeatures(np.tile([5.0, -5.0], 50))
+    assert zc == 1
+    assert ssc > 0.9
+
+
+def test_slope_sign_changes_without_zero_crossings():
+    _, _, _, zc, ssc = emgFeatures(np.tile([0.0, 5.0], 50))
+    assert zc == 0
+    assert ssc > 0.9
+
+
+def test_monotonic_signal_has_no_slope_sign_change():
+    _, _, _, zc, ssc = emgFeatures(np.linspace(-50, 50, 100))
+    assert ssc == 0
+    assert zc > 0
+
+
+def test_small_oscillations_are_ignored():
+    _, _, _, zc, ssc = emgFeatures(np.tile([0.2, -0.2], 50))
+    assert zc == ssc == 0
+
+
+def test_recognizer_separates_gestures():
+    random = np.random.default_rng(0)
+    windows = random.normal(size=(40, 100, 18)).astype(np.float32)
+    y = np.repeat([0, 1], 20)
+    windows[y == 1, :, :8] *= 10
+    recognizer = classical.ClassicalRecognizer("lda", labels=["A", "B"]).fit(windows, y)
+    probabilities = recognizer.predict(windows)
+    assert probabilities.shape == (40, 2)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, rtol=1e-5)
+    assert np.mean(np.argmax(probabilities, axis=1) == y) == 1
@@ -0,0 +1,119 @@
+import os
+import json
+import numpy as np
+import pytest
+
+import dataset
+
+
+# tensor store of nr_samples samples (rows x 18) whose values encode sample, row and channel
+def makeStore(path, nr_samples=10, rows=20):
+    samples = np.arange(nr_samples * rows * dataset.NR_CHANNELS, dtype=np.float32).reshape(nr_samples, rows, dataset.NR_CHANNELS)
+    np.save(os.path.join(path, 'samples.npy'), samples)
+    np.save(os.path.join(path, 'labels.npy'), (np.arange(nr_samples) % 2).astype(np.int16))
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({"labels": ["A", "B"], "files": ["%d.json" % i for i in range(nr_samples)], "timestamps": [""] * nr_samples}, f)
+    return dataset.TensorStore(str(path)), samples
+
+
+def test_window_is_view_of_the_sample(tmp_path):
+    store, samples = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=2)
+    window = reader.window(3, 4)
+    assert window.shape == (5, dataset.NR_CHANNELS)
+    np.testing.assert_array_equal(window, samples[3, 4:9])
+    assert np.shares_memory(window, store.samples)
+
+
+def test_window_off_step_and_other_length(tmp_path):
+    store, samples = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=2)
+    np.testing.assert_array_equal(reader.window(1, 3), samples[1, 3:8])
+    np.testing.assert_array_equal(reader.window(1, 2, 10), samples[1, 2:12])
+
+
+@pytest.mark.parametrize("start, length", [(-2, None), (16, None), (-1, 3), (18, 3), (0, 21)])
+def test_window_out_of_range(tmp_path, start, length):
+    store, _ = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=2)
+    with pytest.raises(IndexError):
+        reader.window(0, start, length)
+
+
+def test_batch_reuses_output(tmp_path):
+    store, samples = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=5)
+    out = np.empty((2, 5, dataset.NR_CHANNELS), dtype=np.float32)
+    batch = reader.batch([2, 7], [0, 15], out)
+    assert batch is out
+    np.testing.assert_array_equal(out[0], samples[2, 0:5])
+    np.testing.assert_array_equal(out[1], samples[7, 15:20])
+
+
+def test_sampler_covers_every_window_once(tmp_path):
+    store, _ = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=5)
+    sampler = dataset.BlockShuffleSampler(reader, block_size=3, seed=0)
+    windows = list(sampler)
+    assert len(windows) == len(sampler) == 10 * reader.nr_windows
+    assert sorted(windows) == [(s, start) for s in range(10) for start in range(0, 16, 5)]
+
+
+def test_sampler_keeps_blocks_together(tmp_path):
+    store, _ = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=5)
+    sampler = dataset.BlockShuffleSampler(reader, block_size=3, seed=1)
+    blocks = [sample // 3 for sample, _ in sampler]
+    # every block is read in one run, so its index changes once per block
+    changes = sum(1 for a, b in zip(blocks, blocks[1:]) if a != b)
+    assert changes == len(set(blocks)) - 1
+
+
+def test_sampler_batches_and_subset(tmp_path):
+    store, _ = makeStore(tmp_path)
+    reader = dataset.WindowReader(store, 5, step=5)
+    sampler = dataset.BlockShuffleSampler(reader, block_size=2, sample_indices=[7, 1, 4], seed=0)
+    batches = list(sampler.batches(5))
+    assert [len(samples) for samples, _ in batches] == [5, 5, 2]
+    samples = np.concatenate([samples for samples, _ in batches])
+    assert sorted(set(samples.tolist())) == [1, 4, 7]
+
+
+# json sample as saved by the Acquisition panel, with rows rows of value
+def writeSample(path, value, rows):
+    data = {"timestamp": "01/01/24/10:00:00",
+            "emg": {"frequency": 200, "data": [[value] * 8] * rows},
+            "imu": {"frequency": 50, "data": [{"gyroscope": [value] * 3, "acceleration": [value] * 3, "orientation": [value] * 4}] * rows}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def test_build_pads_short_samples_and_skips_empty_ones(tmp_path):
+    writeSample(str(tmp_path / "Dataset" / "A" / "1.json"), 1.0, 5)
+    writeSample(str(tmp_path / "Dataset" / "B" / "1.json"), 2.0, 3)
+    writeSample(str(tmp_path / "Dataset" / "B" / "2.json"), 3.0, 0)
+    store = dataset.openStore(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+    assert store.samples.shape == (2, 400, dataset.NR_CHANNELS)
+    assert [store.label(i) for i in range(2)] == ["A", "B"]
+    assert np.all(store.samples[1] == 2.0)
+    assert not dataset.isStale(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+
+
+def test_store_is_rebuilt_when_the_dataset_changes(tmp_path):
+    writeSample(str(tmp_path / "Dataset" / "A" / "1.json"), 1.0, 5)
+    dataset.openStore(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+    writeSample(str(tmp_path / "Dataset" / "C" / "1.json"), 4.0, 5)
+    assert dataset.isStale(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+    store = dataset.openStore(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+    assert len(store) == 2
+    assert store.label_names == ["A", "C"]
+
+
+def test_interrupted_build_is_not_taken_for_a_store(tmp_path):
+    writeSample(str(tmp_path / "Dataset" / "A" / "1.json"), 1.0, 5)
+    os.makedirs(str(tmp_path / "Store"))
+    np.save(str(tmp_path / "Store" / "samples.npy"), np.zeros((3, 400, dataset.NR_CHANNELS), dtype=np.float32))
+    store = dataset.openStore(str(tmp_path / "Store"), str(tmp_path / "Dataset"))
+    assert len(store) == 1
+    assert not any(name.endswith('.tmp') for name in os.listdir(str(tmp_path / "Store")))
@@ -0,0 +1,92 @@
+import numpy as np
+
+import dataset
+import decoder
+
+
+WORDS = ["CASA", "CASO", "CANE", "PANE"]
+
+
+def makeLexicon(frequencies=(10, 1, 5, 3)):
+    return decoder.Lexicon(sorted(WORDS), np.array(frequencies, dtype=np.float64)[np.argsort(WORDS)])
+
+
+# the word spelled by a path of letters from the root, None if the path leaves the trie
+def walk(lexicon, word):
+    node = 0
+    for c in word:
+        start, end = lexicon.first[node], lexicon.first[node + 1]
+        children = [child for child, letter in zip(lexicon.edge_child[start:end], lexicon.edge_letter[start:end]) if dataset.LABELS[letter] == c]
+        if len(children) == 0:
+            return None
+        node = children[0]
+    return node
+
+
+def test_trie_contains_the_words():
+    lexicon = makeLexicon()
+    for word in WORDS:
+        node = walk(lexicon, word)
+        assert node is not None
+        assert lexicon.words[lexicon.terminal[node]] == word
+    assert lexicon.terminal[walk(lexicon, "CAS")] == -1
+    assert walk(lexicon, "CAT") is None
+
+
+def test_trie_shares_prefixes():
+    lexicon = makeLexicon()
+    # root, C, A, S, A, O, N, E, P, A, N, E
+    assert len(lexicon.terminal) == 12
+
+
+def test_best_word_below_a_node():
+    lexicon = makeLexicon()
+    assert lexicon.words[lexicon.best[walk(lexicon, "CA")]] == "CASA"
+    assert lexicon.words[lexicon.best[walk(lexicon, "P")]] == "PANE"
+
+
+# probability vector with most of the mass on a letter
+def spell(letter, confidence=0.9):
+    probabilities = np.full(len(dataset.LABELS), (1 - confidence) / (len(dataset.LABELS) - 1))
+    probabilities[dataset.LABELS.index(letter)] = confidence
+    return probabilities
+
+
+def test_step_decodes_a_word():
+    word_decoder = decoder.WordDecoder(makeLexicon())
+    for letter in "CANE":
+        word_decoder.step(spell(letter))
+    assert word_decoder.hypotheses(1)[0][0] == "CANE"
+    assert word_decoder.endWord() == "CANE"
+    assert word_decoder.steps == 0
+
+
+def test_step_corrects_a_wrong_letter():
+    word_decoder = decoder.WordDecoder(makeLexicon())
+    for letter in "CAXA":
+        word_decoder.step(spell(letter, 0.6))
+    assert word_decoder.hypotheses(1)[0][0] == "CASA"
+
+
+def test_step_skips_a_spurious_prediction():
+    word_decoder = decoder.WordDecoder(makeLexicon(), skip_penalty=1.0)
+    for letter in "PPANE":
+        word_decoder.step(spell(letter))
+    assert word_decoder.endWord() == "PANE"
+
+
+def test_step_with_other_labels():
+    labels = ["N", "E", "C", "A"]
+    word_decoder = decoder.WordDecoder(makeLexicon())
+    for letter in "CANE":
+        probabilities = np.full(len(labels), 0.05)
+        probabilities[labels.index(letter)] = 0.85
+        word_decoder.step(probabilities, labels)
+    assert word_decoder.endWord() == "CANE"
+
+
+def test_beam_width_is_kept():
+    word_decoder = decoder.WordDecoder(makeLexicon(), beam_width=3)
+    for letter in "CAS":
+        word_decoder.step(spell(letter))
+        assert len(word_decoder.nodes) <= 3
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import embedding
+
+
+def test_search_returns_nearest_first():
+    index = embedding.VectorIndex(2, capacity=2)
+    vectors = embedding.normalize([[1, 0], [0, 1], [1, 1], [-1, 0]])
+    index.add(vectors, ["a", "b", "c", "d"])
+    assert len(index) == 4
+    similarities, nearest = index.search([[1, 0.1]], k=3)
+    assert nearest.tolist() == [[0, 2, 1]]
+    assert np.all(np.diff(similarities) <= 0)
+
+
+def test_search_with_k_larger_than_the_index():
+    index = embedding.VectorIndex(2)
+    index.add(embedding.normalize([[1, 0], [0, 1]]), ["a", "b"])
+    similarities, nearest = index.search([[0, 1]], k=5)
+    assert nearest.tolist() == [[1, 0]]
+
+
+def test_search_on_empty_index():
+    with pytest.raises(ValueError):
+        embedding.VectorIndex(2).search([[1, 0]])
+
+
+# the embedding of a window is the mean of its first two channels
+def embedder(windows):
+    return embedding.normalize(np.atleast_3d(windows)[:, :, :2].mean(axis=1))
+
+
+def window(x, y):
+    window = np.zeros((10, 18), dtype=np.float32)
+    window[:, 0] = x
+    window[:, 1] = y
+    return window[np.newaxis]
+
+
+def makeRecognizer():
+    recognizer = embedding.IndexRecognizer(embedder, embedding.VectorIndex(2), k=3)
+    recognizer.insert(np.concatenate([window(1, 0), window(1, 0.1)]), "A", ["A/1.json", "A/2.json"])
+    recognizer.insert(np.concatenate([window(0, 1), window(0.1, 1)]), "B", ["B/1.json", "B/2.json"])
+    return recognizer
+
+
+def test_predict():
+    recognizer = makeRecognizer()
+    probabilities = recognizer.predict(np.concatenate([window(1, 0.05), window(0, 1)]))
+    assert recognizer.labels == ["A", "B"]
+    assert np.argmax(probabilities, axis=1).tolist() == [0, 1]
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, rtol=1e-5)
+
+
+def test_delete_gesture():
+    recognizer = makeRecognizer()
+    recognizer.deleteGesture("A")
+    assert recognizer.labels == ["B"]
+    assert recognizer.index.labels == ["B", "B"]
+    assert recognizer.index.files == ["B/1.json", "B/2.json"]
+    assert recognizer.predict(window(1, 0)).tolist() == [[1.0]]
+    recognizer.deleteGesture("B")
+    assert len(recognizer.index) == 0
+    with pytest.raises(ValueError):
+        recognizer.predict(window(1, 0))
+
+
+def test_rename_gesture():
+    recognizer = makeRecognizer()
+    recognizer.renameGesture("A", "C")
+    assert recognizer.labels == ["C", "B"]
+    assert recognizer.index.files[:2] == ["C/1.json", "C/2.json"]
+    assert np.argmax(recognizer.predict(window(1, 0))) == 0
+
+
+def test_save_and_load(tmp_path):
+    recognizer = embedding.IndexRecognizer(embedding.FeatureEmbedder(dim=4), embedding.VectorIndex(4), profile="user_0123abcd")
+    windows = np.random.default_rng(0).normal(size=(6, 40, 18)).astype(np.float32)
+    recognizer.embedder.fit(windows)
+    recognizer.insert(windows, "A")
+    path = str(tmp_path / "index.npz")
+    recognizer.save(path)
+    loaded = embedding.loadIndex(path)
+    assert loaded.profile == "user_0123abcd"
+    np.testing.assert_allclose(loaded.predict(windows), recognizer.predict(windows), rtol=1e-5)
@@ -0,0 +1,129 @@
+import time
+import numpy as np
+import pytest
+
+import ensemble
+
+
+# recognizer with a fixed answer and a delay, that can be made to fail
+class FakeRecognizer():
+
+    def __init__(self, labels, answer, delay=0.0):
+        self.labels = labels
+        self.answer = np.asarray(answer, dtype=np.float32)
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    def predict(self, windows):
+        self.calls = self.calls + 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("member failure")
+        return np.tile(self.answer, (len(windows), 1))
+
+
+WINDOW = np.zeros((1, 10, 18), dtype=np.float32)
+
+
+def makeEnsemble(delays, budget_ms=None, probe_interval=20):
+    members = [ensemble.Member("m%d" % i, FakeRecognizer(["A", "B"], [1.0, 0.0] if i == 0 else [0.0, 1.0], delay)) for i, delay in enumerate(delays)]
+    return ensemble.EnsembleRecognizer(members, budget_ms, probe_interval=probe_interval)
+
+
+def test_vote_over_the_union_of_labels():
+    members = [ensemble.Member("ab", FakeRecognizer(["A", "B"], [1.0, 0.0])),
+               ensemble.Member("bc", FakeRecognizer(["B", "C"], [0.0, 1.0]), coefficient=3.0)]
+    recognizer = ensemble.EnsembleRecognizer(members)
+    assert recognizer.labels == ["A", "B", "C"]
+    np.testing.assert_allclose(recognizer.predict(WINDOW), [[0.25, 0.0, 0.75]])
+    recognizer.close()
+
+
+def test_channels_of_a_member():
+    member = ensemble.Member("emg", FakeRecognizer(["A"], [1.0]), channels=range(8))
+    seen = []
+    member.predict_function = lambda windows: seen.append(windows.shape) or np.ones((len(windows), 1))
+    member.predict(WINDOW)
+    assert seen == [(1, 10, 8)]
+
+
+def test_late_member_is_left_out_of_one_prediction_only():
+    recognizer = makeEnsemble([0.0, 0.05], budget_ms=20)
+    recognizer.members[1].latency = 1.0
+    np.testing.assert_allclose(recognizer.predict(WINDOW), [[1.0, 0.0]])
+    # still running: not called again, but not dropped either
+    assert recognizer.members[1].active
+    recognizer.predict(WINDOW)
+    assert recognizer.members[1].recognizer.calls == 1
+    recognizer.close()
+
+
+def test_member_is_dropped_on_its_average_latency():
+    recognizer = makeEnsemble([0.0, 0.0], budget_ms=20)
+    recognizer.members[0].latency = 1.0
+    recognizer.members[1].latency = 100.0
+    recognizer.drop()
+    assert recognizer.members[0].active and not recognizer.members[1].active
+    recognizer.members[1].latency = 10.0
+    recognizer.drop()
+    assert recognizer.members[1].active
+    recognizer.close()
+
+
+def test_fastest_member_is_always_kept():
+    recognizer = makeEnsemble([0.0, 0.0], budget_ms=20)
+    recognizer.members[0].latency = 50.0
+    recognizer.members[1].latency = 80.0
+    recognizer.drop()
+    assert [m.active for m in recognizer.members] == [True, False]
+    recognizer.close()
+
+
+def test_dropped_member_is_probed_again():
+    recognizer = makeEnsemble([0.0, 0.0], budget_ms=20, probe_interval=3)
+    recognizer.members[1].active = False
+    recognizer.members[1].latency = 100.0
+    calls = []
+    for _ in range(6):
+        recognizer.predict(WINDOW)
+        calls.append(recognizer.members[1].recognizer.calls)
+    # probed at the third prediction, then kept as its latency is within the budget
+    assert calls == [0, 0, 1, 2, 3, 4]
+    assert recognizer.members[1].active
+    recognizer.close()
+
+
+def test_reset():
+    recognizer = makeEnsemble([0.0, 0.0], budget_ms=20)
+    recognizer.members[1].active = False
+    recognizer.members[1].latency = 100.0
+    recognizer.reset()
+    assert all(m.active and m.latency is None for m in recognizer.members)
+    recognizer.close()
+
+
+def test_failed_member_is_skipped():
+    recognizer = makeEnsemble([0.0, 0.0])
+    recognizer.members[1].recognizer.fail = True
+    np.testing.assert_allclose(recognizer.predict(WINDOW), [[1.0, 0.0]])
+    assert isinstance(recognizer.members[1].error, RuntimeError)
+    recognizer.members[1].recognizer.fail = False
+    np.testing.assert_allclose(recognizer.predict(WINDOW), [[0.5, 0.5]])
+    assert recognizer.members[1].error is None
+    recognizer.close()
+
+
+def test_every_member_failed():
+    recognizer = makeEnsemble([0.0, 0.0])
+    for member in recognizer.members:
+        member.recognizer.fail = True
+    with pytest.raises(RuntimeError):
+        recognizer.predict(WINDOW)
+    recognizer.close()
+
+
+def test_no_answer_within_the_budget_waits_for_the_first():
+    recognizer = makeEnsemble([0.03, 0.06], budget_ms=1)
+    np.testing.assert_allclose(recognizer.predict(WINDOW), [[1.0, 0.0]])
+    recognizer.close()
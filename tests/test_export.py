@@ -0,0 +1,82 @@
+import os
+import json
+import numpy as np
+import pytest
+
+import export
+
+
+def writeSample(path, value, rows=5):
+    data = {"timestamp": "0%d/01/24/10:00:00" % (1 + int(value) % 2),
+            "emg": {"frequency": 200, "data": [[value] * 8] * rows},
+            "imu": {"frequency": 50, "data": [{"gyroscope": [value] * 3, "acceleration": [value] * 3, "orientation": [value] * 4}] * rows}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def makeDataset(path, nr_samples=10):
+    for i in range(nr_samples):
+        writeSample(os.path.join(path, "AB"[i % 2], "%02d.json" % i), float(i))
+
+
+def run(dataset_path, output_path, split="random"):
+    fractions = {"train": 0.8, "test": 0.2} if split == "random" else None
+    export.export(dataset_path, output_path, "npz", split, fractions, shard_size=3, rows=8, workers=1)
+
+
+def exported(output_path):
+    with open(os.path.join(output_path, "manifest.json")) as f:
+        manifest = json.load(f)
+    sources = []
+    for name, shard in sorted(manifest["shards"].items()):
+        with np.load(os.path.join(output_path, shard["file"])) as f:
+            assert f["x"].shape[1:] == (8, 18)
+            sources.extend(f["source"].tolist())
+    return manifest, sources
+
+
+def test_export_writes_every_sample_once(tmp_path):
+    makeDataset(str(tmp_path / "Dataset"))
+    run(str(tmp_path / "Dataset"), str(tmp_path / "out"))
+    manifest, sources = exported(str(tmp_path / "out"))
+    assert sorted(sources) == ["%02d.json" % i for i in range(10)]
+    assert sum(len(members) for members in manifest["plan"].values()) == 10
+
+
+def test_resume_writes_only_the_missing_shards(tmp_path):
+    makeDataset(str(tmp_path / "Dataset"))
+    run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "letter")
+    manifest_path = str(tmp_path / "out" / "manifest.json")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    # interrupted before the last shard
+    del manifest["shards"]["B-00001"]
+    os.remove(str(tmp_path / "out" / "B-00001.npz"))
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    before = os.path.getmtime(str(tmp_path / "out" / "A-00000.npz"))
+
+    run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "letter")
+    manifest, sources = exported(str(tmp_path / "out"))
+    assert sorted(sources) == ["%02d.json" % i for i in range(10)]
+    assert os.path.getmtime(str(tmp_path / "out" / "A-00000.npz")) == before
+
+
+def test_resume_refuses_a_changed_dataset(tmp_path):
+    makeDataset(str(tmp_path / "Dataset"))
+    run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "letter")
+    writeSample(str(tmp_path / "Dataset" / "A" / "00b.json"), 20.0)
+    with pytest.raises(ValueError):
+        run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "letter")
+
+
+def test_resume_refuses_other_parameters(tmp_path):
+    makeDataset(str(tmp_path / "Dataset"))
+    run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "letter")
+    with pytest.raises(ValueError):
+        run(str(tmp_path / "Dataset"), str(tmp_path / "out"), "session")
+
+
+def test_parse_fractions():
+    assert export.parseFractions("train=0.8, test=0.2") == {"train": 0.8, "test": 0.2}
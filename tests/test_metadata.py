@@ -0,0 +1,65 @@
+import os
+import json
+import numpy as np
+
+import metadata
+
+
+def writeSample(dataset_path, file, timestamp, device=None):
+    path = os.path.join(dataset_path, file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {"timestamp": timestamp}
+    if device is not None:
+        data["device"] = device
+    data["emg"] = {"frequency": 200, "data": []}
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def makeIndex(tmp_path):
+    dataset_path = str(tmp_path / "Dataset")
+    writeSample(dataset_path, "A/1.json", "01/02/24/10:00:00", "myo1")
+    writeSample(dataset_path, "A/2.json", "02/02/24/09:00:00", "myo2")
+    writeSample(dataset_path, "B/1.json", "01/02/24/11:30:00", "myo1")
+    index = metadata.MetadataIndex(str(tmp_path / "metadata.sqlite"), dataset_path)
+    assert index.backfill() == (3, 0)
+    return index, dataset_path
+
+
+def test_query_by_gesture_date_and_device(tmp_path):
+    index, _ = makeIndex(tmp_path)
+    assert [row[0] for row in index.query(gesture="A")] == ["A/1.json", "A/2.json"]
+    assert [row[0] for row in index.query(since="2024-02-01 11:00:00")] == ["B/1.json", "A/2.json"]
+    assert [row[0] for row in index.query(until="2024-02-02")] == ["A/1.json", "B/1.json"]
+    assert [row[0] for row in index.query(device="myo2")] == ["A/2.json"]
+    assert [row[0] for row in index.query(session="2024-02-01", gesture="B")] == ["B/1.json"]
+    index.close()
+
+
+def test_backfill_removes_deleted_files(tmp_path):
+    index, dataset_path = makeIndex(tmp_path)
+    os.remove(os.path.join(dataset_path, "A", "2.json"))
+    assert index.backfill() == (0, 1)
+    assert len(index.query()) == 2
+    index.close()
+
+
+def test_rename_and_delete_gesture(tmp_path):
+    index, _ = makeIndex(tmp_path)
+    index.renameGesture("A", "C")
+    assert [row[:2] for row in index.query(gesture="C")] == [("C/1.json", "C"), ("C/2.json", "C")]
+    index.deleteGesture("C")
+    assert [row[0] for row in index.query()] == ["B/1.json"]
+    index.close()
+
+
+class Store():
+    files = ["B/1.json", "A\\1.json"]
+
+
+def test_store_indices(tmp_path):
+    index, _ = makeIndex(tmp_path)
+    index.linkStore(Store())
+    assert index.storeIndices(gesture="A").tolist() == [1]
+    assert index.storeIndices(device="myo1").tolist() == [1, 0]
+    index.close()
@@ -0,0 +1,72 @@
+import os
+import json
+import numpy as np
+
+import dataset
+import monitor
+
+
+def makeStore(path, size=50):
+    samples = np.random.default_rng(0).normal(size=(size, 40, dataset.NR_CHANNELS)).astype(np.float32)
+    np.save(os.path.join(path, 'samples.npy'), samples)
+    np.save(os.path.join(path, 'labels.npy'), np.zeros(size, dtype=np.int16))
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({"labels": ["A"], "files": ["A/%d.json" % i for i in range(size)], "timestamps": [""] * size}, f)
+    return dataset.TensorStore(path)
+
+
+def test_chunked_reference_matches_the_whole_store(tmp_path):
+    store = makeStore(str(tmp_path))
+    samples = monitor.levels(store.samples)
+    reference = monitor.computeReference(store, chunk=7)
+    np.testing.assert_allclose(reference["mean"], samples.mean(axis=(0, 1)), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(reference["var"], samples.var(axis=(0, 1)), rtol=1e-4, atol=1e-6)
+    edges = np.percentile(samples.mean(axis=1), np.arange(1, monitor.NR_BINS) * 100 / monitor.NR_BINS, axis=0).T
+    np.testing.assert_allclose(reference["edges"], edges, rtol=1e-5, atol=1e-6)
+    # with a subsample, the deciles come from the means of evenly spread windows
+    assert np.array(monitor.computeReference(store, chunk=7, max_windows=10)["edges"]).shape == edges.shape
+
+
+def test_monitors_share_the_log_file(tmp_path):
+    path = str(tmp_path / "monitor.log")
+    first = monitor.DriftMonitor(log_path=path)
+    second = monitor.DriftMonitor(log_path=path)
+    handlers = [h for h in monitor.logger.handlers if getattr(h, "baseFilename", None) == os.path.abspath(path)]
+    assert len(handlers) == 1
+    first.close(timeout=5)
+    assert handlers[0] in monitor.logger.handlers
+    second.close(timeout=5)
+    assert handlers[0] not in monitor.logger.handlers
+    assert os.path.abspath(path) not in monitor.file_handlers
+
+
+def test_worker_survives_a_bad_window():
+    drift = monitor.DriftMonitor(min_windows=1, cooldown_s=0)
+    drift.submit(np.zeros((40, 3), dtype=np.float32))
+    drift.submit(np.ones((40, dataset.NR_CHANNELS), dtype=np.float32), battery=5)
+    drift.close(timeout=5)
+    assert not drift.worker.is_alive()
+    assert drift.count == 1
+    assert any("battery" in message for message in drift.activeAlerts())
+
+
+def test_battery_is_requested_periodically():
+    requests = []
+    drift = monitor.DriftMonitor(battery_request=lambda: requests.append(1), battery_interval_s=3600)
+    for _ in range(3):
+        drift.submit(np.ones((40, dataset.NR_CHANNELS), dtype=np.float32))
+    drift.close(timeout=5)
+    assert len(requests) == 1
+    drift.battery_interval_s = 0
+    drift.requestBattery()
+    assert len(requests) == 2
+
+
+def test_amplitude_alert(tmp_path):
+    reference = monitor.computeReference(makeStore(str(tmp_path)))
+    drift = monitor.DriftMonitor(reference, min_windows=3, cooldown_s=0)
+    window = np.random.default_rng(1).normal(size=(40, dataset.NR_CHANNELS)).astype(np.float32) * 0.1
+    for _ in range(5):
+        drift.submit(window)
+    drift.close(timeout=5)
+    assert any("amplitude" in message for message in drift.activeAlerts())
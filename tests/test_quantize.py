@@ -0,0 +1,68 @@
+import gzip
+import numpy as np
+import pytest
+
+import quantize
+
+
+def test_pruning_schedule():
+    assert quantize.pruningSchedule(0, 0.8) == 0
+    assert quantize.pruningSchedule(1, 0.8) == pytest.approx(0.8)
+    assert quantize.pruningSchedule(2, 0.8) == pytest.approx(0.8)
+    steps = [quantize.pruningSchedule(p, 0.8) for p in np.linspace(0, 1, 11)]
+    assert np.all(np.diff(steps) >= 0)
+    # most of the weights are removed in the first half
+    assert quantize.pruningSchedule(0.5, 0.8) > 0.6
+
+
+class Layer():
+
+    def __init__(self, weights):
+        self.weights = weights
+
+    def get_weights(self):
+        return self.weights
+
+
+class Model():
+
+    def __init__(self, layers):
+        self.layers = layers
+
+
+def test_pruning_masks_keep_the_largest_kernel_weights():
+    kernel = np.arange(1, 11, dtype=np.float32).reshape(2, 5)
+    model = Model([Layer([kernel, np.ones(5, dtype=np.float32)]), Layer([]), Layer([np.ones(3, dtype=np.float32)])])
+    masks = quantize.pruningMasks(model, 0.5)
+    assert len(masks) == 1
+    assert masks[0][1].sum() == 5
+    np.testing.assert_array_equal(masks[0][1].reshape(-1), [0, 0, 0, 0, 0, 1, 1, 1, 1, 1])
+
+
+def test_compressed_size_sums_model_and_weight(tmp_path):
+    model = tmp_path / "model.tflite"
+    weight = tmp_path / "weight.h5"
+    model.write_bytes(bytes(10000))
+    weight.write_bytes(b"weights")
+    size = quantize.compressedSize(str(model), str(weight))
+    assert size == len(gzip.compress(bytes(10000))) + len(gzip.compress(b"weights"))
+    assert size < quantize.modelSize(str(model), str(weight))
+
+
+class Store():
+    labels = np.repeat(np.arange(2), 5)
+    files = ["A/%d.json" % i for i in range(5)] + ["B\\%d.json" % i for i in range(5)]
+
+
+def test_held_out_files(tmp_path):
+    path = tmp_path / "test.txt"
+    path.write_text("A/1.json\nB/3.json\n\n")
+    train, test, documented = quantize.heldOut(Store(), str(path))
+    assert documented
+    assert test.tolist() == [1, 8]
+    assert len(train) == 8
+    train, test, documented = quantize.heldOut(Store())
+    assert not documented
+    path.write_text("C/1.json\n")
+    with pytest.raises(ValueError):
+        quantize.heldOut(Store(), str(path))
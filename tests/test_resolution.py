@@ -0,0 +1,62 @@
+import os
+import json
+import numpy as np
+
+import dataset
+import calibration
+import resolution
+
+
+def test_downsample_keeps_slow_signals_and_removes_fast_ones():
+    t = np.arange(400) / resolution.FREQ
+    array = np.zeros((400, 18), dtype=np.float32)
+    array[:, 0] = 3.0
+    array[:, 1] = np.sin(2 * np.pi * 2 * t) # 2 Hz
+    array[:, 2] = np.sin(2 * np.pi * 90 * t) # above the Nyquist frequency of 50 Hz
+    level = resolution.transform(array, "50")
+    assert level.shape == (100, 18)
+    np.testing.assert_allclose(level[:, 0], 3.0, rtol=1e-4)
+    np.testing.assert_allclose(level[10:-10, 1], array[::4, 1][10:-10], atol=0.05)
+    assert np.abs(level[10:-10, 2]).max() < 0.05
+
+
+def test_summary_level():
+    array = np.zeros((2, 400, 18), dtype=np.float32)
+    array[:, :, 0] = np.tile([-2.0, 2.0], 200)
+    array[:, :, 10] = 5.0
+    summary = resolution.transform(array, "summary")
+    assert summary.shape == (2, 400 // resolution.SUMMARY_ROWS, 18)
+    assert np.all(summary[..., 0] == 2.0)
+    assert np.all(summary[..., 10] == 5.0)
+
+
+def makeStore(path):
+    samples = np.random.default_rng(0).normal(size=(4, 40, dataset.NR_CHANNELS)).astype(np.float32)
+    np.save(os.path.join(path, 'samples.npy'), samples)
+    np.save(os.path.join(path, 'labels.npy'), np.zeros(4, dtype=np.int16))
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({"labels": ["A"], "files": ["A/%d.json" % i for i in range(4)], "timestamps": [""] * 4}, f)
+    return dataset.TensorStore(path)
+
+
+def test_level_is_cached(tmp_path):
+    store = makeStore(str(tmp_path))
+    level = resolution.loadLevel(store, "100", chunk=3)
+    np.testing.assert_allclose(level, resolution.transform(store.samples, "100"), rtol=1e-5, atol=1e-6)
+    path = str(tmp_path / "pyramid_100.npy")
+    modified = os.path.getmtime(path)
+    resolution.loadLevel(dataset.TensorStore(str(tmp_path)), "100")
+    assert os.path.getmtime(path) == modified
+    assert resolution.loadLevel(store, "200") is store.samples
+
+
+def test_calibrated_store_has_its_own_cache(tmp_path):
+    raw = resolution.loadLevel(makeStore(str(tmp_path)), "summary")
+    store = dataset.TensorStore(str(tmp_path))
+    profile = calibration.Profile("user", scale=np.full(18, 10.0))
+    store.calibrate(profile)
+    calibrated = resolution.loadLevel(store, "summary")
+    np.testing.assert_allclose(calibrated, raw * 10, rtol=1e-4, atol=1e-5)
+    assert os.path.exists(str(tmp_path / ("pyramid_summary_calibrated_%s.npy" % profile.fingerprint())))
+    # the raw cache is still the one of the raw samples
+    np.testing.assert_array_equal(resolution.loadLevel(dataset.TensorStore(str(tmp_path)), "summary"), raw)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import saliency
+
+
+def test_block_rows_are_validated():
+    assert saliency.blockRows(200, 200, 400) == 40
+    with pytest.raises(ValueError):
+        saliency.blockRows(2, 200, 400)
+    with pytest.raises(ValueError):
+        saliency.blockRows(3000, 200, 400)
+
+
+def test_last_block_covers_the_remaining_rows():
+    assert saliency.timeBlocks(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert saliency.timeBlocks(8, 4) == [(0, 4), (4, 8)]
+
+
+def test_masks_cover_every_row():
+    masks = saliency.occlusionMasks(10, 4, grid=True)
+    nr_blocks = 3
+    assert len(masks) == 18 + nr_blocks + len(saliency.GROUPS) * nr_blocks
+    assert np.all(masks[:18].sum(axis=0) == 1)
+    assert np.all(masks[18:18 + nr_blocks].sum(axis=0) == 1)
+    assert np.all(masks[18 + nr_blocks:].sum(axis=0) == 1)
+
+
+def test_occlusion_drop_of_the_used_channel():
+    # the probability of letter 1 is the mean of channel 0, squashed
+    def predict(batch):
+        p = 1 / (1 + np.exp(-batch[:, :, 0].mean(axis=1)))
+        return np.stack((1 - p, p), axis=1)
+
+    samples = np.zeros((3, 10, 18), dtype=np.float32)
+    samples[:, :, 0] = 5.0
+    masks = saliency.occlusionMasks(10, 4, grid=False)
+    drops, probabilities = saliency.occlude(predict, samples, np.ones(3, dtype=np.int64), masks, np.zeros(18, dtype=np.float32), batch_size=8)
+    assert drops.shape == (3, len(masks))
+    assert np.all(drops[:, 0] > 0.4)
+    np.testing.assert_allclose(drops[:, 1:18], 0, atol=1e-6)
+    # the short last block weighs less than a full one
+    assert np.all(drops[:, 18] > drops[:, 20]) and np.all(drops[:, 20] > 0)
+    np.testing.assert_allclose(probabilities[:, 1], 1 / (1 + np.exp(-5.0)), rtol=1e-5)
+
+
+def test_heatmap_png(tmp_path):
+    path = str(tmp_path / "map.png")
+    saliency.writeHeatmap(path, np.array([[0.0, 1.0], [-1.0, 0.5]]), cell=2)
+    with open(path, 'rb') as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
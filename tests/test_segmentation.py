@@ -0,0 +1,82 @@
+import numpy as np
+
+import segmentation
+
+
+# sample (rows x 18) at rest, with a burst of emg activity in [start, end)
+def burst(rows=400, start=150, end=250):
+    random = np.random.default_rng(0)
+    array = np.zeros((rows, 18), dtype=np.float32)
+    array[:, :8] = random.normal(0, 1, (rows, 8))
+    array[start:end, :8] = random.normal(0, 40, (end - start, 8))
+    return array
+
+
+def test_segment_array_finds_the_burst():
+    start, end = segmentation.segmentArray(burst())
+    assert abs(start - 150) <= 10
+    assert abs(end - 250) <= 30
+
+
+def test_segment_array_without_gesture():
+    assert segmentation.segmentArray(burst(start=0, end=0)) == (0, 400)
+
+
+def test_align_window_centres_and_pads():
+    array = np.arange(100, dtype=np.float32)[:, np.newaxis]
+    window, first = segmentation.alignWindow(array, 40, 60, 20)
+    assert first == 40
+    np.testing.assert_array_equal(window[:, 0], np.arange(40, 60))
+    window, first = segmentation.alignWindow(array, 90, 100, 20)
+    assert first == 80
+    window, first = segmentation.alignWindow(array[:10], 2, 8, 20)
+    assert first == 0 and len(window) == 20
+    assert np.all(window[10:] == 9)
+
+
+def jsonSample(rows=10):
+    return {"timestamp": "01/01/24/10:00:00",
+            "emg": {"frequency": 200, "data": [[r] * 8 for r in range(rows)]},
+            "imu": {"frequency": 50,
+                    "data": [{"gyroscope": [r] * 3, "acceleration": [r] * 3, "orientation": [r] * 4} for r in range(rows)],
+                    "timestamps": [1000.0 * r for r in range(rows)],
+                    "events": {"data": [{"gyroscope": [e] * 3, "acceleration": [e] * 3, "orientation": [e] * 4} for e in range(0, rows, 2)],
+                               "timestamps": [1000.0 * e + 500 for e in range(0, rows, 2)]}},
+            "active": {"start": 3, "end": 8}}
+
+
+def test_crop_sample_is_consistent():
+    cropped = segmentation.cropSample(jsonSample(), 2, 6)
+    assert [row[0] for row in cropped["emg"]["data"]] == [2, 3, 4, 5]
+    assert [row["gyroscope"][0] for row in cropped["imu"]["data"]] == [2, 3, 4, 5]
+    assert cropped["imu"]["timestamps"] == [2000.0, 3000.0, 4000.0, 5000.0]
+    assert cropped["imu"]["events"]["timestamps"] == [2500.0, 4500.0]
+    assert [row["gyroscope"][0] for row in cropped["imu"]["events"]["data"]] == [2, 4]
+    assert cropped["active"] == {"start": 1, "end": 4}
+    assert cropped["segment"] == {"start": 2, "end": 6}
+    assert cropped["duration"] == 20
+
+
+def test_crop_sample_pads_to_length():
+    cropped = segmentation.cropSample(jsonSample(), 4, 10, 8)
+    assert [row[0] for row in cropped["emg"]["data"]] == [4, 5, 6, 7, 8, 9, 9, 9]
+    assert len(cropped["imu"]["data"]) == len(cropped["imu"]["timestamps"]) == 8
+    assert cropped["duration"] == 40
+
+
+def test_live_segmenter_window_contains_the_gesture():
+    array = burst(rows=800, start=300, end=400)
+    segmenter = segmentation.LiveSegmenter(length=400, history=200, capacity=800)
+    recorded = []
+    for row in array:
+        segmenter.update(row[:8], row[8:11])
+        # before the onset only the last "history" rows are kept, as in AutoAcquisition
+        recorded = (recorded + [row])[-segmenter.rows:] if segmenter.start is None else recorded + [row]
+        if segmenter.complete():
+            break
+    first, last, start, end = segmenter.window()
+    assert last - first == 400
+    window = np.array(recorded)[first:last]
+    active = np.abs(window[:, 0]) > 20
+    assert start <= np.argmax(active) + 10
+    assert end >= len(active) - np.argmax(active[::-1]) - 10
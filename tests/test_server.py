@@ -0,0 +1,100 @@
+import time
+import threading
+from multiprocessing.connection import Pipe
+import numpy as np
+import pytest
+
+import server
+
+
+# sums every window, so the result identifies the window
+class SumRecognizer():
+
+    def predict(self, batch):
+        return batch.sum(axis=(1, 2))[:, np.newaxis]
+
+
+class SlowRecognizer(SumRecognizer):
+
+    def predict(self, batch):
+        time.sleep(0.05)
+        return SumRecognizer.predict(self, batch)
+
+
+class FailingRecognizer():
+
+    def predict(self, batch):
+        raise RuntimeError("model failure")
+
+
+@pytest.fixture
+def service():
+    service = server.InferenceServer(SumRecognizer(), max_batch=4, max_latency_ms=1, rows=10, channels=3)
+    yield service
+    service.close()
+
+
+def test_predict(service):
+    futures = [service.submit(np.full((10, 3), i)) for i in range(6)]
+    assert [float(f.result(timeout=5)[0]) for f in futures] == [30.0 * i for i in range(6)]
+
+
+def test_wrong_shape_is_rejected_and_service_goes_on(service):
+    with pytest.raises(ValueError):
+        service.submit(np.zeros((9, 3)))
+    assert float(service.predict(np.ones((10, 3)))[0]) == 30
+
+
+def test_recognizer_error_is_set_on_every_future():
+    service = server.InferenceServer(FailingRecognizer(), max_batch=4, max_latency_ms=1, rows=10, channels=3)
+    futures = [service.submit(np.zeros((10, 3))) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert service.worker.is_alive()
+    service.close()
+
+
+def test_close_fails_the_queued_requests():
+    service = server.InferenceServer(SlowRecognizer(), max_batch=1, max_latency_ms=1, rows=10, channels=3)
+    futures = [service.submit(np.ones((10, 3))) for _ in range(5)]
+    time.sleep(0.01)
+    service.close()
+    assert all(future.done() for future in futures)
+    assert float(futures[0].result()[0]) == 30
+    with pytest.raises(RuntimeError):
+        futures[-1].result()
+    with pytest.raises(RuntimeError):
+        service.submit(np.ones((10, 3)))
+
+
+def test_max_queue_depth(service):
+    assert service.metrics()["max_queue_depth"] == 0
+    futures = [service.submit(np.ones((10, 3))) for _ in range(3)]
+    for future in futures:
+        future.result(timeout=5)
+    assert 1 <= service.metrics()["max_queue_depth"] <= 3
+
+
+# the client end of a pipe served by handleConnection, as a RecognitionClient
+def connect(service):
+    client_end, server_end = Pipe()
+    thread = threading.Thread(target=server.handleConnection, args=(service, server_end), daemon=True)
+    thread.start()
+    client = server.RecognitionClient.__new__(server.RecognitionClient)
+    client.connection = client_end
+    return client, thread
+
+
+def test_connection_replies_errors(service):
+    client, thread = connect(service)
+    with pytest.raises(ValueError):
+        client.predict(np.zeros((2, 3)))
+    client.connection.send(("unknown",))
+    with pytest.raises(ValueError):
+        client.receive()
+    assert float(client.predict(np.ones((10, 3)))[0]) == 30
+    assert client.metrics()["requests"] == 1
+    client.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
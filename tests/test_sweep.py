@@ -0,0 +1,45 @@
+import json
+import numpy as np
+
+import sweep
+
+
+def test_expand_grid():
+    configs = sweep.expandGrid({"model": "lda", "shrinkage": [0.1, 0.5], "nr_segments": [2, 4]})
+    assert len(configs) == 4
+    assert {"model": "lda", "shrinkage": 0.5, "nr_segments": 2} in configs
+    assert sweep.expandGrid([{"model": "knn"}]) == [{"model": "knn"}]
+
+
+def test_config_id_is_stable():
+    assert sweep.configId({"b": 1, "a": 2}) == sweep.configId({"a": 2, "b": 1})
+    assert sweep.configId({"name": "baseline", "a": 2}) == "baseline"
+
+
+def test_read_checkpoint_skips_blank_lines(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    assert sweep.readCheckpoint(path) == []
+    with open(path, 'w') as f:
+        f.write(json.dumps({"config": "a", "fold": "fold0", "accuracy": 0.5}) + "\n\n")
+    assert sweep.readCheckpoint(path) == [{"config": "a", "fold": "fold0", "accuracy": 0.5}]
+
+
+class Store():
+    labels = np.repeat(np.arange(3), 10)
+    timestamps = ["0%d/01/24/10:00:00" % (1 + i % 2) for i in range(30)]
+
+
+def test_folds_cover_every_sample_once():
+    folds = sweep.makeFolds(Store(), "kfold", 5, 0)
+    assert [name for name, _, _ in folds] == ["fold%d" % i for i in range(5)]
+    tests = np.concatenate([test for _, _, test in folds])
+    assert sorted(tests.tolist()) == list(range(30))
+    for _, train, test in folds:
+        assert len(np.intersect1d(train, test)) == 0
+
+
+def test_session_folds_leave_one_day_out():
+    folds = sweep.makeFolds(Store(), "session", 5, 0)
+    assert len(folds) == 2
+    for _, train, test in folds:
+        assert len(train) == len(test) == 15